@@ -0,0 +1,190 @@
+"""Throughput of parsing and writing, from single values up to whole demos.
+
+Run from the root of the repository with
+
+    python -m benchmarks.codec [demos ...] [--output results.json]
+
+Every benchmark runs on the generated demos of benchmarks.common.GENERATED
+and on the given demos.
+"""
+import argparse
+import io
+import random
+
+from pydem import bindata
+from pydem import format
+from pydem import messages
+from pydem.messages import Protocol, ProtocolVersion
+
+from benchmarks import common
+
+
+NUM_VALUES = 100000
+MIN_MESSAGES = 10000
+
+
+def bench_bindata(repeat: int) -> list[dict]:
+    rng = random.Random(0)
+    strings = b''.join(bytes(rng.choices(b'abcdefghijklmnop', k=rng.randint(0, 30))) + b'\0'
+                       for _ in range(NUM_VALUES))
+    data = bytes(rng.randrange(256) for _ in range(12 * NUM_VALUES))
+    reads = [
+        ('read_u8', data, 1, bindata.read_u8),
+        ('read_i16', data, 2, bindata.read_i16),
+        ('read_f32', data, 4, bindata.read_f32),
+        ('read_f32_n 3', data, 12, lambda stream: bindata.read_f32_n(stream, 3)),
+        ('read_c_str', strings, None, bindata.read_c_str),
+    ]
+    results = []
+    for name, buffer, size, read in reads:
+        def run():
+            stream = bindata.MemoryBuffer(buffer)
+            return [read(stream) for _ in range(NUM_VALUES)]
+        num_bytes = NUM_VALUES * size if size else len(buffer)
+        results.append(common.result(f'bindata.{name}', '-',
+                                     common.best_time(run, repeat), num_bytes,
+                                     NUM_VALUES, common.retained_blocks(run)))
+
+    values = bindata.MemoryBuffer(data)
+    floats = [bindata.read_f32(values) for _ in range(NUM_VALUES)]
+    writes = [
+        ('write_u8', data[:NUM_VALUES], 1, bindata.write_u8),
+        ('write_f32', floats, 4, bindata.write_f32),
+        ('write_c_str', strings.split(b'\0')[:NUM_VALUES], None, bindata.write_c_str),
+    ]
+    for name, values, size, write in writes:
+        def run():
+            stream = io.BytesIO()
+            for value in values:
+                write(stream, value)
+            return stream
+        num_bytes = NUM_VALUES * size if size else sum(len(v) + 1 for v in values)
+        results.append(common.result(f'bindata.{name}', '-',
+                                     common.best_time(run, repeat), num_bytes,
+                                     NUM_VALUES))
+    return results
+
+
+def decoded_blocks(data: bytes) -> list[format.Block]:
+    demo = format.Demo.parse(bindata.MemoryBuffer(data))
+    for block in demo.blocks:
+        block._get_messages()
+    return demo.blocks
+
+
+def message_samples(blocks: list[format.Block]) -> dict:
+    # every message with its bytes, by type and by the protocol that it is
+    # parsed with
+    samples = {}
+    protocol = Protocol(ProtocolVersion.NETQUAKE)
+    for block in blocks:
+        for message in block.messages:
+            state = (protocol.version, protocol.flags)
+            stream = io.BytesIO()
+            message.write(stream, protocol)
+            samples.setdefault((type(message), state), []).append(
+                (message, stream.getvalue()))
+    return samples
+
+
+def bench_messages(label: str, blocks: list[format.Block], repeat: int) -> list[dict]:
+    results = []
+    for (message_type, state), samples in sorted(
+            message_samples(blocks).items(), key=lambda item: item[0][0].__name__):
+        # rare types are repeated, so that they take long enough to measure
+        rounds = max(1, MIN_MESSAGES // len(samples))
+        data = b''.join(encoded for _, encoded in samples) * rounds
+        sample_messages = [message for message, _ in samples] * rounds
+        # the same type may be parsed with different protocols in one demo
+        name = f'{message_type.__name__} {state[0]}/{state[1]}'
+
+        def parse():
+            protocol = Protocol(*state)
+            stream = bindata.MemoryBuffer(data)
+            return [messages.parse_message(stream, protocol) for _ in sample_messages]
+        results.append(common.result(
+            f'parse_message {name}', label, common.best_time(parse, repeat),
+            len(data), len(sample_messages), common.retained_blocks(parse)))
+
+        def write():
+            protocol = Protocol(*state)
+            stream = io.BytesIO()
+            for message in sample_messages:
+                message.write(stream, protocol)
+            return stream
+        results.append(common.result(
+            f'write {name}', label, common.best_time(write, repeat),
+            len(data), len(sample_messages)))
+    return results
+
+
+def bench_demo(label: str, data: bytes, blocks: list[format.Block],
+               repeat: int) -> list[dict]:
+    num_bytes = len(data)
+    num_messages = sum(len(block.messages) for block in blocks)
+    results = []
+
+    def demo_parse():
+        return format.Demo.parse(bindata.MemoryBuffer(data))
+
+    def demo_decode():
+        return decoded_blocks(data)
+
+    def block_parse():
+        stream = bindata.MemoryBuffer(data)
+        format.CdTrack.parse(stream)
+        protocol = Protocol(ProtocolVersion.NETQUAKE)
+        parsed = []
+        while stream.tell() < num_bytes:
+            parsed.append(format.Block.parse(stream, protocol))
+        return parsed
+
+    for name, parse in (('Demo.parse', demo_parse),
+                        ('Demo.parse + decode', demo_decode),
+                        ('Block.parse', block_parse)):
+        results.append(common.result(name, label, common.best_time(parse, repeat),
+                                     num_bytes, num_messages,
+                                     common.retained_blocks(parse)))
+
+    cdtrack = format.CdTrack.parse(bindata.MemoryBuffer(data))
+    copied = format.Demo.parse(bindata.MemoryBuffer(data))
+    # blocks without their source are encoded message by message
+    encoded = [format.Block(block.viewangles, list(block.messages)) for block in blocks]
+
+    def demo_write_copy():
+        copied.write(io.BytesIO())
+
+    def demo_write_encode():
+        format.Demo(cdtrack, encoded).write(io.BytesIO())
+
+    def block_write():
+        stream = io.BytesIO()
+        protocol = Protocol(ProtocolVersion.NETQUAKE)
+        for block in encoded:
+            block.write(stream, protocol)
+
+    for name, write in (('Demo.write copy', demo_write_copy),
+                        ('Demo.write encode', demo_write_encode),
+                        ('Block.write', block_write)):
+        results.append(common.result(name, label, common.best_time(write, repeat),
+                                     num_bytes, num_messages))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing and writing.")
+    common.add_input_arguments(parser)
+    common.add_result_arguments(parser, repeat=3)
+    args = parser.parse_args()
+
+    results = bench_bindata(args.repeat)
+    for label, data in common.load_inputs(args.demos, not args.no_generated):
+        blocks = decoded_blocks(data)
+        results += bench_demo(label, data, blocks, args.repeat)
+        results += bench_messages(label, blocks, args.repeat)
+    common.print_results(results)
+    common.finish(parser, args, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import gc
+import io
+import json
+import platform
+import sys
+import time
+
+from pydem import cache
+from pydem import synth
+from pydem.messages import Protocol, ProtocolFlags, ProtocolVersion
+
+
+# generated inputs by label, as (protocol, duration, entities, players)
+GENERATED = {
+    'synth-netquake': (Protocol(ProtocolVersion.NETQUAKE), 60.0, 32, 1),
+    'synth-rmq-24bit': (Protocol(ProtocolVersion.RMQ, ProtocolFlags.PRFL_24BITCOORD |
+                                 ProtocolFlags.PRFL_SHORTANGLE), 60.0, 32, 1),
+}
+
+# shorter benchmarks vary too much from run to run to be compared
+MIN_COMPARED_SECONDS = 0.005
+
+
+def generated_demo(protocol: Protocol, duration: float, num_entities: int,
+                   num_players: int) -> bytes:
+    stream = io.BytesIO()
+    synth.generate(protocol, duration, num_entities, num_players).write(stream)
+    return stream.getvalue()
+
+
+def load_inputs(paths: list[str], generated: bool) -> list[tuple[str, bytes]]:
+    inputs = []
+    if generated:
+        for label, parameters in GENERATED.items():
+            inputs.append((label, generated_demo(*parameters)))
+    for path in paths:
+        with open(path, 'rb') as f:
+            inputs.append((path, f.read()))
+    return inputs
+
+
+def best_time(function, repeat: int) -> float:
+    # the minimum is the least disturbed by anything else on the machine
+    times = []
+    for _ in range(repeat):
+        # garbage of earlier runs is not collected at the expense of this one
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def retained_blocks(function) -> int:
+    # number of memory blocks that are still allocated for the result of the
+    # function, which is what parsed messages cost as long as they are kept
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        before = sys.getallocatedblocks()
+        result = function()
+        allocated = sys.getallocatedblocks() - before
+        del result
+    finally:
+        if enabled:
+            gc.enable()
+    return allocated
+
+
+def result(name: str, label: str, seconds: float, num_bytes: int = None,
+           num_messages: int = None, retained: int = None) -> dict:
+    return {
+        'name': name,
+        'input': label,
+        'seconds': seconds,
+        'bytes': num_bytes,
+        'messages': num_messages,
+        'mb_per_s': None if num_bytes is None else num_bytes / seconds / 1e6,
+        'messages_per_s': None if num_messages is None else num_messages / seconds,
+        # memory blocks still held by the result, not every allocation made
+        # on the way, which are freed again before this can count them
+        'retained_blocks_per_message': (None if retained is None or not num_messages
+                                        else retained / num_messages),
+    }
+
+
+def print_results(results: list[dict], columns=('mb_per_s', 'messages_per_s',
+                                                'retained_blocks_per_message')):
+    print(f"{'benchmark':<48} {'input':<20} {'seconds':>10}" +
+          ''.join(f" {c:>27}" for c in columns))
+    for r in results:
+        values = ''.join(' ' * 28 if r.get(c) is None else f" {r[c]:>27.2f}"
+                         for c in columns)
+        print(f"{r['name']:<48} {r['input'][-20:]:<20} {r['seconds']:>10.4f}{values}")
+
+
+def write_results(path, results: list[dict], **extra):
+    with open(path, 'w') as f:
+        json.dump({'python': sys.version,
+                   'platform': platform.platform(),
+                   'code_version': cache.code_version(),
+                   'results': results, **extra}, f, indent=1)
+
+
+def compare(path, results: list[dict], threshold: float) -> list[str]:
+    """Regressions of results against the results written to path before."""
+    with open(path) as f:
+        baseline = {(r['name'], r['input']): r for r in json.load(f)['results']}
+    regressions = []
+    for r in results:
+        old = baseline.get((r['name'], r['input']))
+        if old is None or old['seconds'] < MIN_COMPARED_SECONDS:
+            continue
+        if r['seconds'] > old['seconds'] * (1.0 + threshold):
+            regressions.append(f"{r['name']} on {r['input']}: {r['seconds']:.4f}s, "
+                               f"was {old['seconds']:.4f}s")
+    return regressions
+
+
+def add_input_arguments(parser):
+    parser.add_argument('demos', type=str, nargs='*',
+        help="Demos to run the benchmarks on, besides the generated ones.")
+    parser.add_argument('--no_generated', action='store_true',
+        help="Only run the benchmarks on the given demos.")
+
+
+def add_result_arguments(parser, repeat: int):
+    parser.add_argument('--repeat', type=int, default=repeat,
+        help="Number of runs of each benchmark, the fastest one is reported.")
+    parser.add_argument('--output', type=str,
+        help="Write the results as JSON to this path.")
+    parser.add_argument('--compare', type=str,
+        help="Results written with --output before. Exits with status 1 if "
+             "any benchmark got slower by more than --threshold.")
+    parser.add_argument('--threshold', type=float, default=0.2,
+        help="Relative slowdown that counts as regression.")
+
+
+def finish(parser, args, results: list[dict], **extra):
+    if args.output:
+        write_results(args.output, results, **extra)
+    if args.compare:
+        regressions = compare(args.compare, results, args.threshold)
+        if regressions:
+            parser.exit(1, "Regressions:\n" + '\n'.join(regressions) + '\n')
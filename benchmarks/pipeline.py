@@ -0,0 +1,158 @@
+"""Scaling of the operations of the command line with demo length and players.
+
+Run from the root of the repository with
+
+    python -m benchmarks.pipeline [--durations 10 20 40] [--players 1 2 4]
+
+Each operation runs through pydem.cli.run on coop sets of generated demos,
+two levels recorded by each player, for every combination of duration and
+number of players. Time and peak memory are reported for each run, together
+with the exponent of the growth of the time with the duration and with the
+number of players, which is about 1 for operations that scale linearly.
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import tempfile
+import tracemalloc
+
+import numpy
+from matplotlib import pyplot
+
+from pydem import cli
+from pydem import synth
+
+from benchmarks import common
+
+
+NUM_LEVELS = 2
+
+SCENARIOS = {
+    'stream': [],
+    'stats': ['--stats'],
+    'merge': ['--merge'],
+    'spawnparams': ['--spawnparams'],
+    'smooth_viewangles': ['--smooth_viewangles'],
+    'remove_pauses': ['--remove_pauses'],
+    'fix_intermission_lag': ['--fix_intermission_lag'],
+    'fix_intermission_transition': ['--fix_intermission_transition'],
+    'instant_skin_color': ['--instant_skin_color'],
+    'remove_grenade_counter': ['--remove_grenade_counter'],
+    'remove_prints': ['--remove_prints', 'bitten'],
+    'remove_sounds': ['--remove_sounds', 'pain'],
+    'replace_sound': ['--replace_sound', 'misc/talk.wav', 'weapons/guncock.wav'],
+    'replace_weaponmodel': ['--replace_weaponmodel', 'progs/v_shot.mdl', 'progs/player.mdl'],
+    'add_runes': ['--add_runes', '1'],
+    'fade': ['--fadein', '1', '--fadeout', '1'],
+}
+
+
+def write_set(directory, duration: float, num_players: int) -> list[str]:
+    """Write the demos of a coop set and return its command line arguments."""
+    paths = [[os.path.join(directory, f'level{level}_player{player}.dem')
+              for level in range(NUM_LEVELS)] for player in range(num_players)]
+    for player, player_paths in enumerate(paths):
+        for level, path in enumerate(player_paths):
+            demo = synth.generate(duration=duration, num_players=num_players,
+                                  player=player, seed=level)
+            with open(path, 'wb') as f:
+                demo.write(f)
+    argv = list(paths[0])
+    for player_paths in paths[1:]:
+        argv += ['--coop'] + player_paths
+    return argv
+
+
+def run_operation(argv: list[str]):
+    args = cli.make_parser().parse_args(argv)
+    # operations print their progress, which is of no interest here
+    with contextlib.redirect_stdout(io.StringIO()):
+        cli.run(args)
+    # smoothing plots its results, which would pile up otherwise
+    pyplot.close('all')
+
+
+def peak_memory(argv: list[str]) -> int:
+    tracemalloc.start()
+    try:
+        run_operation(argv)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def scaling_exponent(sizes: list[float], seconds: list[float]) -> float:
+    # slope of the fit of a line through the timings on a log-log scale
+    if len(set(sizes)) < 2:
+        return math.nan
+    return float(numpy.polyfit(numpy.log(sizes), numpy.log(seconds), 1)[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scaling of operations.")
+    parser.add_argument('--durations', type=float, nargs='+', default=[10.0, 20.0, 40.0],
+        help="Durations of the generated demos in seconds.")
+    parser.add_argument('--players', type=int, nargs='+', default=[1, 2, 4],
+        help="Numbers of players of the generated coop sets.")
+    parser.add_argument('--scenario', type=str, action='append', choices=SCENARIOS,
+        help="Only run these operations, all by default.")
+    parser.add_argument('--no_memory', action='store_true',
+        help="Do not measure peak memory, which needs another slower run.")
+    common.add_result_arguments(parser, repeat=1)
+    parser.add_argument('--max_exponent', type=float, default=1.2,
+        help="Scaling exponent above which an operation is reported as "
+             "super-linear.")
+    args = parser.parse_args()
+
+    scenarios = args.scenario or list(SCENARIOS)
+    durations = sorted(args.durations)
+    players = sorted(args.players)
+    results = []
+    scaling = []
+    with tempfile.TemporaryDirectory() as directory:
+        sets = {}
+        for num_players in players:
+            for duration in durations:
+                set_directory = os.path.join(directory, f'{num_players}p_{duration:g}s')
+                os.makedirs(set_directory)
+                argv = write_set(set_directory, duration, num_players)
+                num_bytes = sum(os.path.getsize(p) for p in argv if p.endswith('.dem'))
+                sets[num_players, duration] = argv, num_bytes
+
+        for scenario in scenarios:
+            # the first run also pays for imports and caches of the process
+            run_operation(sets[players[0], durations[0]][0] + SCENARIOS[scenario])
+            seconds = {}
+            for num_players in players:
+                for duration in durations:
+                    argv, num_bytes = sets[num_players, duration]
+                    argv = argv + SCENARIOS[scenario]
+                    elapsed = common.best_time(lambda: run_operation(argv), args.repeat)
+                    seconds[num_players, duration] = elapsed
+                    r = common.result(f'{scenario} {num_players}p {duration:g}s',
+                                      'synth', elapsed, num_bytes)
+                    r['peak_mib'] = None if args.no_memory else peak_memory(argv) / (1 << 20)
+                    results.append(r)
+            for num_players in players:
+                scaling.append({'name': scenario, 'players': num_players, 'duration': None,
+                                'exponent': scaling_exponent(
+                                    durations, [seconds[num_players, d] for d in durations])})
+            scaling.append({'name': scenario, 'players': None, 'duration': durations[-1],
+                            'exponent': scaling_exponent(
+                                players, [seconds[p, durations[-1]] for p in players])})
+
+    common.print_results(results, columns=('mb_per_s', 'peak_mib'))
+    print()
+    print(f"{'operation':<32} {'growth with':<24} {'exponent':>10}")
+    for s in scaling:
+        over = (f"duration, {s['players']}p" if s['duration'] is None else
+                f"players, {s['duration']:g}s")
+        flag = '  super-linear' if s['exponent'] > args.max_exponent else ''
+        print(f"{s['name']:<32} {over:<24} {s['exponent']:>10.2f}{flag}")
+    common.finish(parser, args, results, scaling=scaling)
+
+
+if __name__ == '__main__':
+    main()
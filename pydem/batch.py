@@ -0,0 +1,160 @@
+import concurrent.futures
+import csv
+import hashlib
+import json
+import os
+import shlex
+
+from . import profiling
+
+
+def read_manifest(path) -> list[list[str]]:
+    """Read the command line arguments for each set of demos in a manifest.
+
+    A JSON manifest is a list of objects, a CSV manifest has a row for each
+    set. Both have the fields "demos" with the paths of the demos, "coop" with
+    the paths of the demos of each further player and "options" with further
+    arguments. In CSV, paths and options are separated by spaces and players
+    by ';'. Relative paths are relative to the manifest.
+    """
+    with open(path, newline='') as f:
+        if os.path.splitext(path)[-1].lower() == '.csv':
+            entries = [{'demos': shlex.split(row['demos']),
+                        'coop': [shlex.split(player)
+                                 for player in (row.get('coop') or '').split(';')
+                                 if player.strip()],
+                        'options': row.get('options') or ''}
+                       for row in csv.DictReader(f)]
+        else:
+            entries = json.load(f)
+
+    base = os.path.dirname(path)
+    sets = []
+    for i, entry in enumerate(entries):
+        if not entry.get('demos'):
+            raise ValueError(f"Set {i} of manifest {path} has no demos")
+        argv = [os.path.join(base, p) for p in entry['demos']]
+        for player in entry.get('coop', []):
+            argv += ['--coop'] + [os.path.join(base, p) for p in player]
+        options = entry.get('options', [])
+        argv += shlex.split(options) if isinstance(options, str) else options
+        sets.append(argv)
+    return sets
+
+
+def content_hash(path) -> str:
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        # snapshots are directories of columns
+        for name in sorted(os.listdir(path)):
+            digest.update(name.encode())
+            digest.update(content_hash(os.path.join(path, name)).encode())
+        return digest.hexdigest()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def set_key(args) -> str:
+    """Identify a set by the paths and contents of its demos and its options."""
+    inputs = [[(os.path.abspath(path), content_hash(path)) for path in paths]
+              for paths in [args.demos] + args.coop_demos]
+    # options that do not change the outputs
+    ignored = ('demos', 'coop_demos', 'jobs', 'batch', 'journal', 'cache',
+               'cache_size', 'profile', 'report')
+    options = {name: value for name, value in sorted(vars(args).items())
+               if name not in ignored}
+    return hashlib.sha256(json.dumps([inputs, options]).encode()).hexdigest()
+
+
+class Journal:
+    """Append-only record of the sets that were processed.
+
+    Sets that failed are recorded with their error, they are not done and are
+    processed again by the next run.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.outputs = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # last line may be cut off by an interrupted run
+                        continue
+                    if 'outputs' in entry:
+                        self.outputs[entry['key']] = entry['outputs']
+
+    def is_done(self, key) -> bool:
+        outputs = self.outputs.get(key)
+        return outputs is not None and all(os.path.exists(p) for p in outputs)
+
+    def _append(self, entry: dict):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def record(self, key, outputs: list[str]):
+        self._append({'key': key, 'outputs': outputs})
+        self.outputs[key] = outputs
+
+    def record_failure(self, key, argv: list[str], error: str):
+        # the key is None if the set could not even be identified
+        self._append({'key': key, 'argv': argv, 'error': error})
+
+
+def iter_results(jobs, run, sets):
+    # (key, args, outputs or the exception raised) in order of completion
+    if jobs == 1:
+        for key, args in sets:
+            try:
+                yield key, args, run(args)
+            except Exception as e:
+                yield key, args, e
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(profiling.in_worker(run), args): (key, args)
+                   for key, args in sets}
+        for future in concurrent.futures.as_completed(futures):
+            key, args = futures[future]
+            try:
+                yield key, args, profiling.worker_result(future.result())
+            except Exception as e:
+                yield key, args, e
+
+
+def run_batch(manifest_path, journal_path, jobs, parse_args, run) -> int:
+    """Run all sets of a manifest that are not done yet, return number failed."""
+    journal = Journal(journal_path)
+    num_failed = 0
+    manifest = read_manifest(manifest_path)
+    pending = []
+    for argv in manifest:
+        key = None
+        try:
+            args = parse_args(argv)
+            key = set_key(args)
+        except (Exception, SystemExit) as e:
+            # a missing demo or bad options only fail this set. the parser
+            # exits on errors, after printing them
+            num_failed += 1
+            print(f"Failed to read set {shlex.join(argv)}: {e!r}")
+            journal.record_failure(key, argv, repr(e))
+            continue
+        if not journal.is_done(key):
+            pending.append((key, args, argv))
+    print(f"Processing {len(pending)} sets, skipping "
+          f"{len(manifest) - len(pending) - num_failed} already done")
+
+    argv_by_key = {key: argv for key, _, argv in pending}
+    for key, args, result in iter_results(
+            jobs, run, [(key, args) for key, args, _ in pending]):
+        if isinstance(result, Exception):
+            num_failed += 1
+            print(f"Failed to process {', '.join(args.demos)}: {result!r}")
+            journal.record_failure(key, argv_by_key[key], repr(result))
+        else:
+            journal.record(key, result)
+    return num_failed
@@ -1,16 +1,122 @@
+import functools
+import mmap
+import re
 import struct
 
+
+def codec(format: str) -> struct.Struct:
+    # demos are little endian and packed, so never use native alignment
+    return struct.Struct('<' + format)
+
+U8 = codec('B')
+I8 = codec('b')
+U16 = codec('H')
+I16 = codec('h')
+U32 = codec('I')
+I32 = codec('i')
+F32 = codec('f')
+
+@functools.lru_cache(maxsize=None)
+def codec_n(format: str, n: int) -> struct.Struct:
+    return codec(format * n)
+
+
+@functools.lru_cache(maxsize=None)
+def _delimiter_pattern(delimiter: bytes) -> re.Pattern:
+    return re.compile(re.escape(delimiter))
+
+
+class MemoryBuffer:
+    """Read-only stream over a buffer that decodes in place.
+
+    Reads return memoryview slices of the underlying buffer instead of copies,
+    and fixed layouts are unpacked directly at the current offset.
+    """
+    def __init__(self, buffer, start=0, end=None):
+        # the original object is kept around for its C-level find(), other
+        # buffers like memoryviews are searched in place as well
+        self.__data = buffer
+        self.__buffer = memoryview(buffer).cast('B')
+        self.length = len(self.__buffer) if end is None else end
+        self.pos = start
+
+    @property
+    def data(self):
+        return self.__data
+
+    @staticmethod
+    def from_file(f):
+        try:
+            return MemoryBuffer(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (ValueError, OSError):
+            # empty files and special files cannot be mapped
+            return MemoryBuffer(f.read())
+
+    def read(self, num=None):
+        if self.pos < 0 or self.pos > self.length:
+            raise IndexError("Read position out of bounds!")
+        if num is None:
+            num = self.length - self.pos
+        elif num < 0:
+            raise IndexError("Amount to read has to be positive!")
+        elif self.pos + num > self.length:
+            if self.pos == self.length:
+                return b''
+            raise IndexError("Can't read that many bytes!")
+        ret = self.__buffer[self.pos:self.pos+num]
+        self.pos += num
+        return ret
+
+    def read_until(self, delimiter: bytes, max_len=None) -> bytes:
+        end = self.length if max_len is None else min(self.pos + max_len, self.length)
+        if hasattr(self.__data, 'find'):
+            index = self.__data.find(delimiter, self.pos, end)
+        else:
+            match = _delimiter_pattern(delimiter).search(self.__buffer, self.pos, end)
+            index = -1 if match is None else match.start()
+        if index < 0:
+            raise ValueError('error reading!')
+        ret = bytes(self.__buffer[self.pos:index])
+        self.pos = index + len(delimiter)
+        return ret
+
+    def unpack(self, codec: struct.Struct) -> tuple:
+        if self.pos < 0 or self.pos + codec.size > self.length:
+            raise IndexError("Can't read that many bytes!")
+        values = codec.unpack_from(self.__buffer, self.pos)
+        self.pos += codec.size
+        return values
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, from_what=0):
+        if from_what == 0:
+            self.pos = offset
+        elif from_what == 1:
+            self.pos += offset
+        elif from_what == 2:
+            self.pos = self.length - offset
+
+
+# number of bytes that read_until reads at once from streams other than
+# MemoryBuffer, which is enough for the strings in demos
+READ_UNTIL_CHUNK = 256
+
+
 def read_bytes(stream, num) -> bytes:
     data = stream.read(num)
     if len(data) != num:
         raise ValueError('error reading!')
     return data
 
-def unpack_bytes(format, bytes):
-    value = struct.unpack(format, bytes)
-    if len(value) != 1:
-        raise ValueError('error unpacking!')
-    return value[0]
+def read_struct(stream, codec: struct.Struct) -> tuple:
+    if isinstance(stream, MemoryBuffer):
+        return stream.unpack(codec)
+    return codec.unpack(read_bytes(stream, codec.size))
+
+def write_struct(stream, codec: struct.Struct, *values):
+    stream.write(codec.pack(*values))
 
 def write_str(stream, value: bytes):
     stream.write(value)
@@ -18,73 +124,97 @@ def write_str(stream, value: bytes):
 def read_char(stream) -> bytes:
     return read_bytes(stream, 1)
 
+def read_until(stream, delimiter: bytes, max_len=None) -> bytes:
+    # returns everything before the delimiter and skips the delimiter itself
+    if isinstance(stream, MemoryBuffer):
+        return stream.read_until(delimiter, max_len)
+    if not stream.seekable():
+        return _read_until_bytewise(stream, delimiter, max_len)
+    # read ahead in chunks and seek back to right after the delimiter
+    ret = bytearray()
+    while max_len is None or len(ret) < max_len:
+        num = READ_UNTIL_CHUNK if max_len is None else min(READ_UNTIL_CHUNK, max_len - len(ret))
+        chunk = stream.read(num)
+        if not chunk:
+            break
+        # the delimiter may start in the previous chunk
+        searched = max(0, len(ret) - len(delimiter) + 1)
+        ret += chunk
+        index = ret.find(delimiter, searched)
+        if index >= 0:
+            stream.seek(index + len(delimiter) - len(ret), 1)
+            return bytes(ret[:index])
+    raise ValueError('error reading!')
+
+def _read_until_bytewise(stream, delimiter: bytes, max_len=None) -> bytes:
+    # for streams that cannot go back to the end of the delimiter
+    ret = bytearray()
+    while max_len is None or len(ret) < max_len:
+        ret += read_char(stream)
+        if ret.endswith(delimiter):
+            return bytes(ret[:-len(delimiter)])
+    raise ValueError('error reading!')
+
 def read_c_str(stream) -> bytes:
-    ret = b''
-    character = read_char(stream)
-    while character != b'\0':
-        ret += character
-        character = read_char(stream)
-    return ret
+    return read_until(stream, b'\0')
 
 def write_c_str(stream, value: bytes):
     write_str(stream, value)
     stream.write(b'\0')
 
 def write_f32(stream, value: float):
-    stream.write(struct.pack('f', value))
+    stream.write(F32.pack(value))
 
 def write_f32_n(stream, values: list[float]):
-    for value in values:
-        stream.write(struct.pack('f', value))
+    stream.write(codec_n('f', len(values)).pack(*values))
 
 def read_f32(stream) -> float:
-    return unpack_bytes('f', read_bytes(stream, 4))
+    return read_struct(stream, F32)[0]
 
 def read_f32_n(stream, n: int) -> list[float]:
-    return [read_f32(stream) for _ in range(n)]
+    return list(read_struct(stream, codec_n('f', n)))
 
 def read_i8(stream) -> int:
-    return unpack_bytes('b', read_bytes(stream, 1))
+    return read_struct(stream, I8)[0]
 
 def write_i8(stream, value: int):
-    stream.write(struct.pack('b', value))
+    stream.write(I8.pack(value))
 
 def write_i8_n(stream, values: list[int]):
-    for value in values:
-        write_i8(stream, value)
+    stream.write(codec_n('b', len(values)).pack(*values))
 
 def read_i8_n(stream, n: int) -> list[int]:
-    return [read_i8(stream) for _ in range(n)]
+    return list(read_struct(stream, codec_n('b', n)))
 
 def read_u8(stream) -> int:
-    return unpack_bytes('B', read_bytes(stream, 1))
+    return read_struct(stream, U8)[0]
 
 def write_u8(stream, value: int):
-    stream.write(struct.pack('B', value))
+    stream.write(U8.pack(value))
 
 def read_i16(stream) -> int:
-    return unpack_bytes('h', read_bytes(stream, 2))
+    return read_struct(stream, I16)[0]
 
 def write_i16(stream, value: int):
-    stream.write(struct.pack('h', value))
+    stream.write(I16.pack(value))
 
 def read_u16(stream) -> int:
-    return unpack_bytes('H', read_bytes(stream, 2))
+    return read_struct(stream, U16)[0]
 
 def write_u16(stream, value: int):
-    stream.write(struct.pack('H', value))
+    stream.write(U16.pack(value))
 
 def read_i32(stream) -> int:
-    return unpack_bytes('i', read_bytes(stream, 4))
+    return read_struct(stream, I32)[0]
 
 def write_i32(stream, value: int):
-    stream.write(struct.pack('i', value))
+    stream.write(I32.pack(value))
 
 def read_u32(stream) -> int:
-    return unpack_bytes('I', read_bytes(stream, 4))
+    return read_struct(stream, U32)[0]
 
 def write_u32(stream, value: int):
-    stream.write(struct.pack('I', value))
+    stream.write(U32.pack(value))
 
 def write_bytes(stream, data: bytes):
     stream.write(data)
@@ -0,0 +1,150 @@
+import contextlib
+import functools
+import gc
+import hashlib
+import os
+import shutil
+import tempfile
+
+from . import bindata
+from . import format
+from . import snapshot
+
+
+DEFAULT_MAX_SIZE = 1 << 30
+
+
+@functools.cache
+def code_version() -> str:
+    # the data derived from messages that is stored with demos may change with
+    # any change of the sources, so every change makes for a new version
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.py'):
+            with open(os.path.join(directory, name), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+@contextlib.contextmanager
+def _no_gc():
+    # decoding and loading a demo creates lots of objects and no garbage, so
+    # collections while doing that are just wasted time
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _size(path: str) -> int:
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    size = 0
+    for entry in os.scandir(path):
+        with contextlib.suppress(FileNotFoundError):
+            size += entry.stat().st_size
+    return size
+
+
+def _remove(path: str):
+    # entries of older versions are files instead of directories
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        with contextlib.suppress(OSError):
+            os.remove(path)
+
+
+class DemoCache:
+    """Parsed demos on disk, keyed by the content of the demo file.
+
+    Demos are stored as snapshots, which are loaded much faster than demos are
+    parsed and have the data derived from their messages without decoding
+    them. The least recently used demos are removed once the total size is
+    larger than max_size bytes.
+
+    Snapshots are only arrays that are loaded without unpickling, so entries
+    cannot run code. They are not checked against the demo files they were
+    stored for though, so anyone who can write to the directory can change
+    the demos that are read through the cache. It has to be trusted as much
+    as the demo files.
+    """
+    def __init__(self, directory, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        # the size may have been exceeded with a larger maximum before
+        self.evict()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.demo')
+
+    def parse(self, stream: bindata.MemoryBuffer) -> format.Demo:
+        digest = hashlib.sha256(stream.data)
+        digest.update(code_version().encode())
+        digest.update(str(snapshot.VERSION).encode())
+        key = digest.hexdigest()
+        demo = self.load(key)
+        if demo is None:
+            demo = format.Demo.parse(stream)
+            self.store(key, demo)
+        return demo
+
+    def load(self, key: str):
+        path = self.path(key)
+        if not snapshot.is_snapshot(path):
+            return None
+        try:
+            with _no_gc():
+                demo = snapshot.load(path)
+            # marks the entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            # removed by another process in the meantime
+            return None
+        except Exception:
+            # entry that is corrupt or was not written completely. parse again
+            _remove(path)
+            return None
+        self.evict()
+        return demo
+
+    def store(self, key: str, demo: format.Demo):
+        # written completely before it replaces the entry, so that entries
+        # are never loaded partially
+        directory = tempfile.mkdtemp(dir=self.directory, suffix='.tmp')
+        try:
+            with _no_gc():
+                snapshot.save(directory, demo)
+            path = self.path(key)
+            _remove(path)
+            try:
+                os.replace(directory, path)
+            except OSError:
+                # stored by another process in the meantime, which is the same
+                if not snapshot.is_snapshot(path):
+                    raise
+                _remove(directory)
+        except BaseException:
+            # e.g. a full disk, which must not leave partial files behind
+            _remove(directory)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.demo'):
+                with contextlib.suppress(FileNotFoundError):
+                    entries.append((entry.stat().st_mtime, _size(entry.path),
+                                    entry.path))
+        size = sum(size for _, size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            _remove(path)
+            size -= entry_size
@@ -5,17 +5,13 @@ import numpy
 from . import messages
 
 
-def get_time_messages(block):
-    return [m for m in block.messages if isinstance(m, messages.TimeMessage)]
-
-
 def fade(demo, time_start, duration, backwards):
+    time = demo.get_time()
     time_previous = None
-    for b in (reversed(demo.blocks) if backwards else demo.blocks):
-        time_messages = get_time_messages(b)
-        if not time_messages:
-            continue
-        time_current = numpy.average([m.time for m in time_messages])
+    block_indices = demo.find_blocks(messages.TimeMessage)
+    for i in (reversed(block_indices) if backwards else block_indices):
+        b = demo.blocks[i]
+        time_current = time[i]
         if time_current == time_previous:
             # do not repeat cshift command if same time
             continue
@@ -28,19 +24,18 @@ def fade(demo, time_start, duration, backwards):
         time_previous = time_current
 
 
+def get_distinct_times(demo):
+    # sorted times of the blocks with time messages, without repetitions
+    return numpy.unique(demo.get_time()[demo.find_blocks(messages.TimeMessage)])
+
+
 def fadein(demo, duration):
-    time_messages = [m for b in demo.blocks for m in get_time_messages(b)]
-    time_smallest = min(m.time for m in time_messages)
-    time_second_smallest = min(m.time for m in time_messages if m.time > time_smallest)
-    time_start = time_second_smallest
+    time_start = get_distinct_times(demo)[1]
     fade(demo, time_start, duration, backwards=False)
 
 
 def fadeout(demo, duration):
-    time_messages = [m for b in demo.blocks for m in get_time_messages(b)]
-    time_largest = max(m.time for m in time_messages)
-    time_second_largest = max(m.time for m in time_messages if m.time < time_largest)
-    time_end = time_second_largest
+    time_end = get_distinct_times(demo)[-2]
     fade(demo, time_end, duration, backwards=True)
     # turn off blackscreen at the very end again, so that playing normal demos
     # afterwards isn't showing a blackscreen throughout. Put it as the first
@@ -48,13 +43,22 @@ def fadeout(demo, duration):
     demo.blocks[-1].messages.insert(0, messages.StuffTextMessage(f"v_cshift 0 0 0 0\n".encode()))
 
 
+def remove_fades_from_block(block):
+    stufftext_messages = list(block.iter_messages(messages.StuffTextMessage))
+    for m in stufftext_messages:
+        if re.match(b"v_cshift 0 0 0 [0-9]+\n", m.text):
+            block.messages.remove(m)
+
+
 def remove_fades(demo):
     for block in demo.blocks:
-        stufftext_messages = [m for m in block.messages
-                              if isinstance(m, messages.StuffTextMessage)]
-        for m in stufftext_messages:
-            if re.match(b"v_cshift 0 0 0 [0-9]+\n", m.text):
-                block.messages.remove(m)
+        remove_fades_from_block(block)
+
+
+def iter_remove_fades(blocks):
+    for block in blocks:
+        remove_fades_from_block(block)
+        yield block
 
 
 def merge_pair(demo, demo_other):
@@ -72,10 +76,9 @@ def merge_pair(demo, demo_other):
             # everything else should line up.
             continue
 
-        ent_msgs = [m for m in demo.blocks[i].messages
-                    if isinstance(m, messages.EntityUpdateMessage)]
-        ent_msgs_other = [m for m in demo_other.blocks[i_other].messages
-                          if isinstance(m, messages.EntityUpdateMessage)]
+        ent_msgs = list(demo.blocks[i].iter_messages(messages.EntityUpdateMessage))
+        ent_msgs_other = list(demo_other.blocks[i_other].iter_messages(
+            messages.EntityUpdateMessage))
         for msg_other in ent_msgs_other:
             msg = [m for m in ent_msgs if m.num == msg_other.num]
             if msg:
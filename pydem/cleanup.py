@@ -6,14 +6,11 @@ from . import messages
 
 def fix_intermission_lag(demo: format.Demo):
     pattern = rb"The recorded time was (?:(\d)*:)?([0-5]?\d.\d{5})"
-    for i, block in enumerate(demo.blocks):
-        if not any(isinstance(m, messages.IntermissionMessage)
-                   for m in block.messages):
-            continue
-
+    for i in demo.find_blocks(messages.IntermissionMessage):
+        block = demo.blocks[i]
         for following_block in demo.blocks[i:]:
-            text = b''.join(m.text for m in following_block.messages
-                            if isinstance(m, messages.PrintMessage))
+            text = b''.join(m.text for m in
+                            following_block.iter_messages(messages.PrintMessage))
             match = re.search(pattern, text)
             if match:
                 minutes = int(match.group(1)) if match.group(1) else 0
@@ -22,39 +19,38 @@ def fix_intermission_lag(demo: format.Demo):
                 correct_intermission_time = minutes * 60 + seconds
                 break
 
-        for preceding_block in reversed(demo.blocks[:i]):
-            time_messages = [m for m in preceding_block.messages
-                             if isinstance(m, messages.TimeMessage)]
-            if not time_messages:
-                continue
-            assert len(time_messages) == 1
-
-            current_time = time_messages[0].time
-            if abs(current_time - correct_intermission_time) < 1e-5:
-                if preceding_block != demo.blocks[i-1]:
-                    print(f"Shifting intermission to {current_time}")
-                    messages_to_shift = [m for m in block.messages
-                        if (isinstance(m, messages.IntermissionMessage) or
-                            isinstance(m, messages.CdTrackMessage))]
-                    for message_to_shift in messages_to_shift:
-                        block.messages.remove(message_to_shift)
-                        preceding_block.messages.append(message_to_shift)
-                break
-            elif current_time < correct_intermission_time:
-                raise ValueError("Could not find correct intermission time")
+        # the last block with a time message before the intermission that is
+        # not after the correct time
+        j = min(demo.block_at_time(correct_intermission_time + 1e-5, i), i)
+        j = demo.get_previous_block_index_with_time_message(j)
+        if j < 0 or not any(demo.blocks[j].iter_messages(messages.TimeMessage)):
+            continue
+        preceding_block = demo.blocks[j]
+        time_messages = list(preceding_block.iter_messages(messages.TimeMessage))
+        assert len(time_messages) == 1
+
+        current_time = time_messages[0].time
+        if abs(current_time - correct_intermission_time) < 1e-5:
+            if j != i - 1:
+                print(f"Shifting intermission to {current_time}")
+                messages_to_shift = list(block.iter_messages(
+                    (messages.IntermissionMessage, messages.CdTrackMessage)))
+                for message_to_shift in messages_to_shift:
+                    block.messages.remove(message_to_shift)
+                    preceding_block.messages.append(message_to_shift)
+        else:
+            raise ValueError("Could not find correct intermission time")
 
 
 def fix_intermission_transition(demo: format.Demo):
     reinsert_data = []
-    for i, block in enumerate(demo.blocks):
-        intermission_messages = [m for m in block.messages if
-                                 isinstance(m, messages.IntermissionMessage)]
-        if not intermission_messages:
-            continue
+    for i in demo.find_blocks(messages.IntermissionMessage):
+        block = demo.blocks[i]
+        intermission_messages = list(block.iter_messages(messages.IntermissionMessage))
 
         new_block_index = demo.get_previous_block_index_with_time_message(i)
-        if not any(isinstance(m, messages.SetAngleMessage)
-                   for m in demo.blocks[new_block_index].messages):
+        if not any(demo.blocks[new_block_index].iter_messages(
+                messages.SetAngleMessage)):
             print("Warning: could not find expected setangle message, "
                   "not fixing intermission transition")
             continue
@@ -70,28 +66,35 @@ def fix_intermission_transition(demo: format.Demo):
 
 def instant_skin_color(demo: format.Demo):
     for block in demo.blocks:
-        for m in [m for m in block.messages
-                  if isinstance(m, messages.UpdateColorsMessage)]:
+        for m in list(block.iter_messages(messages.UpdateColorsMessage)):
             block.messages.append(messages.EntityUpdateMessage(
                 messages.UpdateFlags.SIGNAL, m.player_id + 1, None, None, None,
                 None, None, None, None, None, None, None, None, None, None))
 
 
+def remove_grenade_counter_from_block(block: format.Block):
+    grenade_counter_messages = [m for m in block.iter_messages(messages.CenterPrintMessage)
+                                if m.text.startswith(b"Grenade")]
+    for m in grenade_counter_messages:
+        block.messages.remove(m)
+
+
 def remove_grenade_counter(demo: format.Demo):
     for block in demo.blocks:
-        grenade_counter_messages = [m for m in block.messages
-            if (isinstance(m, messages.CenterPrintMessage) and
-                m.text.startswith(b"Grenade"))]
-        for m in grenade_counter_messages:
-            block.messages.remove(m)
+        remove_grenade_counter_from_block(block)
+
+
+def iter_remove_grenade_counter(blocks):
+    for block in blocks:
+        remove_grenade_counter_from_block(block)
+        yield block
 
 
 def remove_pauses(demo: format.Demo):
     is_paused_list = []
     is_paused = False
     for block in demo.blocks:
-        for m in [m for m in block.messages
-                  if isinstance(m, messages.SetPauseMessage)]:
+        for m in list(block.iter_messages(messages.SetPauseMessage)):
             is_paused = m.paused
             block.messages.remove(m)
         is_paused_list.append(is_paused)
@@ -99,8 +102,7 @@ def remove_pauses(demo: format.Demo):
     for block, is_paused in zip(reversed(demo.blocks), reversed(is_paused_list)):
         if is_paused:
             block.viewangles = viewangles_after_unpause
-            for m in [m for m in block.messages
-                      if isinstance(m, messages.EntityUpdateMessage)]:
+            for m in list(block.iter_messages(messages.EntityUpdateMessage)):
                 block.messages.remove(m)
             # we are adding these even on the earliest blocks now (for example
             # before spawnbaseline even happened), which might not be that nice.
@@ -109,30 +111,58 @@ def remove_pauses(demo: format.Demo):
             block.messages.extend(entity_updates_after_unpause)
         else:
             viewangles_after_unpause = block.viewangles
-            entity_updates = [m for m in block.messages
-                              if isinstance(m, messages.EntityUpdateMessage)]
+            entity_updates = list(block.iter_messages(messages.EntityUpdateMessage))
             if entity_updates:
                 entity_updates_after_unpause = entity_updates
 
 
+def remove_prints_from_block(block: format.Block, exclude_patterns=list[str]):
+    print_messages = list(block.iter_messages(messages.PrintMessage))
+    for m in print_messages:
+        if any(pattern.encode('ascii') in m.text for pattern in exclude_patterns):
+            block.messages.remove(m)
+
+
 def remove_prints(demo: format.Demo, exclude_patterns=list[str]):
     for block in demo.blocks:
-        print_messages = [m for m in block.messages
-                          if isinstance(m, messages.PrintMessage)]
-        for m in print_messages:
-            if any(pattern.encode('ascii') in m.text for pattern in exclude_patterns):
-                block.messages.remove(m)
+        remove_prints_from_block(block, exclude_patterns)
+
+
+def iter_remove_prints(blocks, exclude_patterns=list[str]):
+    for block in blocks:
+        remove_prints_from_block(block, exclude_patterns)
+        yield block
+
+
+def remove_sounds_from_block(block: format.Block, sounds_precache: list[bytes],
+                             exclude_patterns=list[str]):
+    sound_messages = list(block.iter_messages(messages.SoundMessage))
+    for m in sound_messages:
+        if any(pattern.encode('ascii') in sounds_precache[m.sound_num]
+               for pattern in exclude_patterns):
+            block.messages.remove(m)
 
 
 def remove_sounds(demo: format.Demo, exclude_patterns=list[str]):
     _, sounds_precache = demo.get_precaches()
     for block in demo.blocks:
-        sound_messages = [m for m in block.messages
-                          if isinstance(m, messages.SoundMessage)]
-        for m in sound_messages:
-            if any(pattern.encode('ascii') in sounds_precache[m.sound_num]
-                   for pattern in exclude_patterns):
-                block.messages.remove(m)
+        remove_sounds_from_block(block, sounds_precache, exclude_patterns)
+
+
+def iter_sounds_precache(blocks):
+    # pairs each block with the sounds precache of the most recent
+    # ServerInfoMessage, as concatenated demos contain several of them
+    sounds_precache = []
+    for block in blocks:
+        for m in block.iter_messages(messages.ServerInfoMessage):
+            sounds_precache = m.sounds_precache
+        yield block, sounds_precache
+
+
+def iter_remove_sounds(blocks, exclude_patterns=list[str]):
+    for block, sounds_precache in iter_sounds_precache(blocks):
+        remove_sounds_from_block(block, sounds_precache, exclude_patterns)
+        yield block
 
 
 def cut_end_after(demo: format.Demo, duration: float, end_kind: str):
@@ -145,34 +175,44 @@ def cut_end_after(demo: format.Demo, duration: float, end_kind: str):
 
     times = demo.get_time()
     time_end = None
-    for i, block in enumerate(demo.blocks):
-        if any(isinstance(m, message_type) for m in block.messages):
-            time_end = times[i]
-            break
+    end_block_indices = demo.find_blocks(message_type)
+    if end_block_indices:
+        time_end = times[end_block_indices[0]]
     if not time_end:
         print(f"Warning: no {end_kind} found, not cutting anything")
         return
 
-    i_first_to_remove = next(
-        (i for (i, t) in enumerate(times) if t > time_end + duration),
-        len(demo.blocks))
+    i_first_to_remove = demo.blocks_between(time_end, time_end + duration,
+                                            end_block_indices[0]).stop
     if i_first_to_remove == len(demo.blocks):
         print(f"Warning: {end_kind} is shorter than duration to cut to!")
     # assuming that last block is disconnect message
     del demo.blocks[i_first_to_remove:-1]
 
 
+def replace_sound_in_block(block: format.Block, sounds_precache: list[bytes],
+                           replacement_pairs_bytes: list[list[bytes]]):
+    for m in block.iter_messages(messages.SoundMessage):
+        for old_sound, new_sound in replacement_pairs_bytes:
+            if sounds_precache[m.sound_num] == old_sound:
+                block.mark_changed(messages.SoundMessage)
+                m.sound_num = sounds_precache.index(new_sound)
+
+
 def replace_sound(demo: format.Demo, replacement_pairs: list[list[str]]):
     replacement_pairs_bytes = [[x.encode('utf-8') for x in pair]
                                for pair in replacement_pairs]
     _, sounds_precache = demo.get_precaches()
     for block in demo.blocks:
-        for m in block.messages:
-            if not isinstance(m, messages.SoundMessage):
-                continue
-            for old_sound, new_sound in replacement_pairs_bytes:
-                if sounds_precache[m.sound_num] == old_sound:
-                    m.sound_num = sounds_precache.index(new_sound)
+        replace_sound_in_block(block, sounds_precache, replacement_pairs_bytes)
+
+
+def iter_replace_sound(blocks, replacement_pairs: list[list[str]]):
+    replacement_pairs_bytes = [[x.encode('utf-8') for x in pair]
+                               for pair in replacement_pairs]
+    for block, sounds_precache in iter_sounds_precache(blocks):
+        replace_sound_in_block(block, sounds_precache, replacement_pairs_bytes)
+        yield block
 
 
 def replace_weaponmodel(demo: format.Demo, replacement_pairs: list[list[str]]):
@@ -180,9 +220,8 @@ def replace_weaponmodel(demo: format.Demo, replacement_pairs: list[list[str]]):
                                for pair in replacement_pairs]
     models_precache, _ = demo.get_precaches()
     for block in demo.blocks:
-        for m in block.messages:
-            if not isinstance(m, messages.ClientDataMessage):
-                continue
+        for m in block.iter_messages(messages.ClientDataMessage):
             for old_weaponmodel, new_weaponmodel in replacement_pairs_bytes:
                 if models_precache[m.weapon] == old_weaponmodel:
+                    block.mark_changed(messages.ClientDataMessage)
                     m.weapon = models_precache.index(new_weaponmodel)
\ No newline at end of file
@@ -1,57 +1,190 @@
 import argparse
+import concurrent.futures
+import contextlib
+import io
+import itertools
 import math
 import os
+import time
 
+from . import batch
+from . import bindata
+from . import cache
 from . import cinematic
 from . import cleanup
+from . import export
 from . import format
+from . import profiling
 from . import smoothing
+from . import snapshot
 from . import spawnparams
 from . import stats
 
 
-class MemoryBuffer:
-    def __init__(self, buffer):
-        self.__buffer = buffer
-        self.length = len(buffer)
-        self.pos = 0
-
-    def read(self, num=None):
-        if self.pos < 0 or self.pos > self.length:
-            raise IndexError("Read position out of bounds!")
-        if self.pos == self.length:
-            return b''
-        if num is None:
-            ret = self.__buffer[self.pos:]
-            self.pos = self.length
-            return ret
-        else:
-            if num < 0:
-                raise IndexError("Amount to read has to be positive!")
-            if self.pos + num > self.length:
-                raise IndexError("Can't read that many bytes!")
-            ret = self.__buffer[self.pos:self.pos+num]
-            self.pos += num
-            return ret
-
-    def tell(self):
-        return self.pos
-
-    def seek(self, offset, from_what=0):
-        if from_what == 0:
-            self.pos = offset
-        elif from_what == 1:
-            self.pos += offset
-        elif from_what == 2:
-            self.pos = self.length - offset
-
-def parse_demo(filepath_demo):
+def output_path(path, args):
+    if args.export:
+        return os.path.splitext(path)[-2] + '_columns'
+    if args.snapshot:
+        return os.path.splitext(path)[-2] + '_snapshot'
+    return os.path.splitext(path)[-2] + '_out.dem'
+
+
+def parse_demo(filepath_demo, demo_cache: cache.DemoCache = None):
+    with profiling.stage('parse', filepath_demo) as items:
+        demo = read_demo(filepath_demo, demo_cache)
+        if not snapshot.is_snapshot(filepath_demo):
+            items['bytes'] = os.path.getsize(filepath_demo)
+        items['blocks'] = len(demo.blocks)
+    return demo
+
+
+def read_demo(filepath_demo, demo_cache: cache.DemoCache = None):
+    if snapshot.is_snapshot(filepath_demo):
+        return snapshot.load(filepath_demo)
     with open(filepath_demo, 'rb', buffering=0) as f:
-        memory_stream = MemoryBuffer(f.read())
+        memory_stream = bindata.MemoryBuffer.from_file(f)
+    if demo_cache is not None:
+        return demo_cache.parse(memory_stream)
     return format.Demo.parse(memory_stream)
 
 
-def main():
+def get_demo_cache(args):
+    if not args.cache:
+        return None
+    return cache.DemoCache(args.cache, int(args.cache_size * (1 << 20)))
+
+
+def can_stream(args, paths):
+    # these options only look at a single block at a time, everything else
+    # needs the whole demo in memory. snapshots are not in the format of demos
+    # that is streamed
+    if any(snapshot.is_snapshot(path) for path in paths):
+        return False
+    return not (args.export or args.snapshot or args.stats or args.spawnparams or args.merge or args.add_runes or
+                args.fix_intermission_lag or args.fix_intermission_transition or
+                math.isfinite(args.cut_finale) or
+                math.isfinite(args.cut_intermission) or
+                args.instant_skin_color or args.remove_pauses or
+                args.replace_weaponmodel or args.smooth_viewangles or
+                args.fadein > 0.0 or args.fadeout > 0.0)
+
+
+def stream_demo(path, path_out, args):
+    with (profiling.stage('stream', path) as items,
+          open(path, 'rb') as f_in, open(path_out, 'wb') as f_out):
+        format.CdTrack.parse(f_in).write(f_out)
+        blocks = format.iter_blocks(f_in)
+        if args.remove_grenade_counter:
+            blocks = cleanup.iter_remove_grenade_counter(blocks)
+        if args.remove_prints:
+            blocks = cleanup.iter_remove_prints(blocks, args.remove_prints)
+        if args.remove_sounds:
+            blocks = cleanup.iter_remove_sounds(blocks, args.remove_sounds)
+        if args.replace_sound:
+            blocks = cleanup.iter_replace_sound(blocks, args.replace_sound)
+        if args.remove_fades:
+            blocks = cinematic.iter_remove_fades(blocks)
+        format.write_blocks(f_out, blocks)
+        items['bytes'] = f_in.tell()
+        items['bytes_written'] = f_out.tell()
+
+
+def transform_demo(demo, args, path=None):
+    if args.add_runes:
+        with profiling.stage('add_runes', path, demo):
+            rune_strings = (' '.join(args.add_runes.split(','))).split(' ')
+            stats.add_runes(demo, [int(s) for s in rune_strings])
+    if args.fix_intermission_lag:
+        with profiling.stage('fix_intermission_lag', path, demo):
+            cleanup.fix_intermission_lag(demo)
+    if args.fix_intermission_transition:
+        with profiling.stage('fix_intermission_transition', path, demo):
+            cleanup.fix_intermission_transition(demo)
+    if math.isfinite(args.cut_finale):
+        with profiling.stage('cut_finale', path, demo):
+            cleanup.cut_end_after(demo, args.cut_finale, 'finale')
+    if math.isfinite(args.cut_intermission):
+        with profiling.stage('cut_intermission', path, demo):
+            cleanup.cut_end_after(demo, args.cut_intermission, 'intermission')
+    if args.instant_skin_color:
+        with profiling.stage('instant_skin_color', path, demo):
+            cleanup.instant_skin_color(demo)
+    if args.remove_grenade_counter:
+        with profiling.stage('remove_grenade_counter', path, demo):
+            cleanup.remove_grenade_counter(demo)
+    if args.remove_pauses:
+        with profiling.stage('remove_pauses', path, demo):
+            cleanup.remove_pauses(demo)
+    if args.remove_prints:
+        with profiling.stage('remove_prints', path, demo):
+            cleanup.remove_prints(demo, args.remove_prints)
+    if args.remove_sounds:
+        with profiling.stage('remove_sounds', path, demo):
+            cleanup.remove_sounds(demo, args.remove_sounds)
+    if args.replace_sound:
+        with profiling.stage('replace_sound', path, demo):
+            cleanup.replace_sound(demo, args.replace_sound)
+    if args.replace_weaponmodel:
+        with profiling.stage('replace_weaponmodel', path, demo):
+            cleanup.replace_weaponmodel(demo, args.replace_weaponmodel)
+    if args.smooth_viewangles:
+        with profiling.stage('smooth_viewangles', path, demo):
+            smoothing.smooth_viewangles(demo)
+    if args.remove_fades:
+        with profiling.stage('remove_fades', path, demo):
+            cinematic.remove_fades(demo)
+    if args.fadein > 0.0:
+        with profiling.stage('fadein', path, demo):
+            cinematic.fadein(demo, args.fadein)
+    if args.fadeout > 0.0:
+        with profiling.stage('fadeout', path, demo):
+            cinematic.fadeout(demo, args.fadeout)
+
+
+def write_demo(path, demo, args):
+    with profiling.stage('write', path, demo) as items:
+        if args.export:
+            columns = export.get_columns(demo)
+            export.write_columns(output_path(path, args), columns)
+            items['columns'] = len(columns)
+            return
+        if args.snapshot:
+            snapshot.save(output_path(path, args), demo)
+            return
+        with open(output_path(path, args), 'wb') as f:
+            demo.write(f)
+            items['bytes_written'] = f.tell()
+
+
+def process_demo(path, args):
+    demo = parse_demo(path, get_demo_cache(args))
+    transform_demo(demo, args, path)
+    write_demo(path, demo, args)
+
+
+def process_demo_data(path, data, args):
+    # demos that were already changed are handed over in their file format,
+    # as that is cheap to parse again and unchanged blocks are just copied
+    demo = format.Demo.parse(bindata.MemoryBuffer(data))
+    transform_demo(demo, args, path)
+    write_demo(path, demo, args)
+
+
+def demo_data(demo):
+    stream = io.BytesIO()
+    demo.write(stream)
+    return stream.getvalue()
+
+
+def run_jobs(jobs, function, *iterables):
+    if jobs == 1:
+        return list(map(function, *iterables))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        return [profiling.worker_result(result) for result in
+                executor.map(profiling.in_worker(function), *iterables)]
+
+
+def make_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('demos', type=str, nargs='*', help="Path to input demo files.")
     parser.add_argument('--add_runes', type=str,
@@ -101,7 +234,81 @@ def main():
     parser.add_argument('--coop', dest='coop_demos', action='append', type=str,
                         nargs='*', default=[],
                         help="Path to corresponding demo files for another player.")
+    parser.add_argument('--jobs', type=int, default=1,
+        help="Number of demos to process in parallel.")
+    parser.add_argument('--batch', type=str,
+        help="Process the sets of demos listed in the given JSON or CSV "
+             "manifest, each with its own options. Sets that were already "
+             "processed with the same demo contents and options are skipped.")
+    parser.add_argument('--journal', type=str,
+        help="Journal of processed sets for --batch. Defaults to the path of "
+             "the manifest with .journal appended.")
+    parser.add_argument('--snapshot', action='store_true',
+        help="Write snapshots (directories of .npy files) instead of demos, "
+             "which load much faster when given as input demos again, e.g. "
+             "for further steps.")
+    parser.add_argument('--export', action='store_true',
+        help="Write columns of positions, stats, sounds, prints and more "
+             "instead of demos, as .npy files in a _columns directory for "
+             "each demo.")
+    parser.add_argument('--cache', type=str,
+        help="Directory to keep parsed demos in, so that processing the same "
+             "demos again is faster. Demos are read from it as they are, so "
+             "it must not be writable by anyone who cannot change the demos.")
+    parser.add_argument('--cache_size', type=float,
+        default=cache.DEFAULT_MAX_SIZE / (1 << 20),
+        help="Maximum size of the --cache directory in MiB. Least recently "
+             "used demos are removed when it is exceeded.")
+    parser.add_argument('--profile', action='store_true',
+        help="Print the time spent parsing and writing each type of message "
+             "and in each step.")
+    parser.add_argument('--report', type=str,
+        help="Write wall and CPU time, peak memory and counts of each step for "
+             "each demo as JSON to this path.")
+    return parser
+
+
+def main():
+    parser = make_parser()
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.batch and (args.demos or args.coop_demos):
+        parser.error("--batch takes the demos from the manifest")
+
+    num_failed = 0
+    recording = (profiling.enabled(profiling.Profile(count_messages=args.profile))
+                 if args.profile or args.report else contextlib.nullcontext())
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    with recording as profile:
+        if args.batch:
+            journal_path = args.journal or args.batch + '.journal'
+            num_failed = batch.run_batch(args.batch, journal_path, args.jobs,
+                                         lambda argv: parse_set_args(parser, argv),
+                                         run)
+        else:
+            run(args)
+    if args.report:
+        profiling.write_report(args.report, profile, time.perf_counter() - start,
+                               time.process_time() - start_cpu)
+    if args.profile:
+        print(profile.format())
+    if num_failed:
+        parser.exit(1, f"Failed to process {num_failed} sets\n")
+
+
+def parse_set_args(parser, argv):
+    args = parser.parse_args(argv)
+    if args.batch:
+        parser.error("--batch cannot be used within a manifest")
+    # sets are already processed in parallel
+    args.jobs = 1
+    return args
+
+
+def run(args):
+    """Process the demos as given by the arguments and return written paths."""
 
     # this is a list of size "number of players" where each element is a list of
     # size len(args.demos) that contains paths to the demos for the
@@ -111,9 +318,24 @@ def main():
     # size "number of players" that contains the path to the corresponding demo
     # for each player
     paths_per_player = list(zip(*foreach_player_paths, strict=True))
+
+    all_paths = [path for path_per_player in paths_per_player
+                 for path in path_per_player]
+    if can_stream(args, all_paths):
+        output_paths = [output_path(path, args) for path in all_paths]
+        run_jobs(args.jobs, stream_demo, all_paths, output_paths,
+                 itertools.repeat(args))
+        return output_paths
+
+    if not (args.stats or args.spawnparams or args.merge):
+        # every demo is independent, so do everything in one go for each
+        run_jobs(args.jobs, process_demo, all_paths, itertools.repeat(args))
+        return [output_path(path, args) for path in all_paths]
+
     # this is a list of size len(args.demos) where each element is a list of
     # size "num players" that contains the corresponding demo for each player
-    demos_per_player = [[parse_demo(path) for path in path_per_player]
+    demo_cache = get_demo_cache(args)
+    demos_per_player = [[parse_demo(path, demo_cache) for path in path_per_player]
                         for path_per_player in paths_per_player]
 
     if args.stats:
@@ -121,64 +343,45 @@ def main():
         for demo_path_per_player, demo_per_player in zip(paths_per_player[1:],
                                                          demos_per_player[1:]):
             print("========== Fixing stats for " + ', '.join(demo_path_per_player) + " ==========")
-            new_stats_per_player = [spawnparams.nextmap(d.get_final_client_stats())
-                                   for d in demo_previous_per_player]
-            stats.apply_new_start_stats(new_stats_per_player, demo_per_player,
-                                        is_coop=args.coop_demos)
+            with profiling.stage('stats', ', '.join(demo_path_per_player)) as items:
+                items['demos'] = len(demo_per_player)
+                new_stats_per_player = [spawnparams.nextmap(d.get_final_client_stats())
+                                       for d in demo_previous_per_player]
+                stats.apply_new_start_stats(new_stats_per_player, demo_per_player,
+                                            is_coop=args.coop_demos)
             demo_previous_per_player = demo_per_player
 
+    cfg_paths = []
     if args.spawnparams:
         for demo_path_per_player, demo_per_player in zip(paths_per_player,
                                                          demos_per_player):
             cfg_path = demo_path_per_player[0].replace('.dem', '_end.cfg')
-            spawnparams.write_cfg(cfg_path, demo_per_player)
+            with profiling.stage('spawnparams', ', '.join(demo_path_per_player)):
+                spawnparams.write_cfg(cfg_path, demo_per_player)
+            cfg_paths.append(cfg_path)
 
     if args.merge:
         demo_paths = [path_per_player[0] for path_per_player in paths_per_player]
-        demos = [cinematic.merge(demo_per_player) for demo_per_player in demos_per_player]
+        demos = []
+        for path, demo_per_player in zip(demo_paths, demos_per_player):
+            with profiling.stage('merge', path) as items:
+                demos.append(cinematic.merge(demo_per_player))
+                items['demos'] = len(demo_per_player)
+                items['blocks'] = len(demos[-1].blocks)
     else:
         # forget about distinction of belonging to different players, as this is not
         # important anymore for further operations: i.e. flatten the lists of lists
-        demo_paths = [path for path_per_player in paths_per_player
-                      for path in path_per_player]
+        demo_paths = all_paths
         demos = [demo for demo_per_player in demos_per_player
                  for demo in demo_per_player]
 
-    for demo in demos:
-        if args.add_runes:
-            rune_strings = (' '.join(args.add_runes.split(','))).split(' ')
-            stats.add_runes(demo, [int(s) for s in rune_strings])
-        if args.fix_intermission_lag:
-            cleanup.fix_intermission_lag(demo)
-        if args.fix_intermission_transition:
-            cleanup.fix_intermission_transition(demo)
-        if math.isfinite(args.cut_finale):
-            cleanup.cut_end_after(demo, args.cut_finale, 'finale')
-        if math.isfinite(args.cut_intermission):
-            cleanup.cut_end_after(demo, args.cut_intermission, 'intermission')
-        if args.instant_skin_color:
-            cleanup.instant_skin_color(demo)
-        if args.remove_grenade_counter:
-            cleanup.remove_grenade_counter(demo)
-        if args.remove_pauses:
-            cleanup.remove_pauses(demo)
-        if args.remove_prints:
-            cleanup.remove_prints(demo, args.remove_prints)
-        if args.remove_sounds:
-            cleanup.remove_sounds(demo, args.remove_sounds)
-        if args.replace_sound:
-            cleanup.replace_sound(demo, args.replace_sound)
-        if args.replace_weaponmodel:
-            cleanup.replace_weaponmodel(demo, args.replace_weaponmodel)
-        if args.smooth_viewangles:
-            smoothing.smooth_viewangles(demo)
-        if args.remove_fades:
-            cinematic.remove_fades(demo)
-        if args.fadein > 0.0:
-            cinematic.fadein(demo, args.fadein)
-        if args.fadeout > 0.0:
-            cinematic.fadeout(demo, args.fadeout)
-
-    for path, demo in zip(demo_paths, demos):
-        with open(os.path.splitext(path)[-2] + '_out.dem', 'wb') as f:
-            demo.write(f)
+    # the stats chain and merging above depend on other demos, the remaining
+    # steps only on the demo itself
+    if args.jobs == 1:
+        for path, demo in zip(demo_paths, demos):
+            transform_demo(demo, args, path)
+            write_demo(path, demo, args)
+    else:
+        run_jobs(args.jobs, process_demo_data, demo_paths,
+                 map(demo_data, demos), itertools.repeat(args))
+    return [output_path(path, args) for path in demo_paths] + cfg_paths
@@ -0,0 +1,78 @@
+import dataclasses
+import os
+
+import numpy
+
+from . import format
+from . import messages
+
+
+def _strings(strings: list[bytes]) -> numpy.ndarray:
+    # fixed width, so that they can be memory mapped like everything else
+    return numpy.array(strings, dtype=bytes) if strings else numpy.array([], dtype='S1')
+
+def _ints(values) -> numpy.ndarray:
+    return numpy.array(values, dtype=numpy.int64)
+
+def _vectors(values) -> numpy.ndarray:
+    return numpy.array(values, dtype=numpy.float64).reshape(-1, 3)
+
+
+def get_columns(demo: format.Demo) -> dict[str, numpy.ndarray]:
+    """Columns of the data of a demo that is most useful for analysis.
+
+    Columns with the same prefix belong to the same table, with one row per
+    block (block_), entity update (entity_), client data (client_), sound
+    (sound_), print (print_) or damage (damage_) message. Messages have the
+    index of their block in the block_index column. Precaches are given as
+    arrays of the names, so that the number in a message is the index.
+    """
+    columns = {'block_time': demo.get_time(),
+               'block_viewangles': demo.get_viewangles()}
+
+    table = demo.get_entity_table()
+    for field in dataclasses.fields(table):
+        columns['entity_' + field.name] = getattr(table, field.name)
+
+    client_stats = [(i, s) for i, s in enumerate(demo.get_client_stats()) if s]
+    columns['client_block_index'] = _ints([i for i, _ in client_stats])
+    for field in dataclasses.fields(format.ClientStats):
+        columns['client_' + field.name] = _ints(
+            [getattr(s, field.name) for _, s in client_stats])
+
+    sounds = list(demo.iter_messages(messages.SoundMessage))
+    columns['sound_block_index'] = _ints([i for i, _ in sounds])
+    for name in ('ent', 'channel', 'volume', 'attenuation'):
+        columns['sound_' + name] = _ints([getattr(m, name) for _, m in sounds])
+    columns['sound_num'] = _ints([m.sound_num for _, m in sounds])
+    columns['sound_pos'] = _vectors([m.pos for _, m in sounds])
+
+    prints = list(demo.iter_messages(messages.PrintMessage))
+    columns['print_block_index'] = _ints([i for i, _ in prints])
+    columns['print_text'] = _strings([m.text for _, m in prints])
+
+    damage = list(demo.iter_messages(messages.DamageMessage))
+    columns['damage_block_index'] = _ints([i for i, _ in damage])
+    columns['damage_armor'] = _ints([m.armor for _, m in damage])
+    columns['damage_blood'] = _ints([m.blood for _, m in damage])
+    columns['damage_from_coords'] = _vectors([m.from_coords for _, m in damage])
+
+    server_info_messages = [m for _, m in demo.iter_messages(messages.ServerInfoMessage)]
+    if len(server_info_messages) == 1:
+        columns['models_precache'] = _strings(server_info_messages[0].models_precache)
+        columns['sounds_precache'] = _strings(server_info_messages[0].sounds_precache)
+    return columns
+
+
+def write_columns(directory, columns: dict[str, numpy.ndarray]):
+    """Write each column to a .npy file in the directory."""
+    os.makedirs(directory, exist_ok=True)
+    for name, column in columns.items():
+        numpy.save(os.path.join(directory, name + '.npy'), column)
+
+
+def load_columns(directory) -> dict[str, numpy.ndarray]:
+    """Memory map the columns written by write_columns."""
+    return {os.path.splitext(name)[0]:
+                numpy.load(os.path.join(directory, name), mmap_mode='r')
+            for name in sorted(os.listdir(directory)) if name.endswith('.npy')}
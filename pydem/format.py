@@ -1,5 +1,11 @@
+import array
+import bisect
+import collections
 import dataclasses
 import io
+import itertools
+import math
+import operator
 
 import numpy
 
@@ -18,52 +24,313 @@ class CdTrack:
 
     @staticmethod
     def parse(stream):
-        string = b''
-        for _ in range(CdTrack.MAX_CDTRACK_LEN):
-            c = bindata.read_char(stream)
-            string += c
-            if c == b'\n':
-                return CdTrack(string)
-        raise ValueError("Error parsing cd track")
+        try:
+            string = bindata.read_until(stream, b'\n', CdTrack.MAX_CDTRACK_LEN)
+        except ValueError:
+            raise ValueError("Error parsing cd track")
+        return CdTrack(string + b'\n')
 
 
 @dataclasses.dataclass
 class ViewAngles:
+    LAYOUT = bindata.codec('fff')
+
     pitch: float
     yaw: float
     roll: float
 
     def write(self, stream):
-        bindata.write_f32_n(stream, (self.pitch, self.yaw, self.roll))
+        bindata.write_struct(stream, self.LAYOUT, self.pitch, self.yaw, self.roll)
 
     @staticmethod
     def parse(stream):
-        pitch, yaw, roll = bindata.read_f32_n(stream, 3)
-        return ViewAngles(pitch, yaw, roll)
+        return ViewAngles(*bindata.read_struct(stream, ViewAngles.LAYOUT))
+
+
+class ChangeTracker:
+    """Records which message types of a demo were changed and when.
+
+    Data derived from a demo remembers the version it was built at and stays
+    valid until messages of a type it depends on are changed.
+    """
+    def __init__(self):
+        self.version = 0
+        # last change that may have affected any type, e.g. blocks being
+        # inserted or removed
+        self.all_changed = 0
+        self.type_changed = {}
+
+    def changed(self, message_types=None):
+        self.version += 1
+        if message_types is None:
+            self.all_changed = self.version
+        else:
+            for message_type in message_types:
+                self.type_changed[message_type] = self.version
+
+    def last_change(self, message_type) -> int:
+        return max([self.all_changed] +
+                   [version for t, version in self.type_changed.items()
+                    if issubclass(t, message_type)])
+
+
+def _types(items) -> set:
+    return set(type(item) for item in items)
+
+_get_viewangles = operator.attrgetter('viewangles')
+
+class MessageList(list):
+    """Messages of a block, reporting any change to the block."""
+    def __init__(self, block, messages=()):
+        super().__init__(messages)
+        self._block = block
+
+    def __reduce_ex__(self, protocol):
+        return MessageList, (self._block, list(self))
+
+    def _changed(self, items):
+        self._block._messages_changed(_types(items))
+
+    def append(self, message):
+        super().append(message)
+        self._changed([message])
+
+    def extend(self, messages):
+        messages = list(messages)
+        super().extend(messages)
+        self._changed(messages)
+
+    def __iadd__(self, messages):
+        self.extend(messages)
+        return self
+
+    def insert(self, index, message):
+        super().insert(index, message)
+        self._changed([message])
+
+    def remove(self, message):
+        super().remove(message)
+        self._changed([message])
+
+    def pop(self, index=-1):
+        message = super().pop(index)
+        self._changed([message])
+        return message
+
+    def clear(self):
+        removed = list(self)
+        super().clear()
+        self._changed(removed)
+
+    def __setitem__(self, index, value):
+        removed = self[index] if isinstance(index, slice) else [self[index]]
+        super().__setitem__(index, value)
+        self._changed(list(removed) + (list(value) if isinstance(index, slice) else [value]))
+
+    def __delitem__(self, index):
+        removed = self[index] if isinstance(index, slice) else [self[index]]
+        super().__delitem__(index)
+        self._changed(removed)
+
+    def __imul__(self, n):
+        super().__imul__(n)
+        self._changed(self)
+        return self
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._changed(self)
+
+    def reverse(self):
+        super().reverse()
+        self._changed(self)
+
+
+class BlockList(list):
+    """Blocks of a demo, reporting any change to the tracker of the demo."""
+    def __init__(self, tracker: ChangeTracker, blocks=()):
+        super().__init__(blocks)
+        self._tracker = tracker
+        for block in self:
+            block._tracker = tracker
+
+    def __reduce_ex__(self, protocol):
+        # restore the tracker before the blocks, pickle would do it after
+        return BlockList, (self._tracker, list(self))
+
+    def _changed(self, blocks=()):
+        for block in blocks:
+            block._tracker = self._tracker
+        self._tracker.changed()
+
+    def append(self, block):
+        super().append(block)
+        self._changed([block])
+
+    def extend(self, blocks):
+        blocks = list(blocks)
+        super().extend(blocks)
+        self._changed(blocks)
+
+    def __iadd__(self, blocks):
+        self.extend(blocks)
+        return self
+
+    def insert(self, index, block):
+        super().insert(index, block)
+        self._changed([block])
+
+    def remove(self, block):
+        super().remove(block)
+        self._changed()
+
+    def pop(self, index=-1):
+        block = super().pop(index)
+        self._changed()
+        return block
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            super().__setitem__(index, value)
+            self._changed(value)
+        else:
+            super().__setitem__(index, value)
+            self._changed([value])
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._changed()
+
+    def __imul__(self, n):
+        super().__imul__(n)
+        self._changed()
+        return self
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        super().reverse()
+        self._changed()
 
 
-@dataclasses.dataclass
 class Block:
-    viewangles: ViewAngles
-    messages: list
+    # block length followed by the viewangles
+    HEADER = bindata.codec('ifff')
+
+    def __init__(self, viewangles: ViewAngles, messages: list, source=None):
+        self.viewangles = viewangles
+        self._messages = None if messages is None else MessageList(self, messages)
+        # (buffer, start, end, protocol before, protocol after) of the original
+        # bytes of the messages. Messages are decoded from it on first access
+        # and it is written out verbatim as long as the block is unchanged.
+        self._source = source
+        # set by the demo that the block belongs to
+        self._tracker = None
+
+    @property
+    def messages(self) -> list:
+        # adding, removing or replacing messages in the list is tracked.
+        # Messages that are modified in place need mark_changed, as for
+        # iter_messages
+        return self._get_messages()
+
+    @messages.setter
+    def messages(self, value: list):
+        self._messages = MessageList(self, value)
+        self._messages_changed(None)
+
+    def iter_messages(self, message_type=None):
+        """Iterate messages without marking the block as changed.
+
+        Messages must not be modified, unless mark_changed is called.
+        """
+        for m in self._get_messages():
+            if message_type is None or isinstance(m, message_type):
+                yield m
+
+    def mark_changed(self, message_type=None):
+        """Mark messages as modified in place, of the given type if known."""
+        self._get_messages()
+        self._messages_changed(None if message_type is None else [message_type])
+
+    def _messages_changed(self, message_types):
+        # the original bytes cannot be written anymore
+        self._source = None
+        self._changed(message_types)
+
+    def _changed(self, message_types):
+        if self._tracker is not None:
+            self._tracker.changed(message_types)
+
+    def is_changed(self) -> bool:
+        return self._source is None
+
+    def __eq__(self, other):
+        if not isinstance(other, Block):
+            return NotImplemented
+        return (self.viewangles == other.viewangles and
+                self._get_messages() == other._get_messages())
+
+    def __repr__(self):
+        return f"Block(viewangles={self.viewangles!r}, messages={self._get_messages()!r})"
+
+    def _get_messages(self) -> list:
+        if self._messages is None:
+            self._messages = MessageList(self, self._decode())
+        return self._messages
+
+    def _decode(self) -> list:
+        buffer, start, end, protocol, protocol_after = self._source
+        # messages may change the protocol, so never touch the shared snapshot
+        protocol = Protocol(protocol.version, protocol.flags)
+        read_messages = parse_messages(buffer, start, end, protocol)
+        if protocol != protocol_after:
+            raise ValueError(f"Error parsing messages. Protocol after block: "
+                             f"{protocol}. Expected: {protocol_after}.")
+        return read_messages
+
+    def _can_copy(self, protocol: Protocol) -> bool:
+        _, _, _, protocol_before, protocol_after = self._source
+        state = (protocol.version, protocol.flags)
+        if state != (protocol_before.version, protocol_before.flags):
+            return False
+        # an overriding protocol is not changed by a ServerInfoMessage
+        return (not isinstance(protocol, ProtocolOverride) or
+                state == (protocol_after.version, protocol_after.flags))
 
     def write(self, stream, protocol: Protocol):
+        if self._source is not None and self._can_copy(protocol):
+            buffer, start, end, _, protocol_after = self._source
+            bindata.write_struct(stream, self.HEADER, end - start, self.viewangles.pitch,
+                                 self.viewangles.yaw, self.viewangles.roll)
+            bindata.write_bytes(stream, memoryview(buffer)[start:end])
+            protocol.change(protocol_after)
+            return
+
+        block_messages = self._get_messages()
         temp = io.BytesIO()
-        for message in self.messages:
+        for message in block_messages:
             message.write(temp, protocol)
-        if not self.messages:
+        if not block_messages:
             # block without messages does not seem supported, so write a nop
             messages.NopMessage().write(temp, protocol)
         block_len = temp.tell()
 
-        bindata.write_i32(stream, block_len)
-        self.viewangles.write(stream)
+        bindata.write_struct(stream, self.HEADER, block_len, self.viewangles.pitch,
+                             self.viewangles.yaw, self.viewangles.roll)
         bindata.write_bytes(stream, temp.getbuffer())
 
     @staticmethod
     def parse(stream, protocol: Protocol):
-        block_len = bindata.read_i32(stream)
-        viewangles = ViewAngles.parse(stream)
+        block_len, pitch, yaw, roll = bindata.read_struct(stream, Block.HEADER)
+        viewangles = ViewAngles(pitch, yaw, roll)
 
         read_messages = []
         total_num_bytes_read = 0
@@ -77,6 +344,65 @@ class Block:
         return Block(viewangles, read_messages)
 
 
+def parse_messages(buffer, start: int, end: int, protocol: Protocol) -> list:
+    stream = bindata.MemoryBuffer(buffer, start, end)
+    read_messages = []
+    while stream.tell() < end:
+        read_messages.append(messages.parse_message(stream, protocol))
+    return read_messages
+
+
+def iter_blocks(stream, protocol: Protocol = None):
+    """Parse blocks one at a time, starting at the current stream position.
+
+    Only the block that is currently being parsed is read into memory, so this
+    also works for demos that would not fit into memory as a whole. Changes of
+    the protocol are carried forward from block to block.
+    """
+    if protocol is None:
+        # assume plain netquake protocol by default (may be changed by
+        # ServerInfoMessage during parsing of blocks)
+        protocol = Protocol(ProtocolVersion.NETQUAKE)
+    while stream.read(1):
+        stream.seek(-1, 1)
+        block_len, pitch, yaw, roll = bindata.read_struct(stream, Block.HEADER)
+        data = bytes(bindata.read_bytes(stream, block_len))
+        protocol_before = Protocol(protocol.version, protocol.flags)
+        block_messages = parse_messages(data, 0, block_len, protocol)
+        protocol_after = Protocol(protocol.version, protocol.flags)
+        yield Block(ViewAngles(pitch, yaw, roll), block_messages,
+                    (data, 0, block_len, protocol_before, protocol_after))
+
+
+def write_blocks(stream, blocks, protocol_override: Protocol = None):
+    # assume plain netquake protocol by default (may be changed by
+    # ServerInfoMessage during writing of blocks)
+    protocol = Protocol(ProtocolVersion.NETQUAKE)
+    if protocol_override is not None:
+        protocol = ProtocolOverride(protocol_override)
+    for block in blocks:
+        block.write(stream, protocol)
+
+
+def index_blocks(stream) -> list[tuple[int, int, ViewAngles]]:
+    """Scan block headers without decoding messages.
+
+    Returns start and end offset of the messages of each block together with
+    the viewangles of the block.
+    """
+    offsets = []
+    while stream.read(1):
+        stream.seek(-1, 1)
+        block_len, pitch, yaw, roll = bindata.read_struct(stream, Block.HEADER)
+        start = stream.tell()
+        stream.seek(block_len, 1)
+        if block_len < 0 or stream.tell() > stream.length:
+            raise ValueError(f"Error parsing block at {start}. Length {block_len} "
+                             f"exceeds end of demo.")
+        offsets.append((start, start + block_len, ViewAngles(pitch, yaw, roll)))
+    return offsets
+
+
 @dataclasses.dataclass
 class ClientStats:
     items: messages.ItemFlags
@@ -91,112 +417,356 @@ class ClientStats:
     weaponmodel: int
     weaponframe: int
 
+@dataclasses.dataclass
+class EntityTable:
+    """All entity updates of a demo as columns, one row per update.
+
+    Rows are in the order of the demo, so block_index is sorted. Missing
+    modelindex and frame are -1. Origin and angles hold the values of the
+    messages, with NaN for angles that are not sent. See origin_present for
+    which axes of the origin an update actually contains.
+    """
+    block_index: numpy.ndarray
+    num: numpy.ndarray
+    flags: numpy.ndarray
+    modelindex: numpy.ndarray
+    frame: numpy.ndarray
+    origin: numpy.ndarray
+    angles: numpy.ndarray
+
+    @staticmethod
+    def build(blocks: list[Block]):
+        block_index, num, flags, modelindex, frame = [], [], [], [], []
+        origin = array.array('d')
+        angles = array.array('d')
+        missing = (math.nan, math.nan, math.nan)
+        for i, block in enumerate(blocks):
+            for m in block.iter_messages(messages.EntityUpdateMessage):
+                block_index.append(i)
+                num.append(m.num)
+                flags.append(m.flags)
+                modelindex.append(-1 if m.modelindex is None else m.modelindex)
+                frame.append(-1 if m.frame is None else m.frame)
+                origin.extend(missing if m.origin is None else m.origin)
+                if m.angles is None:
+                    angles.extend(missing)
+                elif None in m.angles:
+                    angles.extend(math.nan if a is None else a for a in m.angles)
+                else:
+                    angles.extend(m.angles)
+        columns = [numpy.array(c, dtype=numpy.int64)
+                   for c in (block_index, num, flags, modelindex, frame)]
+        columns += [numpy.frombuffer(c, dtype=numpy.float64).reshape(-1, 3)
+                    for c in (origin, angles)]
+        for c in columns:
+            # the table is shared by everyone asking the demo for it
+            c.flags.writeable = False
+        return EntityTable(*columns)
+
+    def __len__(self):
+        return len(self.block_index)
+
+    def select(self, rows):
+        return EntityTable(*(getattr(self, f.name)[rows]
+                             for f in dataclasses.fields(self)))
+
+    def entity(self, num: int):
+        return self.select(self.num == num)
+
+    def in_block(self, block_index: int):
+        start, end = numpy.searchsorted(self.block_index,
+                                        [block_index, block_index + 1])
+        return self.select(slice(start, end))
+
+    def origin_present(self) -> numpy.ndarray:
+        bits = numpy.array([bit for bit, _ in messages.ENTITY_UPDATE_AXES])
+        return (self.flags[:, numpy.newaxis] & bits) != 0
+
+
 @dataclasses.dataclass
 class Demo:
     cdtrack: CdTrack
     blocks: list[Block]
 
+    def __setattr__(self, name, value):
+        if name == 'blocks':
+            # changes to blocks and their messages are tracked to know which
+            # derived data has to be rebuilt, see _memoize
+            tracker = self.__dict__.get('_tracker')
+            if tracker is None:
+                tracker = self.__dict__['_tracker'] = ChangeTracker()
+                self.__dict__['_cache'] = {}
+            tracker.changed()
+            value = BlockList(tracker, value)
+        super().__setattr__(name, value)
+
     def write(self, stream, protocol_override: Protocol = None):
-        # assume plain netquake protocol by default (may be changed by
-        # ServerInfoMessage during writing of blocks)
-        protocol = Protocol(ProtocolVersion.NETQUAKE)
-        if protocol_override is not None:
-            protocol = ProtocolOverride(protocol_override)
         self.cdtrack.write(stream)
-        for block in self.blocks:
-            block.write(stream, protocol)
+        write_blocks(stream, self.blocks, protocol_override)
 
     @staticmethod
     def parse(stream):
+        if not isinstance(stream, bindata.MemoryBuffer):
+            stream = bindata.MemoryBuffer(stream.read())
         cdtrack = CdTrack.parse(stream)
-        blocks = []
+        offsets = index_blocks(stream)
+        if not offsets:
+            return Demo(cdtrack, [])
+
+        # find the protocol changes up front so that the messages of every
+        # block can be decoded independently once they are needed. The scan
+        # may also match the bytes of strings, so only blocks that actually
+        # contain a ServerInfoMessage when decoded change the protocol
+        starts = [start for start, _, _ in offsets]
+        candidates = set()
+        for offset, _ in messages.ServerInfoMessage.scan(
+                stream.data, starts[0], offsets[-1][1]):
+            i = bisect.bisect_right(starts, offset) - 1
+            if offset < offsets[i][1]:
+                candidates.add(i)
+        protocol_changes = {}
         # assume plain netquake protocol by default (may be changed by
-        # ServerInfoMessage during parsing of blocks)
+        # ServerInfoMessage during parsing of blocks). The messages decoded
+        # to check this are kept for the blocks
+        protocol = Protocol(ProtocolVersion.NETQUAKE)
+        decoded = {}
+        for i in sorted(candidates):
+            start, end, _ = offsets[i]
+            protocol_after = Protocol(protocol.version, protocol.flags)
+            decoded[i] = parse_messages(stream.data, start, end, protocol_after)
+            if any(isinstance(m, messages.ServerInfoMessage) for m in decoded[i]):
+                protocol_changes[i] = protocol = protocol_after
+
+        blocks = []
         protocol = Protocol(ProtocolVersion.NETQUAKE)
-        while stream.read(1):
-            stream.seek(-1, 1)
-            blocks.append(Block.parse(stream, protocol))
+        for i, (start, end, viewangles) in enumerate(offsets):
+            protocol_after = protocol_changes.get(i, protocol)
+            source = (stream.data, start, end, protocol, protocol_after)
+            blocks.append(Block(viewangles, decoded.get(i), source))
+            protocol = protocol_after
         return Demo(cdtrack, blocks)
 
-    def get_precaches(self):
-        server_info_message = [m for b in self.blocks for m in b.messages
-                            if isinstance(m, messages.ServerInfoMessage)]
+    def _memoize(self, name: str, build, message_types):
+        # derived data stays valid until messages of the types it is built
+        # from are changed, or blocks are added or removed
+        entry = self._cache.get(name)
+        if (entry is not None and
+                self._tracker.last_change(message_types) <= entry[0]):
+            return entry[1]
+        version = self._tracker.version
+        value = build()
+        self._cache[name] = (version, value)
+        return value
+
+    def _build_message_index(self) -> dict:
+        # indices of the blocks that contain messages of a type, by type
+        index = {}
+        for i, block in enumerate(self.blocks):
+            for message_type in dict.fromkeys(map(type, block.iter_messages())):
+                index.setdefault(message_type, []).append(i)
+        return index
+
+    def find_blocks(self, message_type) -> list[int]:
+        """Sorted indices of the blocks that contain messages of the given type."""
+        index = self._memoize('message_index', self._build_message_index,
+                              message_type)
+        found = [indices for t, indices in index.items()
+                 if issubclass(t, message_type)]
+        if len(found) == 1:
+            return list(found[0])
+        return sorted(set().union(*found))
+
+    def iter_messages(self, message_type):
+        """Iterate (block index, message) of all messages of the given type.
+
+        Only blocks that contain such messages are visited. As for
+        Block.iter_messages, messages must not be modified unless the block is
+        marked as changed, and the blocks must not be changed while iterating.
+        """
+        blocks = self.blocks
+        for i in self.find_blocks(message_type):
+            for message in blocks[i].iter_messages(message_type):
+                yield i, message
+
+    def get_entity_table(self) -> EntityTable:
+        return self._memoize('entity_table', lambda: EntityTable.build(self.blocks),
+                             messages.EntityUpdateMessage)
+
+    def _get_precaches(self):
+        server_info_message = [m for _, m in
+                               self.iter_messages(messages.ServerInfoMessage)]
         assert len(server_info_message) == 1
         return (server_info_message[0].models_precache,
                 server_info_message[0].sounds_precache)
 
+    def get_precaches(self):
+        return self._memoize('precaches', self._get_precaches,
+                             messages.ServerInfoMessage)
+
+    def _get_viewent_num(self):
+        set_view_messages = [m for _, m in
+                             self.iter_messages(messages.SetViewMessage)]
+        assert len(set_view_messages) >= 1
+        viewent_num = set_view_messages[0].viewentity_id
+        assert all([m.viewentity_id == viewent_num for m in set_view_messages])
+        return viewent_num
+
+    def get_viewent_num(self):
+        return self._memoize('viewent_num', self._get_viewent_num,
+                             messages.SetViewMessage)
+
     def get_yaw(self):
-        yaw = numpy.array([block.viewangles.yaw for block in self.blocks])
-        for i in range(1, len(yaw)):
-            if abs((yaw[i] + 360.0) - yaw[i-1]) < abs(yaw[i] - yaw[i-1]):
-                yaw[i:] = yaw[i:] + 360.0
-            elif abs((yaw[i] - 360.0) - yaw[i-1]) < abs(yaw[i] - yaw[i-1]):
-                yaw[i:] = yaw[i:] - 360.0
-        return yaw
+        yaw = self._get_angle('yaw')
+        # unwrap by shifting everything after a jump of more than half a turn.
+        # the shift does not change the differences between the raw values, so
+        # all shifts are found at once and accumulated
+        previous, current = yaw[:-1], yaw[1:]
+        difference = numpy.abs(current - previous)
+        shift = numpy.zeros(len(yaw))
+        shift[1:] = numpy.where(
+            numpy.abs((current + 360.0) - previous) < difference, 360.0,
+            numpy.where(numpy.abs((current - 360.0) - previous) < difference,
+                        -360.0, 0.0))
+        return yaw + numpy.cumsum(shift)
 
     def get_pitch(self):
-        return numpy.array([block.viewangles.pitch for block in self.blocks])
+        return self._get_angle('pitch')
+
+    def _get_angle(self, name: str) -> numpy.ndarray:
+        # the attribute lookups of all blocks run in C, without a Python
+        # frame per block
+        return numpy.fromiter(map(operator.attrgetter(name),
+                                  map(_get_viewangles, self.blocks)),
+                              dtype=numpy.float64, count=len(self.blocks))
+
+    def _set_angle(self, name: str, values):
+        # converted to floats at once and assigned in C like _get_angle. the
+        # viewangles are written with the block headers and no derived data
+        # depends on them, so there is no change to record
+        collections.deque(map(setattr, map(_get_viewangles, self.blocks),
+                              itertools.repeat(name),
+                              numpy.asarray(values, dtype=numpy.float64).tolist()),
+                          maxlen=0)
+
+    def get_viewangles(self) -> numpy.ndarray:
+        # pitch, yaw and roll of every block as they are, without unwrapping
+        viewangles = numpy.fromiter(
+            (angle for block in self.blocks for angle in
+             (block.viewangles.pitch, block.viewangles.yaw, block.viewangles.roll)),
+            dtype=numpy.float64, count=3 * len(self.blocks))
+        return viewangles.reshape(-1, 3)
+
+    def _get_time_messages(self) -> tuple[numpy.ndarray, numpy.ndarray]:
+        # block indices and values of all time messages
+        indices = []
+        times = []
+        for i, message in self.iter_messages(messages.TimeMessage):
+            assert not indices or indices[-1] != i
+            indices.append(i)
+            times.append(message.time)
+        return (numpy.array(indices, dtype=numpy.int64),
+                numpy.array(times, dtype=numpy.float64))
+
+    def _build_time_index(self) -> tuple[numpy.ndarray, ...]:
+        indices, times = self._memoize('time_messages', self._get_time_messages,
+                                       messages.TimeMessage)
+        # blocks without time message keep the time of the previous one, or 0
+        # if there was none yet
+        previous = numpy.searchsorted(indices, numpy.arange(len(self.blocks)),
+                                      side='right')
+        time = numpy.concatenate(([0.0], times))[previous]
+        # time only goes back where a new level starts, e.g. in concatenated
+        # demos. adding up how far it went back gives a time that never
+        # decreases to search in, while pauses just repeat the same time
+        offset = numpy.zeros(len(time))
+        offset[1:] = numpy.cumsum(numpy.maximum(time[:-1] - time[1:], 0.0))
+        monotone = time + offset
+        for c in (time, offset, monotone):
+            c.flags.writeable = False
+        return time, offset, monotone
 
     def get_time(self):
-        previous_time = 0.0
-        times = numpy.zeros(len(self.blocks))
-        for i, block in enumerate(self.blocks):
-            new_times = [message.time for message in block.messages
-                         if isinstance(message, messages.TimeMessage)]
-            if new_times:
-                assert len(new_times) == 1
-                times[i] = new_times[0]
-                previous_time = times[i]
-            else:
-                times[i] = previous_time
-        return times
+        time, _, _ = self._memoize('time_index', self._build_time_index,
+                                   messages.TimeMessage)
+        return time.copy()
+
+    def block_at_time(self, time: float, level_of: int = 0) -> int:
+        """Index of the first block at the given time or later.
+
+        Only the level that the block at index level_of belongs to is
+        searched, its end is returned if the time is not reached in it.
+        """
+        return self.blocks_between(time, math.inf, level_of).start
+
+    def blocks_between(self, time_start: float, time_end: float,
+                       level_of: int = 0) -> range:
+        """Indices of the blocks with time_start <= time <= time_end.
+
+        As for block_at_time, only the level of the block at level_of is
+        searched.
+        """
+        _, offset, monotone = self._memoize('time_index', self._build_time_index,
+                                            messages.TimeMessage)
+        if not len(monotone):
+            return range(0)
+        # offset is the same within a level and grows from one to the next
+        begin = int(numpy.searchsorted(offset, offset[level_of], side='left'))
+        end = int(numpy.searchsorted(offset, offset[level_of], side='right'))
+        level = monotone[begin:end]
+        first = numpy.searchsorted(level, time_start + offset[level_of], side='left')
+        last = numpy.searchsorted(level, time_end + offset[level_of], side='right')
+        return range(begin + int(first), begin + int(max(first, last)))
+
+    def block_at_exact_time(self, time: float) -> int | None:
+        """Index of the first block at exactly the given time in any level.
+
+        None if no block has the time. Each level is searched on its own, only
+        the first block at the time or later in it can match.
+        """
+        time_values, offset, monotone = self._memoize(
+            'time_index', self._build_time_index, messages.TimeMessage)
+        begin = 0
+        while begin < len(offset):
+            end = int(numpy.searchsorted(offset, offset[begin], side='right'))
+            i = begin + int(numpy.searchsorted(monotone[begin:end],
+                                               time + offset[begin], side='left'))
+            if i < end and time_values[i] == time:
+                return i
+            begin = end
+        return None
 
     def get_previous_block_index_with_time_message(self, block_index):
-        offsets = (i for i, block in enumerate(reversed(self.blocks[:block_index]))
-                   if any(isinstance(m, messages.TimeMessage) for m in block.messages))
-        return block_index - 1 - next(offsets, 0)
+        indices = self.find_blocks(messages.TimeMessage)
+        previous = bisect.bisect_left(indices, block_index) - 1
+        return indices[previous] if previous >= 0 else block_index - 1
 
     def get_fixangle_indices(self):
-        indices = []
-        for i, block in enumerate(self.blocks):
-            for message in block.messages:
-                if isinstance(message, messages.SetAngleMessage):
-                    indices.append(i)
-                    break
-        return indices
+        return self.find_blocks(messages.SetAngleMessage)
+
+    def _get_client_stats(self):
+        client_stats = [None] * len(self.blocks)
+        for i, m in self.iter_messages(messages.ClientDataMessage):
+            assert client_stats[i] is None
+            client_stats[i] = (m.items, m.health, m.armor, m.shells, m.nails,
+                               m.rockets, m.cells, m.activeweapon, m.ammo,
+                               m.weapon, m.weaponframe)
+        return client_stats
 
     def get_client_stats(self):
-        client_stats = []
-        for block in self.blocks:
-            clientdata_messages = [message for message in block.messages
-                                   if isinstance(message, messages.ClientDataMessage)]
-            if clientdata_messages:
-                assert len(clientdata_messages) == 1
-                client_stats.append(ClientStats(
-                    clientdata_messages[0].items,
-                    clientdata_messages[0].health,
-                    clientdata_messages[0].armor,
-                    clientdata_messages[0].shells,
-                    clientdata_messages[0].nails,
-                    clientdata_messages[0].rockets,
-                    clientdata_messages[0].cells,
-                    clientdata_messages[0].activeweapon,
-                    clientdata_messages[0].ammo,
-                    clientdata_messages[0].weapon,
-                    clientdata_messages[0].weaponframe
-                    ))
-            else:
-                client_stats.append(None)
-        return client_stats
+        # the stats may be changed by the caller, so only their values are
+        # cached
+        client_stats = self._memoize('client_stats', self._get_client_stats,
+                                     messages.ClientDataMessage)
+        return [ClientStats(*values) if values else None
+                for values in client_stats]
 
     def get_final_client_stats(self):
         return next(s for s in reversed(self.get_client_stats()) if s)
 
     def set_client_stats(self, client_stats_list):
         for block, client_stats in zip(self.blocks, client_stats_list):
-            for m in block.messages:
-                if not isinstance(m, messages.ClientDataMessage):
-                    continue
+            for m in block.iter_messages(messages.ClientDataMessage):
+                block.mark_changed(messages.ClientDataMessage)
                 m.items = client_stats.items
                 m.health = client_stats.health
                 m.armor = client_stats.armor
@@ -210,9 +780,7 @@ class Demo:
                 m.weaponframe = client_stats.weaponframe
 
     def set_yaw(self, yaw):
-        for i, block in enumerate(self.blocks):
-            block.viewangles.yaw = yaw[i]
+        self._set_angle('yaw', yaw)
 
     def set_pitch(self, pitch):
-        for i, block in enumerate(self.blocks):
-            block.viewangles.pitch = pitch[i]
+        self._set_angle('pitch', pitch)
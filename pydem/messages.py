@@ -1,8 +1,12 @@
+import array
 import dataclasses
 import enum
+import functools
 import math
+import re
 
 from . import bindata
+from . import schema
 
 
 class ProtocolVersion(enum.IntEnum):
@@ -23,19 +27,144 @@ class ProtocolFlags:
     PRFL_INT32COORD = (1 << 7)
 
 
+# coords and angles are stored compactly as doubles instead of lists of separate
+# float objects, which matters with millions of messages in memory
+Vector = array.array
+
+def vector(values=(0.0, 0.0, 0.0)) -> Vector:
+    return array.array('d', values)
+
+
+class FloatCodec:
+    """Coords or angles stored as plain floats."""
+    format = 'f'
+    # expressions for generated code, decoding from the unpacked values {0}
+    # and encoding {v} into values for packing
+    decode_code = '{0}'
+    encode_code = '{v}'
+
+    def read(self, stream) -> float:
+        return bindata.read_f32(stream)
+
+    def write(self, stream, value: float):
+        bindata.write_f32(stream, value)
+
+    def read_n(self, stream, n: int) -> Vector:
+        return array.array('d', bindata.read_struct(stream, bindata.codec_n('f', n)))
+
+    def write_n(self, stream, values: Vector):
+        bindata.write_struct(stream, bindata.codec_n('f', len(values)), *values)
+
+class ScaledCodec:
+    """Coords or angles stored as integer multiples of a step."""
+    def __init__(self, format: str, step: float):
+        self.format = format
+        self.step = step
+        self.layout = bindata.codec(format)
+        self.decode_code = f'{{0}} * {step!r}'
+        self.encode_code = f'round({{v}} / {step!r})'
+
+    def read(self, stream) -> float:
+        return bindata.read_struct(stream, self.layout)[0] * self.step
+
+    def write(self, stream, value: float):
+        bindata.write_struct(stream, self.layout, round(value / self.step))
+
+    def read_n(self, stream, n: int) -> Vector:
+        step = self.step
+        return array.array('d', [x * step for x in
+            bindata.read_struct(stream, bindata.codec_n(self.format, n))])
+
+    def write_n(self, stream, values: Vector):
+        step = self.step
+        bindata.write_struct(stream, bindata.codec_n(self.format, len(values)),
+                             *[round(value / step) for value in values])
+
+def split_coord24(value: float) -> tuple[int, int]:
+    frac_part, int_part = math.modf(value)
+    return int(int_part), round(frac_part * 255.0)
+
+class Coord24Codec:
+    """Coords stored as 16 bit integer part and 8 bit fraction."""
+    format = 'hb'
+    decode_code = '{0} + {1} * (1.0/255.0)'
+    encode_code = '*split_coord24({v})'
+
+    def read(self, stream) -> float:
+        int_part, frac_part = bindata.read_struct(stream, bindata.codec_n('hb', 1))
+        return int_part + frac_part * (1.0/255.0)
+
+    def write(self, stream, value: float):
+        bindata.write_struct(stream, bindata.codec_n('hb', 1), *split_coord24(value))
+
+    def read_n(self, stream, n: int) -> Vector:
+        values = bindata.read_struct(stream, bindata.codec_n('hb', n))
+        return array.array('d', [i + f * (1.0/255.0)
+                                 for i, f in zip(values[::2], values[1::2])])
+
+    def write_n(self, stream, values: Vector):
+        bindata.write_struct(stream, bindata.codec_n('hb', len(values)),
+                             *[x for value in values for x in split_coord24(value)])
+
+FLOAT_CODEC = FloatCodec()
+INT32_COORD_CODEC = ScaledCodec('i', 1.0/16.0)
+COORD24_CODEC = Coord24Codec()
+SHORT_COORD_CODEC = ScaledCodec('h', 1.0/8.0)
+SHORT_ANGLE_CODEC = ScaledCodec('h', 360.0/65536.0)
+BYTE_ANGLE_CODEC = ScaledCodec('b', 360.0/256.0)
+
+def coord_codec(protocol_flags: int):
+    if protocol_flags & ProtocolFlags.PRFL_FLOATCOORD:
+        return FLOAT_CODEC
+    elif protocol_flags & ProtocolFlags.PRFL_INT32COORD:
+        return INT32_COORD_CODEC
+    elif protocol_flags & ProtocolFlags.PRFL_24BITCOORD:
+        return COORD24_CODEC
+    else:
+        return SHORT_COORD_CODEC
+
+def angle_codec(protocol_flags: int):
+    if protocol_flags & ProtocolFlags.PRFL_FLOATANGLE:
+        return FLOAT_CODEC
+    elif protocol_flags & ProtocolFlags.PRFL_SHORTANGLE:
+        return SHORT_ANGLE_CODEC
+    else:
+        return BYTE_ANGLE_CODEC
+
+
 @dataclasses.dataclass
 class Protocol:
     version: ProtocolVersion
     flags: int = 0
+    # codecs for the current flags, so they do not need to be tested for
+    # every single coord and angle
+    coord: object = dataclasses.field(init=False, repr=False, compare=False)
+    angle: object = dataclasses.field(init=False, repr=False, compare=False)
 
     def __post_init__(self):
         if self.version != ProtocolVersion.RMQ and self.flags != 0:
             raise ValueError("Protocol flags are only supported for protocol "
                              "version RMQ (999)!")
+        self.bind_codecs()
+
+    def bind_codecs(self):
+        self.coord = coord_codec(self.flags)
+        self.angle = angle_codec(self.flags)
+
+    def __getstate__(self):
+        # codecs are not copied, but bound again for the flags
+        state = self.__dict__.copy()
+        del state['coord'], state['angle']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.bind_codecs()
 
     def change(self, other):
         self.version = other.version
         self.flags = other.flags
+        self.bind_codecs()
 
     def write(self, stream):
         bindata.write_u32(stream, self.version)
@@ -58,142 +187,63 @@ class ProtocolOverride(Protocol):
         pass  # overriding protocol cannot be changed
 
 
-def read_coord(protocol_flags: int, stream) -> float:
-    if protocol_flags & ProtocolFlags.PRFL_FLOATCOORD:
-        return bindata.read_f32(stream)
-    elif protocol_flags & ProtocolFlags.PRFL_INT32COORD:
-        return bindata.read_i32(stream) * (1.0/16.0)
-    elif protocol_flags & ProtocolFlags.PRFL_24BITCOORD:
-        return bindata.read_i16(stream) + bindata.read_i8(stream) * (1.0/255.0)
-    else:
-        return bindata.read_i16(stream) * (1.0/8.0)
-
-def write_coord(protocol_flags: int, stream, value: float):
-    if protocol_flags & ProtocolFlags.PRFL_FLOATCOORD:
-        bindata.write_f32(stream, value)
-    elif protocol_flags & ProtocolFlags.PRFL_INT32COORD:
-        bindata.write_i32(stream, round(value * 16.0))
-    elif protocol_flags & ProtocolFlags.PRFL_24BITCOORD:
-        frac_part, int_part = math.modf(value) 
-        bindata.write_i16(stream, int(int_part))
-        bindata.write_i8(stream, round(frac_part * 255.0))
-    else:
-        bindata.write_i16(stream, round(value * 8.0))
+def read_coords_angles(protocol: Protocol, stream, n: int):
+    # coords and angles alternating, as used by the baselines
+    origin = vector(bytes(8 * n))
+    angles = vector(bytes(8 * n))
+    for i in range(n):
+        origin[i] = protocol.coord.read(stream)
+        angles[i] = protocol.angle.read(stream)
+    return origin, angles
 
-def read_coord_n(protocol_flags: int, stream, n: int):
-    return [read_coord(protocol_flags, stream) for _ in range(n)]
+def write_coords_angles(protocol: Protocol, stream, origin: Vector,
+                        angles: Vector):
+    for coord, angle in zip(origin, angles):
+        protocol.coord.write(stream, coord)
+        protocol.angle.write(stream, angle)
 
-def write_coord_n(protocol_flags: int, stream, values: list[float]):
-    for value in values:
-        write_coord(protocol_flags, stream, value)
 
-def read_angle(protocol_flags: int, stream) -> float:
-    if protocol_flags & ProtocolFlags.PRFL_FLOATANGLE:
-        return bindata.read_f32(stream)
-    elif protocol_flags & ProtocolFlags.PRFL_SHORTANGLE:
-        return bindata.read_i16(stream) * (360.0/65536.0)
-    else:
-        return bindata.read_i8(stream) * (360.0/256.0)
-
-def write_angle(protocol_flags: int, stream, value: float):
-    if protocol_flags & ProtocolFlags.PRFL_FLOATANGLE:
-        bindata.write_f32(stream, value)
-    elif protocol_flags & ProtocolFlags.PRFL_SHORTANGLE:
-        bindata.write_i16(stream, round(value / (360.0/65536.0)))
-    else:
-        bindata.write_i8(stream, round(value / (360.0/256.0)))
-
-def read_angle_n(protocol_flags: int, stream, n: int):
-    return [read_angle(protocol_flags, stream) for _ in range(n)]
-
-def write_angle_n(protocol_flags: int, stream, values: list[float]):
-    for value in values:
-        write_angle(protocol_flags, stream, value)
-
-
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class BadMessage:
     ID = 0
 
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return BadMessage()
-
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class NopMessage:
     ID = 1
 
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return NopMessage()
-
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class DisconnectMessage:
     ID = 2
 
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return DisconnectMessage()
 
-
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class UpdateStatMessage:
     ID = 3
 
-    stat_id: int
-    stat_value: int
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_u8(stream, self.stat_id)
-        bindata.write_i32(stream, self.stat_value)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        stat_id = bindata.read_u8(stream)
-        stat_value = bindata.read_i32(stream)
-        return UpdateStatMessage(stat_id, stat_value)
+    stat_id: int = schema.fixed('B')
+    stat_value: int = schema.fixed('i')
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class VersionMessage:
     ID = 4
 
-    protocol: int
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_i32(stream, self.protocol)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return VersionMessage(protocol=bindata.read_i32(stream))
+    protocol: int = schema.fixed('i')
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class SetViewMessage:
     ID = 5
 
-    viewentity_id: int
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_i16(stream, self.viewentity_id)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return SetViewMessage(viewentity_id=bindata.read_i16(stream))
+    viewentity_id: int = schema.fixed('h')
 
 
 class SoundFlags(enum.IntFlag):
@@ -204,7 +254,7 @@ class SoundFlags(enum.IntFlag):
     LARGEENTITY	= (1<<3)
     LARGESOUND = (1<<4)
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class SoundMessage:
     ID = 6
     DEFAULT_SOUND_PACKET_VOLUME = 255
@@ -216,7 +266,7 @@ class SoundMessage:
     ent: int
     channel: int
     sound_num: int
-    pos: list[float]
+    pos: Vector
 
     def write(self, stream, protocol: Protocol):
         bindata.write_u8(stream, self.ID)
@@ -238,7 +288,7 @@ class SoundMessage:
         else:
             bindata.write_u8(stream, self.sound_num)
 
-        write_coord_n(protocol.flags, stream, self.pos)
+        protocol.coord.write_n(stream, self.pos)
 
     @staticmethod
     def parse(stream, protocol: Protocol):
@@ -259,77 +309,54 @@ class SoundMessage:
         else:
             sound_num = bindata.read_u8(stream)
 
-        pos = read_coord_n(protocol.flags, stream, 3)
+        pos = protocol.coord.read_n(stream, 3)
 
         return SoundMessage(flags, volume, attenuation, ent, channel, sound_num, pos)
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class TimeMessage:
     ID = 7
 
-    time: float
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_f32(stream, self.time)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return TimeMessage(time=bindata.read_f32(stream))
+    time: float = schema.fixed('f')
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class PrintMessage:
     ID = 8
 
-    text: str
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_c_str(stream, self.text)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return PrintMessage(text=bindata.read_c_str(stream))
+    text: str = schema.text()
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class StuffTextMessage:
     ID = 9
 
-    text: str
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_c_str(stream, self.text)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return StuffTextMessage(text=bindata.read_c_str(stream))
+    text: str = schema.text()
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class SetAngleMessage:
     ID = 10
 
-    yaw: float
-    roll: float
-    pitch: float
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        write_angle_n(protocol.flags, stream, [self.yaw, self.roll, self.pitch])
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        yaw, roll, pitch = read_angle_n(protocol.flags, stream, 3)
-        return SetAngleMessage(yaw, roll, pitch)
+    yaw: float = schema.angle()
+    roll: float = schema.angle()
+    pitch: float = schema.angle()
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class ServerInfoMessage:
     ID = 11
+    LAYOUT = bindata.codec('BB')
+    # id byte, protocol, max_clients, gametype, levelname and the world model,
+    # which is always the first model precache. Specific enough to find the
+    # message in data that has not been decoded.
+    SIGNATURE = re.compile(
+        rb'\x0b(\x0f\0\0\0|\x9a\x02\0\0|\xe7\x03\0\0.{4})..[^\0]*\0maps/', re.DOTALL)
 
     protocol: Protocol
     max_clients: int
@@ -342,8 +369,7 @@ class ServerInfoMessage:
         protocol.change(self.protocol)
         bindata.write_u8(stream, self.ID)
         protocol.write(stream)
-        bindata.write_u8(stream, self.max_clients)
-        bindata.write_u8(stream, self.gametype)
+        bindata.write_struct(stream, self.LAYOUT, self.max_clients, self.gametype)
         bindata.write_c_str(stream, self.levelname)
 
         for s in self.models_precache[1:]:
@@ -358,8 +384,7 @@ class ServerInfoMessage:
     def parse(stream, protocol: Protocol):
         parsed_proto = Protocol.parse(stream)
         protocol.change(parsed_proto)  # overwrite the protocol with ServerInfo
-        max_clients = bindata.read_u8(stream)
-        gametype = bindata.read_u8(stream)
+        max_clients, gametype = bindata.read_struct(stream, ServerInfoMessage.LAYOUT)
         levelname = bindata.read_c_str(stream)
 
         models_precache = [b'']
@@ -377,59 +402,39 @@ class ServerInfoMessage:
         return ServerInfoMessage(parsed_proto, max_clients, gametype, levelname,
                                  models_precache, sounds_precache)
 
+    @staticmethod
+    def scan(buffer, start: int, end: int):
+        """Yield offset and protocol of each ServerInfoMessage in raw data."""
+        for match in ServerInfoMessage.SIGNATURE.finditer(buffer, start, end):
+            protocol = Protocol.parse(bindata.MemoryBuffer(match.group(1)))
+            yield match.start(), protocol
 
-@dataclasses.dataclass
+
+@schema.message
+@dataclasses.dataclass(slots=True)
 class LightstyleMessage:
     ID = 12
 
-    index: int
-    map: str
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_u8(stream, self.index)
-        bindata.write_c_str(stream, self.map)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return LightstyleMessage(index=bindata.read_u8(stream),
-                                 map=bindata.read_c_str(stream))
+    index: int = schema.fixed('B')
+    map: str = schema.text()
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class UpdateNameMessage:
     ID = 13
 
-    player_id: int
-    name: str
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_u8(stream, self.player_id)
-        bindata.write_c_str(stream, self.name)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return UpdateNameMessage(player_id=bindata.read_u8(stream),
-                                 name=bindata.read_c_str(stream))
+    player_id: int = schema.fixed('B')
+    name: str = schema.text()
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class UpdateFragsMessage:
     ID = 14
 
-    player_id: int
-    frags: int
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_u8(stream, self.player_id)
-        bindata.write_i16(stream, self.frags)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return UpdateFragsMessage(player_id=bindata.read_u8(stream),
-                                  frags=bindata.read_i16(stream))
+    player_id: int = schema.fixed('B')
+    frags: int = schema.fixed('h')
 
 
 class ServerUpdateFlags(enum.IntFlag):
@@ -499,16 +504,17 @@ class ItemFlags(enum.IntFlag):
     # activeweapon, and only by comparing for exact equality
     AXE_ACTIVEWEAPON = 0
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class ClientDataMessage:
     ID = 15
     DEFAULT_VIEWHEIGHT = 22.0
+    LAYOUT = bindata.codec('hBBBBBB')
 
     flags: ServerUpdateFlags
     viewheight: float
     idealpitch: float
-    punchangle: list[float]
-    velocity: list[float]
+    punchangle: Vector
+    velocity: Vector
     items: ItemFlags
     weaponframe: int
     armor: int
@@ -542,15 +548,15 @@ class ClientDataMessage:
             bindata.write_i8(stream, self.idealpitch)
 
         if self.flags & ServerUpdateFlags.PUNCH1:
-            bindata.write_i8(stream, self.punchangle[0])
+            bindata.write_i8(stream, round(self.punchangle[0]))
         if self.flags & ServerUpdateFlags.VELOCITY1:
             bindata.write_i8(stream, round(self.velocity[0] / 16.0))
         if self.flags & ServerUpdateFlags.PUNCH2:
-            bindata.write_i8(stream, self.punchangle[1])
+            bindata.write_i8(stream, round(self.punchangle[1]))
         if self.flags & ServerUpdateFlags.VELOCITY2:
             bindata.write_i8(stream, round(self.velocity[1] / 16.0))
         if self.flags & ServerUpdateFlags.PUNCH3:
-            bindata.write_i8(stream, self.punchangle[2])
+            bindata.write_i8(stream, round(self.punchangle[2]))
         if self.flags & ServerUpdateFlags.VELOCITY3:
             bindata.write_i8(stream, round(self.velocity[2] / 16.0))
 
@@ -561,13 +567,9 @@ class ClientDataMessage:
             bindata.write_u8(stream, self.armor & 0x00ff)
         if self.flags & ServerUpdateFlags.WEAPON:
             bindata.write_u8(stream, self.weapon & 0x00ff)
-        bindata.write_i16(stream, self.health)
-        bindata.write_u8(stream, self.ammo & 0x00ff)
-        bindata.write_u8(stream, self.shells & 0x00ff)
-        bindata.write_u8(stream, self.nails & 0x00ff)
-        bindata.write_u8(stream, self.rockets & 0x00ff)
-        bindata.write_u8(stream, self.cells & 0x00ff)
-        bindata.write_u8(stream, self.activeweapon)
+        bindata.write_struct(stream, self.LAYOUT, self.health,
+            self.ammo & 0x00ff, self.shells & 0x00ff, self.nails & 0x00ff,
+            self.rockets & 0x00ff, self.cells & 0x00ff, self.activeweapon)
 
         if self.flags & ServerUpdateFlags.WEAPON2:
             bindata.write_u8(stream, self.weapon >> 8)
@@ -600,8 +602,8 @@ class ClientDataMessage:
         viewheight = bindata.read_i8(stream) if (flags & ServerUpdateFlags.VIEWHEIGHT) else ClientDataMessage.DEFAULT_VIEWHEIGHT
         idealpitch = bindata.read_i8(stream) if (flags & ServerUpdateFlags.IDEALPITCH) else 0.0
 
-        punchangle = [0.0, 0.0, 0.0]
-        velocity = [0.0, 0.0, 0.0]
+        punchangle = vector()
+        velocity = vector()
         if flags & ServerUpdateFlags.PUNCH1:
             punchangle[0] = bindata.read_i8(stream)
         if flags & ServerUpdateFlags.VELOCITY1:
@@ -619,13 +621,9 @@ class ClientDataMessage:
         weaponframe = bindata.read_u8(stream) if (flags & ServerUpdateFlags.WEAPONFRAME) else 0
         armor = bindata.read_u8(stream) if (flags & ServerUpdateFlags.ARMOR) else 0
         weapon = bindata.read_u8(stream) if (flags & ServerUpdateFlags.WEAPON) else 0
-        health = bindata.read_i16(stream)
-        ammo = bindata.read_u8(stream)
-        shells = bindata.read_u8(stream)
-        nails = bindata.read_u8(stream)
-        rockets = bindata.read_u8(stream)
-        cells = bindata.read_u8(stream)
-        activeweapon = ItemFlags(bindata.read_u8(stream))
+        health, ammo, shells, nails, rockets, cells, activeweapon = \
+            bindata.read_struct(stream, ClientDataMessage.LAYOUT)
+        activeweapon = ItemFlags(activeweapon)
 
         if flags & ServerUpdateFlags.WEAPON2:
             weapon += bindata.read_u8(stream) << 8
@@ -651,82 +649,42 @@ class ClientDataMessage:
             nails, rockets, cells, activeweapon, weaponalpha)
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class StopSoundMessage:
     ID = 16
 
-    data: int
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_i16(stream, self.data)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return StopSoundMessage(data=bindata.read_i16(stream))
+    data: int = schema.fixed('h')
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class UpdateColorsMessage:
     ID = 17
 
-    player_id: int
-    color: int
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_u8(stream, self.player_id)
-        bindata.write_u8(stream, self.color)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return UpdateColorsMessage(player_id=bindata.read_u8(stream),
-                                   color=bindata.read_u8(stream))
+    player_id: int = schema.fixed('B')
+    color: int = schema.fixed('B')
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class ParticleMessage:
     ID = 18
 
-    origin: list[float]
-    direction: list[int]
-    count: int
-    color: int
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        write_coord_n(protocol.flags, stream, self.origin)
-        bindata.write_i8_n(stream, self.direction)
-        bindata.write_u8(stream, self.count)
-        bindata.write_u8(stream, self.color)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return ParticleMessage(
-            origin=read_coord_n(protocol.flags, stream, 3),
-            direction=bindata.read_i8_n(stream, 3),
-            count=bindata.read_u8(stream), color=bindata.read_u8(stream))
+    origin: Vector = schema.coords()
+    direction: list[int] = schema.fixed('b', count=3)
+    count: int = schema.fixed('B')
+    color: int = schema.fixed('B')
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class DamageMessage:
     ID = 19
 
-    armor: int
-    blood: int
-    from_coords: list[float]
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_u8(stream, self.armor)
-        bindata.write_u8(stream, self.blood % 256)
-        write_coord_n(protocol.flags, stream, self.from_coords)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return DamageMessage(
-            armor=bindata.read_u8(stream), blood=bindata.read_u8(stream),
-            from_coords=read_coord_n(protocol.flags, stream, 3))
+    armor: int = schema.fixed('B')
+    blood: int = schema.fixed('B', mask=0xff)
+    from_coords: Vector = schema.coords()
 
 
 class BaselineFlags(enum.IntFlag):
@@ -736,226 +694,64 @@ class BaselineFlags(enum.IntFlag):
     SCALE = (1<<3)
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class SpawnStaticMessage:
     ID = 20
 
-    modelindex: int
-    frame: int
-    colormap: int
-    skin: int
-    origin: list[float]
-    angles: list[float]
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_u8(stream, self.modelindex)
-        bindata.write_u8(stream, self.frame)
-        bindata.write_u8(stream, self.colormap)
-        bindata.write_u8(stream, self.skin)
-        write_coord_n(protocol.flags, stream, self.origin)
-        write_angle_n(protocol.flags, stream, self.angles)
+    modelindex: int = schema.fixed('B')
+    frame: int = schema.fixed('B')
+    colormap: int = schema.fixed('B')
+    skin: int = schema.fixed('B')
+    origin: Vector = schema.coords()
+    angles: Vector = schema.angles()
 
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return SpawnStaticMessage(
-            modelindex=bindata.read_u8(stream),
-            frame=bindata.read_u8(stream),
-            colormap=bindata.read_u8(stream),
-            skin=bindata.read_u8(stream),
-            origin=read_coord_n(protocol.flags, stream, 3),
-            angles=read_angle_n(protocol.flags, stream, 3))
 
-
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class SpawnStatic2Message:
     ID = 43
 
-    flags: BaselineFlags
-    modelindex: int
-    frame: int
-    colormap: int
-    skin: int
-    origin: list[float]
-    angles: list[float]
-    alpha: int | None
-    scale: int | None
+    flags: BaselineFlags = schema.fixed('B', wrap=BaselineFlags)
+    modelindex: int = schema.fixed('B', wide=(BaselineFlags.LARGEMODEL, 'h'))
+    frame: int = schema.fixed('B', wide=(BaselineFlags.LARGEFRAME, 'h'))
+    colormap: int = schema.fixed('B')
+    skin: int = schema.fixed('B')
+    origin: Vector = schema.coords()
+    angles: Vector = schema.angles()
+    alpha: int | None = schema.fixed('B', when=BaselineFlags.ALPHA)
+    scale: int | None = schema.fixed('B', when=BaselineFlags.SCALE)
 
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_u8(stream, self.flags)
-
-        if self.flags & BaselineFlags.LARGEMODEL:
-            bindata.write_i16(stream, self.modelindex)
-        else:
-            bindata.write_u8(stream, self.modelindex)
-
-        if self.flags & BaselineFlags.LARGEFRAME:
-            bindata.write_i16(stream, self.frame)
-        else:
-            bindata.write_u8(stream, self.frame)
-        bindata.write_u8(stream, self.colormap)
-        bindata.write_u8(stream, self.skin)
-        write_coord_n(protocol.flags, stream, self.origin)
-        write_angle_n(protocol.flags, stream, self.angles)
-        if self.flags & BaselineFlags.ALPHA:
-            bindata.write_u8(stream, self.alpha)
-        if self.flags & BaselineFlags.SCALE:
-            bindata.write_u8(stream, self.scale)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        flags = BaselineFlags(bindata.read_u8(stream))
-
-        if flags & BaselineFlags.LARGEMODEL:
-            modelindex = bindata.read_i16(stream)
-        else:
-            modelindex = bindata.read_u8(stream)
 
-        if flags & BaselineFlags.LARGEFRAME:
-            frame = bindata.read_i16(stream)
-        else:
-            frame = bindata.read_u8(stream)
-
-        colormap = bindata.read_u8(stream)
-        skin = bindata.read_u8(stream)
-        origin = read_coord_n(protocol.flags, stream, 3)
-        angles = read_angle_n(protocol.flags, stream, 3)
-
-        if flags & BaselineFlags.ALPHA:
-            alpha = bindata.read_u8(stream)
-        else:
-            alpha = None
-
-        if flags & BaselineFlags.SCALE:
-            scale = bindata.read_u8(stream)
-        else:
-            scale = None
-
-        return SpawnStatic2Message(
-            flags=flags,
-            modelindex=modelindex,
-            frame=frame,
-            colormap=colormap,
-            skin=skin,
-            origin=origin,
-            angles=angles,
-            alpha=alpha,
-            scale=scale
-        )
-
-
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class SpawnBaselineMessage:
     ID = 22
 
-    entity_num: int
-    modelindex: int
-    frame: int
-    colormap: int
-    skin: int
-    origin: list[float]
-    angles: list[float]
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_i16(stream, self.entity_num)
-        bindata.write_u8(stream, self.modelindex)
-        bindata.write_u8(stream, self.frame)
-        bindata.write_u8(stream, self.colormap)
-        bindata.write_u8(stream, self.skin)
-        for i in range(3):
-            write_coord(protocol.flags, stream, self.origin[i])
-            write_angle(protocol.flags, stream, self.angles[i])
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        entity_num = bindata.read_i16(stream)
-        modelindex=bindata.read_u8(stream)
-        frame = bindata.read_u8(stream)
-        colormap = bindata.read_u8(stream)
-        skin = bindata.read_u8(stream)
-        origin = [None, None, None]
-        angles = [None, None, None]
-        for i in range(3):
-            origin[i] = read_coord(protocol.flags, stream)
-            angles[i] = read_angle(protocol.flags, stream)
-        return SpawnBaselineMessage(entity_num, modelindex, frame, colormap,
-            skin, origin, angles)
+    entity_num: int = schema.fixed('h')
+    modelindex: int = schema.fixed('B')
+    frame: int = schema.fixed('B')
+    colormap: int = schema.fixed('B')
+    skin: int = schema.fixed('B')
+    origin: Vector = schema.coords_angles()
+    angles: Vector = schema.paired()
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class SpawnBaseline2Message:
     ID = 42
 
-    entity_num: int
-    flags: BaselineFlags
-    modelindex: int
-    frame: int
-    colormap: int
-    skin: int
-    origin: list[float]
-    angles: list[float]
-    alpha: int | None
-    scale: int | None
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_i16(stream, self.entity_num)
-        bindata.write_u8(stream, self.flags)
-        if self.flags & BaselineFlags.LARGEMODEL:
-            bindata.write_i16(stream, self.modelindex)
-        else:
-            bindata.write_u8(stream, self.modelindex)
-
-        if self.flags & BaselineFlags.LARGEFRAME:
-            bindata.write_i16(stream, self.frame)
-        else:
-            bindata.write_u8(stream, self.frame)
-        bindata.write_u8(stream, self.colormap)
-        bindata.write_u8(stream, self.skin)
-        for i in range(3):
-            write_coord(protocol.flags, stream, self.origin[i])
-            write_angle(protocol.flags, stream, self.angles[i])
-        if self.flags & BaselineFlags.ALPHA:
-            bindata.write_u8(stream, self.alpha)
-        if self.flags & BaselineFlags.SCALE:
-            bindata.write_u8(stream, self.scale)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        entity_num = bindata.read_i16(stream)
-        flags = BaselineFlags(bindata.read_u8(stream))
-        if flags & BaselineFlags.LARGEMODEL:
-            modelindex = bindata.read_i16(stream)
-        else:
-            modelindex = bindata.read_u8(stream)
-
-        if flags & BaselineFlags.LARGEFRAME:
-            frame = bindata.read_i16(stream)
-        else:
-            frame = bindata.read_u8(stream)
-
-        colormap = bindata.read_u8(stream)
-        skin = bindata.read_u8(stream)
-        origin = [None, None, None]
-        angles = [None, None, None]
-        for i in range(3):
-            origin[i] = read_coord(protocol.flags, stream)
-            angles[i] = read_angle(protocol.flags, stream)
-
-        if flags & BaselineFlags.ALPHA:
-            alpha = bindata.read_u8(stream)
-        else:
-            alpha = None
-
-        if flags & BaselineFlags.SCALE:
-            scale = bindata.read_u8(stream)
-        else:
-            scale = None
-
-        return SpawnBaseline2Message(entity_num, flags, modelindex, frame,
-            colormap, skin, origin, angles, alpha, scale)
+    entity_num: int = schema.fixed('h')
+    flags: BaselineFlags = schema.fixed('B', wrap=BaselineFlags)
+    modelindex: int = schema.fixed('B', wide=(BaselineFlags.LARGEMODEL, 'h'))
+    frame: int = schema.fixed('B', wide=(BaselineFlags.LARGEFRAME, 'h'))
+    colormap: int = schema.fixed('B')
+    skin: int = schema.fixed('B')
+    origin: Vector = schema.coords_angles()
+    angles: Vector = schema.paired()
+    alpha: int | None = schema.fixed('B', when=BaselineFlags.ALPHA)
+    scale: int | None = schema.fixed('B', when=BaselineFlags.SCALE)
 
 
 class TempEntityType(enum.IntEnum):
@@ -976,83 +772,46 @@ class TempEntityType(enum.IntEnum):
     EXPLOSION3 = 16
     LIGHTNING4 = 17
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class TempEntityPosition:
-    pos: list[float]
+    pos: Vector = schema.coords()
 
-    def write(self, stream, protocol: Protocol):
-        write_coord_n(protocol.flags, stream, self.pos)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return TempEntityPosition(
-            pos=read_coord_n(protocol.flags, stream, 3))
-
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class TempEntityPositionColormap:
-    pos: list[float]
-    color_start: int
-    color_end: int
+    pos: Vector = schema.coords()
+    color_start: int = schema.fixed('B')
+    color_end: int = schema.fixed('B')
 
-    def write(self, stream, protocol: Protocol):
-        write_coord_n(protocol.flags, stream, self.pos)
-        bindata.write_u8(stream, self.color_start)
-        bindata.write_u8(stream, self.color_end)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return TempEntityPositionColormap(
-            pos=read_coord_n(protocol.flags, stream, 3),
-            color_start=bindata.read_u8(stream),
-            color_end=bindata.read_u8(stream))
-
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class TempEntityPositionColor:
-    pos: list[float]
-    color: list[float]
-
-    def write(self, stream, protocol: Protocol):
-        write_coord_n(protocol.flags, stream, self.pos)
-        write_coord_n(protocol.flags, stream, self.color)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return TempEntityPositionColor(
-            pos=read_coord_n(protocol.flags, stream, 3),
-            explosion_color=read_coord_n(protocol.flags, stream, 3))
+    pos: Vector = schema.coords()
+    color: Vector = schema.coords()
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class TempEntityBeam:
-    entity_num: int
-    start: list[float]
-    end: list[float]
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_i16(stream, self.entity_num)
-        write_coord_n(protocol.flags, stream, self.start)
-        write_coord_n(protocol.flags, stream, self.end)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return TempEntityBeam(entity_num=bindata.read_i16(stream),
-                              start=read_coord_n(protocol.flags, stream, 3),
-                              end=read_coord_n(protocol.flags, stream, 3))
+    entity_num: int = schema.fixed('h')
+    start: Vector = schema.coords()
+    end: Vector = schema.coords()
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class TempEntityBeamName:
     name: str
     beam: TempEntityBeam
 
     def write(self, stream, protocol: Protocol):
         bindata.write_c_str(stream, self.name)
-        self.beam.write(stream)
+        self.beam.write(stream, protocol)
 
     @staticmethod
     def parse(stream, protocol: Protocol):
         return TempEntityBeamName(name=bindata.read_c_str(stream),
-                                  beam=TempEntityBeam.parse(stream))
+                                  beam=TempEntityBeam.parse(stream, protocol))
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class TempEntityMessage:
     ID = 23
 
@@ -1067,226 +826,128 @@ class TempEntityMessage:
     @staticmethod
     def parse(stream, protocol: Protocol):
         type = TempEntityType(bindata.read_u8(stream))
-        match type:
-            case (TempEntityType.WIZSPIKE |
-                  TempEntityType.KNIGHTSPIKE |
-                  TempEntityType.SPIKE |
-                  TempEntityType.SUPERSPIKE |
-                  TempEntityType.GUNSHOT |
-                  TempEntityType.EXPLOSION |
-                  TempEntityType.TAREXPLOSION |
-                  TempEntityType.LAVASPLASH |
-                  TempEntityType.TELEPORT):
-                return TempEntityMessage(type, TempEntityPosition.parse(stream, protocol))
-            case TempEntityType.EXPLOSION2:
-                return TempEntityMessage(type, TempEntityPositionColormap.parse(stream, protocol))
-            case TempEntityType.EXPLOSION3:
-                return TempEntityMessage(type, TempEntityPositionColor.parse(stream, protocol))
-            case (TempEntityType.LIGHTNING1 |
-                  TempEntityType.LIGHTNING2 |
-                  TempEntityType.LIGHTNING3 |
-                  TempEntityType.BEAM):
-                return TempEntityMessage(type, TempEntityBeam.parse(stream, protocol))
-            case TempEntityType.LIGHTNING4:
-                return TempEntityMessage(type, TempEntityBeamName.parse(stream, protocol))
-            case _:
-                assert False
-
-
-@dataclasses.dataclass
+        return TempEntityMessage(type, TEMP_ENTITY_DATA_TYPES[type].parse(stream, protocol))
+
+TEMP_ENTITY_DATA_TYPES = {
+    TempEntityType.WIZSPIKE: TempEntityPosition,
+    TempEntityType.KNIGHTSPIKE: TempEntityPosition,
+    TempEntityType.SPIKE: TempEntityPosition,
+    TempEntityType.SUPERSPIKE: TempEntityPosition,
+    TempEntityType.GUNSHOT: TempEntityPosition,
+    TempEntityType.EXPLOSION: TempEntityPosition,
+    TempEntityType.TAREXPLOSION: TempEntityPosition,
+    TempEntityType.LAVASPLASH: TempEntityPosition,
+    TempEntityType.TELEPORT: TempEntityPosition,
+    TempEntityType.EXPLOSION2: TempEntityPositionColormap,
+    TempEntityType.EXPLOSION3: TempEntityPositionColor,
+    TempEntityType.LIGHTNING1: TempEntityBeam,
+    TempEntityType.LIGHTNING2: TempEntityBeam,
+    TempEntityType.LIGHTNING3: TempEntityBeam,
+    TempEntityType.BEAM: TempEntityBeam,
+    TempEntityType.LIGHTNING4: TempEntityBeamName,
+}
+
+
+@schema.message
+@dataclasses.dataclass(slots=True)
 class SetPauseMessage:
     ID = 24
 
-    paused: int
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_u8(stream, self.paused)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return SetPauseMessage(paused=bindata.read_u8(stream))
+    paused: int = schema.fixed('B')
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class SignOnNumMessage:
     ID = 25
 
-    stage: int
+    stage: int = schema.fixed('B')
 
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_u8(stream, self.stage)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return SignOnNumMessage(stage=bindata.read_u8(stream))
 
-
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class CenterPrintMessage:
     ID = 26
 
-    text: str
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_c_str(stream, self.text)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return CenterPrintMessage(text=bindata.read_c_str(stream))
+    text: str = schema.text()
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class KilledMonsterMessage:
     ID = 27
 
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
 
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return KilledMonsterMessage()
-
-
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class FoundSecretMessage:
     ID = 28
 
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
 
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return FoundSecretMessage()
-
-
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class SpawnStaticSoundMessage:
     ID = 29
     VERSION = 1
 
-    origin: list[float]
-    sound_num: int
-    volume: int
-    attenuation: int
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        write_coord_n(protocol.flags, stream, self.origin)
-        if self.VERSION == 1:
-            bindata.write_u8(stream, self.sound_num)
-        else:
-            bindata.write_i16(stream, self.sound_num)
-        bindata.write_u8(stream, self.volume)
-        bindata.write_u8(stream, self.attenuation)
-
-    @classmethod
-    def parse(cls, stream, protocol: Protocol):
-        origin = read_coord_n(protocol.flags, stream, 3)
-
-        if cls.VERSION == 1:
-            sound_num = bindata.read_u8(stream)
-        else:
-            sound_num = bindata.read_i16(stream)
+    origin: Vector = schema.coords()
+    sound_num: int = schema.fixed('B')
+    volume: int = schema.fixed('B')
+    attenuation: int = schema.fixed('B')
 
-        return cls(
-            origin=origin, sound_num=sound_num, volume=bindata.read_u8(stream),
-            attenuation=bindata.read_u8(stream))
 
-
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class SpawnStaticSound2Message(SpawnStaticSoundMessage):
     ID = 44
     VERSION = 2
 
+    sound_num: int = schema.fixed('h')
 
-@dataclasses.dataclass
+
+@schema.message
+@dataclasses.dataclass(slots=True)
 class IntermissionMessage:
     ID = 30
 
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
 
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return IntermissionMessage()
-
-
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class FinaleMessage:
     ID = 31
 
-    text: str
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_c_str(stream, self.text)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return FinaleMessage(text=bindata.read_c_str(stream))
+    text: str = schema.text()
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class CdTrackMessage:
     ID = 32
 
-    cdtrack: int
-    looptrack: int
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_u8(stream, self.cdtrack)
-        bindata.write_u8(stream, self.looptrack)
+    cdtrack: int = schema.fixed('B')
+    looptrack: int = schema.fixed('B')
 
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return CdTrackMessage(cdtrack=bindata.read_u8(stream),
-                              looptrack=bindata.read_u8(stream))
 
-
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class SellscreenMessage:
     ID = 33
 
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
 
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return SellscreenMessage()
-
-
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class CutsceneMessage:
     ID = 34
 
-    text: str
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_c_str(stream, self.text)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return CutsceneMessage(text=bindata.read_c_str(stream))
+    text: str = schema.text()
 
 
-@dataclasses.dataclass
+@schema.message
+@dataclasses.dataclass(slots=True)
 class AchievementMessage:
     ID = 52
 
-    text: str
-
-    def write(self, stream, protocol: Protocol):
-        bindata.write_u8(stream, self.ID)
-        bindata.write_c_str(stream, self.text)
-
-    @staticmethod
-    def parse(stream, protocol: Protocol):
-        return AchievementMessage(text=bindata.read_c_str(stream))
+    text: str = schema.text()
 
 
 MESSAGE_TYPES = [
@@ -1364,7 +1025,143 @@ class UpdateFlags:
     UNUSED22 = (1<<22)
     EXTEND2 = (1<<23)
 
-@dataclasses.dataclass
+# order in which origin and angles appear in an entity update
+ENTITY_UPDATE_AXES = ((UpdateFlags.ORIGIN1, UpdateFlags.ANGLE1),
+                      (UpdateFlags.ORIGIN2, UpdateFlags.ANGLE2),
+                      (UpdateFlags.ORIGIN3, UpdateFlags.ANGLE3))
+@functools.lru_cache(maxsize=None)
+def entity_update_decoder(flags: int, version: ProtocolVersion, protocol_flags: int):
+    """Generate a function that decodes an entity update with the given flags.
+
+    Everything after the flag bytes is read with a single struct call, except
+    for the fullbright value of nehahra transparency that depends on the data.
+    """
+    format = ''
+    def take(value_format: str) -> list[str]:
+        nonlocal format
+        values = [f'v[{len(format) + i}]' for i in range(len(value_format))]
+        format += value_format
+        return values
+    def optional(bit: int) -> str:
+        return take('B')[0] if flags & bit else 'None'
+
+    num, = take('h' if flags & UpdateFlags.LONGENTITY else 'B')
+    modelindex = optional(UpdateFlags.MODEL)
+    frame = optional(UpdateFlags.FRAME)
+    colormap = optional(UpdateFlags.COLORMAP)
+    skinnum = optional(UpdateFlags.SKIN)
+    effects = optional(UpdateFlags.EFFECTS)
+
+    coord = coord_codec(protocol_flags)
+    angle = angle_codec(protocol_flags)
+    # absent origin axes are zero, absent angles are None to tell them apart
+    # from angles that were sent as zero. Only updates with all angles have
+    # them in a compact vector, as that cannot hold None
+    origin = ['0.0', '0.0', '0.0']
+    angles = ['None', 'None', 'None']
+    for i, (origin_bit, angle_bit) in enumerate(ENTITY_UPDATE_AXES):
+        if flags & origin_bit:
+            origin[i] = coord.decode_code.format(*take(coord.format))
+        if flags & angle_bit:
+            angles[i] = angle.decode_code.format(*take(angle.format))
+
+    if 'None' in angles:
+        angles_code = f'[{", ".join(angles)}]'
+    else:
+        angles_code = f'array.array("d", ({", ".join(angles)}))'
+
+    temp = transparency = fullbright = 'None'
+    alpha = scale = frame_finish_time = 'None'
+    lines = []
+    if version == ProtocolVersion.NETQUAKE:
+        if flags & UpdateFlags.TRANS:
+            temp, transparency = take('ff')
+            fullbright = 'fullbright'
+            lines.append(f'fullbright = bindata.read_f32(stream) if {temp} == 2.0 else None')
+    else:
+        alpha = optional(UpdateFlags.ALPHA)
+        scale = optional(UpdateFlags.SCALE)
+        if flags & UpdateFlags.FRAME2:
+            frame = f'{frame} + ({take("B")[0]} << 8)'
+        if flags & UpdateFlags.MODEL2:
+            modelindex = f'{modelindex} + ({take("B")[0]} << 8)'
+        frame_finish_time = optional(UpdateFlags.LERPFINISH)
+
+    lines.append(
+        f'return EntityUpdateMessage(flags, {num}, {modelindex}, {frame}, '
+        f'{colormap}, {skinnum}, {effects}, '
+        f'array.array("d", ({", ".join(origin)})), '
+        f'{angles_code}, {temp}, {transparency}, {fullbright}, '
+        f'{alpha}, {scale}, {frame_finish_time})')
+    source = ('def make(LAYOUT):\n'
+              '    def decode(flags, stream):\n'
+              '        v = bindata.read_struct(stream, LAYOUT)\n' +
+              ''.join(f'        {line}\n' for line in lines) +
+              '    return decode\n')
+    namespace = schema.generate(
+        f'EntityUpdateMessage decoder {flags:#x} {version} {protocol_flags:#x}',
+        source, globals())
+    return namespace['make'](bindata.codec(format))
+
+
+@functools.lru_cache(maxsize=None)
+def entity_update_encoder(flags: int, version: ProtocolVersion, protocol_flags: int):
+    """Generate a function that encodes an entity update with the given flags."""
+    format = 'B'
+    values = ['flags & 0x000000ff']
+    def add(value_format: str, value: str):
+        nonlocal format
+        format += value_format
+        values.append(value)
+    def optional(bit: int, value: str):
+        if flags & bit:
+            add('B', value)
+
+    optional(UpdateFlags.MOREBITS, '(flags & 0x0000ff00) >> 8')
+    if version != ProtocolVersion.NETQUAKE:
+        optional(UpdateFlags.EXTEND1, '(flags & 0x00ff0000) >> 16')
+        optional(UpdateFlags.EXTEND2, 'flags >> 24')
+    add('h' if flags & UpdateFlags.LONGENTITY else 'B', 'm.num')
+    optional(UpdateFlags.MODEL, 'm.modelindex & 0x00ff')
+    optional(UpdateFlags.FRAME, 'm.frame & 0x00ff')
+    optional(UpdateFlags.COLORMAP, 'm.colormap')
+    optional(UpdateFlags.SKIN, 'm.skinnum')
+    optional(UpdateFlags.EFFECTS, 'm.effects')
+
+    coord = coord_codec(protocol_flags)
+    angle = angle_codec(protocol_flags)
+    for i, (origin_bit, angle_bit) in enumerate(ENTITY_UPDATE_AXES):
+        if flags & origin_bit:
+            add(coord.format, coord.encode_code.format(v=f'm.origin[{i}]'))
+        if flags & angle_bit:
+            add(angle.format, angle.encode_code.format(v=f'm.angles[{i}]'))
+
+    lines = []
+    if version == ProtocolVersion.NETQUAKE:
+        if flags & UpdateFlags.TRANS:
+            add('ff', 'm.temp, m.transparency')
+            lines.append('if m.temp == 2.0:')
+            lines.append('    bindata.write_f32(stream, m.fullbright)')
+    else:
+        optional(UpdateFlags.ALPHA, 'm.alpha')
+        optional(UpdateFlags.SCALE, 'm.scale')
+        optional(UpdateFlags.FRAME2, 'm.frame >> 8')
+        optional(UpdateFlags.MODEL2, 'm.modelindex >> 8')
+        optional(UpdateFlags.LERPFINISH, 'm.frame_finish_time')
+
+    source = ('def make(LAYOUT):\n'
+              '    def encode(m, stream):\n'
+              '        flags = m.flags\n'
+              f'        stream.write(LAYOUT.pack({", ".join(values)}))\n' +
+              ''.join(f'        {line}\n' for line in lines) +
+              '    return encode\n')
+    namespace = schema.generate(
+        f'EntityUpdateMessage encoder {flags:#x} {version} {protocol_flags:#x}',
+        source, globals())
+    return namespace['make'](bindata.codec(format))
+
+
+@dataclasses.dataclass(slots=True)
 class EntityUpdateMessage:
     flags: int
     num: int
@@ -1373,8 +1170,9 @@ class EntityUpdateMessage:
     colormap: int
     skinnum: int
     effects: int
-    origin: list[float]
-    angles: list[float]
+    origin: Vector
+    # list with None for the axes that are not sent, unless all of them are
+    angles: Vector | list[float | None]
     temp: float
     transparency: float
     fullbright: float
@@ -1384,60 +1182,7 @@ class EntityUpdateMessage:
 
     def write(self, stream, protocol: Protocol):
         # TODO: Need to adapt this if we change certain data
-        bindata.write_u8(stream, self.flags & 0x000000ff)
-        if self.flags & UpdateFlags.MOREBITS:
-            bindata.write_u8(stream, (self.flags & 0x0000ff00) >> 8)
-        if protocol.version != ProtocolVersion.NETQUAKE:
-            if self.flags & UpdateFlags.EXTEND1:
-                bindata.write_u8(stream, (self.flags & 0x00ff0000) >> 16)
-            if self.flags & UpdateFlags.EXTEND2:
-                bindata.write_u8(stream, self.flags >> 24)
-
-        if self.flags & UpdateFlags.LONGENTITY:
-            bindata.write_i16(stream, self.num)
-        else:
-            bindata.write_u8(stream, self.num)
-        if self.flags & UpdateFlags.MODEL:
-            bindata.write_u8(stream, self.modelindex & 0x00ff)
-        if self.flags & UpdateFlags.FRAME:
-            bindata.write_u8(stream, self.frame & 0x00ff)
-        if self.flags & UpdateFlags.COLORMAP:
-            bindata.write_u8(stream, self.colormap)
-        if self.flags & UpdateFlags.SKIN:
-            bindata.write_u8(stream, self.skinnum)
-        if self.flags & UpdateFlags.EFFECTS:
-            bindata.write_u8(stream, self.effects)
-
-        if self.flags & UpdateFlags.ORIGIN1:
-            write_coord(protocol.flags, stream, self.origin[0])
-        if self.flags & UpdateFlags.ANGLE1:
-            write_angle(protocol.flags, stream, self.angles[0])
-        if self.flags & UpdateFlags.ORIGIN2:
-            write_coord(protocol.flags, stream, self.origin[1])
-        if self.flags & UpdateFlags.ANGLE2:
-            write_angle(protocol.flags, stream, self.angles[1])
-        if self.flags & UpdateFlags.ORIGIN3:
-            write_coord(protocol.flags, stream, self.origin[2])
-        if self.flags & UpdateFlags.ANGLE3:
-            write_angle(protocol.flags, stream, self.angles[2])
-
-        if protocol.version == ProtocolVersion.NETQUAKE:
-            if self.flags & UpdateFlags.TRANS:
-                bindata.write_f32(stream, self.temp)
-                bindata.write_f32(stream, self.transparency)
-                if self.temp == 2.0:
-                    bindata.write_f32(stream, self.fullbright)
-        else:
-            if self.flags & UpdateFlags.ALPHA:
-                bindata.write_u8(stream, self.alpha)
-            if self.flags & UpdateFlags.SCALE:
-                bindata.write_u8(stream, self.scale)
-            if self.flags & UpdateFlags.FRAME2:
-                bindata.write_u8(stream, self.frame >> 8)
-            if self.flags & UpdateFlags.MODEL2:
-                bindata.write_u8(stream, self.modelindex >> 8)
-            if self.flags & UpdateFlags.LERPFINISH:
-                bindata.write_u8(stream, self.frame_finish_time)
+        entity_update_encoder(self.flags, protocol.version, protocol.flags)(self, stream)
 
     @staticmethod
     def parse(flags: int, stream, protocol: Protocol):
@@ -1450,60 +1195,26 @@ class EntityUpdateMessage:
             if flags & UpdateFlags.EXTEND2:
                 flags |= bindata.read_u8(stream) << 24
 
-        num = bindata.read_i16(stream) if (flags & UpdateFlags.LONGENTITY) else bindata.read_u8(stream)
-        modelindex = bindata.read_u8(stream) if (flags & UpdateFlags.MODEL) else None  # TODO: default from baseline
-        frame = bindata.read_u8(stream) if (flags & UpdateFlags.FRAME) else None
-        colormap = bindata.read_u8(stream) if (flags & UpdateFlags.COLORMAP) else None
-        skinnum = bindata.read_u8(stream) if (flags & UpdateFlags.SKIN) else None
-        effects = bindata.read_u8(stream) if (flags & UpdateFlags.EFFECTS) else None
-
-        origin = [0, 0, 0]  # TODO: should be from baseline. actually need this for backpack origin
-        angles = [None, None, None]
-        if flags & UpdateFlags.ORIGIN1:
-            origin[0] = read_coord(protocol.flags, stream)
-        if flags & UpdateFlags.ANGLE1:
-            angles[0] = read_angle(protocol.flags, stream)
-        if flags & UpdateFlags.ORIGIN2:
-            origin[1] = read_coord(protocol.flags, stream)
-        if flags & UpdateFlags.ANGLE2:
-            angles[1] = read_angle(protocol.flags, stream)
-        if flags & UpdateFlags.ORIGIN3:
-            origin[2] = read_coord(protocol.flags, stream)
-        if flags & UpdateFlags.ANGLE3:
-            angles[2] = read_angle(protocol.flags, stream)
-
-        temp = None
-        transparency = None
-        fullbright = None
-        alpha = None
-        scale = None
-        frame_finish_time = None
-        if protocol.version == ProtocolVersion.NETQUAKE:
-            if flags & UpdateFlags.TRANS:
-                temp = bindata.read_f32(stream)
-                transparency = bindata.read_f32(stream)
-                if temp == 2.0:
-                    fullbright = bindata.read_f32(stream)
-        else:
-            alpha = bindata.read_u8(stream) if (flags & UpdateFlags.ALPHA) else None
-            scale = bindata.read_u8(stream) if (flags & UpdateFlags.SCALE) else None
-            if flags & UpdateFlags.FRAME2:
-                frame += bindata.read_u8(stream) << 8
-            if flags & UpdateFlags.MODEL2:
-                modelindex += bindata.read_u8(stream) << 8
-            frame_finish_time = bindata.read_u8(stream) if (flags & UpdateFlags.LERPFINISH) else None
+        # TODO: modelindex etc. should default to baseline. actually need
+        # origin from baseline for backpack origin
+        decode = entity_update_decoder(flags, protocol.version, protocol.flags)
+        return decode(flags, stream)
+
 
-        return EntityUpdateMessage(flags, num, modelindex, frame, colormap,
-            skinnum, effects, origin, angles, temp, transparency, fullbright,
-            alpha, scale, frame_finish_time)
+def parse_unknown_message(message_id: int, stream, protocol: Protocol):
+    raise ValueError(f"Unknown message id {message_id}")
+
+# parse function for every possible id byte. Entity updates are signalled by
+# the highest bit, the remaining bits being the first byte of their flags.
+MESSAGE_PARSERS = [
+    MESSAGE_TYPE_FROM_ID[i].parse if i in MESSAGE_TYPE_FROM_ID else
+    functools.partial(EntityUpdateMessage.parse, i) if i & UpdateFlags.SIGNAL else
+    functools.partial(parse_unknown_message, i)
+    for i in range(256)]
 
 
 def parse_message(stream, protocol: Protocol):
     message_id = bindata.read_u8(stream)
     #if message_id == 0xff:
     #    raise ValueError("end of message")
-    if message_id & UpdateFlags.SIGNAL:
-        return EntityUpdateMessage.parse(message_id, stream, protocol)
-
-    Message = MESSAGE_TYPE_FROM_ID[message_id]
-    return Message.parse(stream, protocol)
+    return MESSAGE_PARSERS[message_id](stream, protocol)
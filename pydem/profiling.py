@@ -0,0 +1,290 @@
+import contextlib
+import dataclasses
+import functools
+import json
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, where peak memory is not reported
+    resource = None
+
+from . import format
+from . import messages
+
+
+@dataclasses.dataclass
+class Counter:
+    count: int = 0
+    bytes: int = 0
+    ns: int = 0
+
+    def add(self, other):
+        self.count += other.count
+        self.bytes += other.bytes
+        self.ns += other.ns
+
+
+@dataclasses.dataclass
+class StageRecord:
+    stage: str
+    demo: str
+    wall_seconds: float
+    cpu_seconds: float
+    # peak resident memory of the process up to the end of the stage
+    max_rss_kib: int
+    items: dict
+
+
+@dataclasses.dataclass
+class Profile:
+    """Time spent per message type and per processing step.
+
+    Counters are keyed by the name of the message type for parsed and written
+    messages and by the name of the step for stages, whose bytes stay 0.
+    Written messages are only those that are encoded, unchanged blocks are
+    copied as they are without looking at their messages. These are counted
+    as blocks with the bytes of their messages in copied instead. Every single
+    run of a step is in records as well. Messages are only counted with
+    count_messages.
+    """
+    count_messages: bool = True
+    parsed: dict[str, Counter] = dataclasses.field(default_factory=dict)
+    written: dict[str, Counter] = dataclasses.field(default_factory=dict)
+    copied: Counter = dataclasses.field(default_factory=Counter)
+    stages: dict[str, Counter] = dataclasses.field(default_factory=dict)
+    records: list[StageRecord] = dataclasses.field(default_factory=list)
+
+    def merge(self, other):
+        for mine, theirs in ((self.parsed, other.parsed),
+                             (self.written, other.written),
+                             (self.stages, other.stages)):
+            for name, counter in theirs.items():
+                mine.setdefault(name, Counter()).add(counter)
+        self.copied.add(other.copied)
+        self.records += other.records
+
+    def format(self) -> str:
+        lines = [f"{'message type':<32} {'parsed':>10} {'bytes':>12} {'ms':>10} {'ns/msg':>8}"
+                 f" {'written':>10} {'bytes':>12} {'ms':>10} {'ns/msg':>8}"]
+        for name in sorted(self.parsed.keys() | self.written.keys()):
+            line = f"{name:<32}"
+            for counters in (self.parsed, self.written):
+                c = counters.get(name, Counter())
+                per_message = c.ns // c.count if c.count else 0
+                line += f" {c.count:>10} {c.bytes:>12} {c.ns / 1e6:>10.1f} {per_message:>8}"
+            lines.append(line)
+        c = self.copied
+        per_block = c.ns // c.count if c.count else 0
+        lines.append(f"{'copied blocks':<32} {'':>10} {'':>12} {'':>10} {'':>8}"
+                     f" {c.count:>10} {c.bytes:>12} {c.ns / 1e6:>10.1f} {per_block:>8}")
+        lines.append('')
+        lines.append(f"{'stage':<32} {'runs':>10} {'ms':>12}")
+        for name, c in self.stages.items():
+            lines.append(f"{name:<32} {c.count:>10} {c.ns / 1e6:>12.1f}")
+        return '\n'.join(lines)
+
+
+_active = None
+
+
+def current():
+    """The profile that is being recorded, or None."""
+    return _active
+
+
+# counters are looked up in the active profile on every call, as processes
+# that are forked while recording inherit the wrappers
+def _timed_parse(parse, name: str):
+    def parse_timed(stream, protocol):
+        start_pos = stream.tell()
+        start = time.perf_counter_ns()
+        message = parse(stream, protocol)
+        counter = _active.parsed.setdefault(name, Counter())
+        counter.ns += time.perf_counter_ns() - start
+        counter.count += 1
+        # including the id that was read before
+        counter.bytes += stream.tell() - start_pos + 1
+        return message
+    return parse_timed
+
+def _timed_write(write, name: str):
+    def write_timed(self, stream, protocol):
+        start_pos = stream.tell()
+        start = time.perf_counter_ns()
+        write(self, stream, protocol)
+        counter = _active.written.setdefault(name, Counter())
+        counter.ns += time.perf_counter_ns() - start
+        counter.count += 1
+        counter.bytes += stream.tell() - start_pos
+    return write_timed
+
+def _timed_block_write(write):
+    def write_timed(self, stream, protocol):
+        if self._source is None or not self._can_copy(protocol):
+            # messages are counted one by one
+            return write(self, stream, protocol)
+        _, start, end, _, _ = self._source
+        start_time = time.perf_counter_ns()
+        write(self, stream, protocol)
+        _active.copied.ns += time.perf_counter_ns() - start_time
+        _active.copied.count += 1
+        # only the messages, as for parsed and written messages
+        _active.copied.bytes += end - start
+    return write_timed
+
+
+@contextlib.contextmanager
+def enabled(profile: Profile = None):
+    """Record the steps and the parsing and writing of messages into the profile.
+
+    The parsers and write methods of the message types are only wrapped while
+    this is active, so there is no overhead at all otherwise.
+    """
+    global _active
+    if _active is not None:
+        # already recording, e.g. a step within a profiled run
+        yield _active
+        return
+    profile = Profile() if profile is None else profile
+    if not profile.count_messages:
+        _active = profile
+        try:
+            yield profile
+        finally:
+            _active = None
+        return
+    message_types = messages.MESSAGE_TYPES + [messages.EntityUpdateMessage]
+
+    parsers = list(messages.MESSAGE_PARSERS)
+    for i, parse in enumerate(parsers):
+        if i in messages.MESSAGE_TYPE_FROM_ID:
+            name = messages.MESSAGE_TYPE_FROM_ID[i].__name__
+        elif i & messages.UpdateFlags.SIGNAL:
+            name = messages.EntityUpdateMessage.__name__
+        else:
+            continue
+        messages.MESSAGE_PARSERS[i] = _timed_parse(parse, name)
+    writes = {t: t.write for t in message_types}
+    for message_type, write in writes.items():
+        message_type.write = _timed_write(write, message_type.__name__)
+    block_write = format.Block.write
+    format.Block.write = _timed_block_write(block_write)
+
+    _active = profile
+    try:
+        yield profile
+    finally:
+        _active = None
+        messages.MESSAGE_PARSERS[:] = parsers
+        for message_type, write in writes.items():
+            message_type.write = write
+        format.Block.write = block_write
+
+
+def max_rss_kib():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _total(counters: dict) -> Counter:
+    total = Counter()
+    for counter in counters.values():
+        total.add(counter)
+    return total
+
+
+@contextlib.contextmanager
+def stage(name: str, path: str = None, demo=None):
+    """Time a processing step of the demo at the given path, if recording.
+
+    Yields a dict for counts of what the step processed, which gets the final
+    number of blocks of the demo if it is given. Blocks are decoded lazily by
+    whichever step first looks at their messages, so when messages are
+    counted it also gets the number of messages parsed during the step and
+    the time spent on that.
+    """
+    items = {}
+    if _active is None:
+        yield items
+        return
+    counter = _active.stages.setdefault(name, Counter())
+    parsed_before = _total(_active.parsed)
+    start = time.perf_counter_ns()
+    start_cpu = time.process_time()
+    try:
+        yield items
+    finally:
+        elapsed = time.perf_counter_ns() - start
+        counter.ns += elapsed
+        counter.count += 1
+        if demo is not None:
+            items.setdefault('blocks', len(demo.blocks))
+        if _active.count_messages:
+            parsed = _total(_active.parsed)
+            items['parsed_messages'] = parsed.count - parsed_before.count
+            items['parse_ns'] = parsed.ns - parsed_before.ns
+        _active.records.append(StageRecord(
+            name, path, elapsed / 1e9, time.process_time() - start_cpu,
+            max_rss_kib(), items))
+
+
+def call(function, *args, count_messages=True):
+    """Call the function while recording, for running it in another process.
+
+    Returns the result of the function and the recorded profile.
+    """
+    global _active
+    if _active is None:
+        with enabled(Profile(count_messages)) as profile:
+            return function(*args), profile
+    # forked from a process that is recording, which merges this profile
+    # into its own, so do not count into the copy of its profile
+    outer = _active
+    _active = profile = Profile(count_messages)
+    try:
+        return function(*args), profile
+    finally:
+        _active = outer
+
+
+def in_worker(function):
+    """The function to run in a worker process to record there as well.
+
+    Results of calling it have to be passed to worker_result.
+    """
+    if _active is None:
+        return function
+    return functools.partial(call, function, count_messages=_active.count_messages)
+
+def worker_result(result):
+    # adds what a worker recorded to the profile of this process
+    if _active is None:
+        return result
+    result, profile = result
+    _active.merge(profile)
+    return result
+
+
+def write_report(path, profile: Profile, wall_seconds: float, cpu_seconds: float):
+    """Write the records of the profile and totals of the run as JSON."""
+    report = {
+        'wall_seconds': wall_seconds,
+        'cpu_seconds': cpu_seconds,
+        'max_rss_kib': max_rss_kib(),
+        'stages': [dataclasses.asdict(r) for r in profile.records],
+    }
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        report['children_cpu_seconds'] = usage.ru_utime + usage.ru_stime
+        report['children_max_rss_kib'] = usage.ru_maxrss
+    if profile.count_messages:
+        report['messages'] = {
+            kind: {name: dataclasses.asdict(c) for name, c in counters.items()}
+            for kind, counters in (('parsed', profile.parsed),
+                                   ('written', profile.written))}
+        report['messages']['copied_blocks'] = dataclasses.asdict(profile.copied)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
@@ -0,0 +1,229 @@
+import dataclasses
+import linecache
+import sys
+
+from . import bindata
+
+
+FIXED = 'fixed'
+TEXT = 'text'
+COORD = 'coord'
+ANGLE = 'angle'
+COORDS = 'coords'
+ANGLES = 'angles'
+# origin and angles interleaved per axis, declared on the origin field and
+# followed by the PAIRED angles field
+COORDS_ANGLES = 'coords_angles'
+PAIRED = 'paired'
+
+
+@dataclasses.dataclass(frozen=True)
+class Spec:
+    kind: str
+    format: str = None
+    # number of values, a list if more than one
+    count: int = 1
+    # field is only present if this bit is set in the flags field
+    when: int = None
+    # value of the field if it is not present
+    default: object = None
+    # (bit in flags, format) to use instead of format if the bit is set
+    wide: tuple = None
+    # type to convert the parsed value to
+    wrap: type = None
+    # applied to the value before writing
+    mask: int = None
+
+
+def _field(spec: Spec):
+    return dataclasses.field(metadata={'schema': spec})
+
+def fixed(format: str, *, count: int = 1, when: int = None, default=None,
+          wide: tuple = None, wrap: type = None, mask: int = None):
+    return _field(Spec(FIXED, format, count, when, default, wide, wrap, mask))
+
+def text():
+    return _field(Spec(TEXT))
+
+def coord():
+    return _field(Spec(COORD))
+
+def angle():
+    return _field(Spec(ANGLE))
+
+def coords():
+    return _field(Spec(COORDS))
+
+def angles():
+    return _field(Spec(ANGLES))
+
+def coords_angles():
+    return _field(Spec(COORDS_ANGLES))
+
+def paired():
+    return _field(Spec(PAIRED))
+
+
+def _is_plain(spec: Spec) -> bool:
+    return spec.when is None and spec.wide is None
+
+def _group(fields: list[tuple[str, Spec]]) -> list[tuple[str, list]]:
+    # consecutive fields that are always present and read with the same
+    # function are read in one go
+    groups = []
+    for name, spec in fields:
+        kind = spec.kind
+        if kind == PAIRED:
+            continue
+        mergeable = kind in (FIXED, COORD, ANGLE) and _is_plain(spec)
+        if (mergeable and groups and groups[-1][0] == kind and
+                _is_plain(groups[-1][1][-1][1])):
+            groups[-1][1].append((name, spec))
+        else:
+            groups.append((kind, [(name, spec)]))
+    return groups
+
+
+class _Generator:
+    def __init__(self, cls):
+        self.cls = cls
+        self.consts = {'Cls': cls, 'read_struct': bindata.read_struct,
+                       'read_c_str': bindata.read_c_str,
+                       'write_c_str': bindata.write_c_str}
+        self.parse = []
+        self.write = []
+
+    def const(self, prefix: str, value) -> str:
+        name = f'{prefix}{len(self.consts)}'
+        self.consts[name] = value
+        return name
+
+    def codec(self, format: str) -> str:
+        return self.const('C', bindata.codec(format))
+
+    def read_fixed(self, fields: list[tuple[str, Spec]], format: str) -> list[str]:
+        codec = self.codec(format)
+        if all(s.count == 1 for _, s in fields):
+            targets = ''.join(f'v_{n}, ' for n, _ in fields)
+            return [f'{targets}= read_struct(stream, {codec})']
+        read = [f'values = read_struct(stream, {codec})']
+        i = 0
+        for n, s in fields:
+            if s.count == 1:
+                read.append(f'v_{n} = values[{i}]')
+            else:
+                read.append(f'v_{n} = list(values[{i}:{i + s.count}])')
+            i += s.count
+        return read
+
+    def write_value(self, name: str, spec: Spec) -> str:
+        if spec.count != 1:
+            return f'*self.{name}'
+        if spec.mask is not None:
+            return f'self.{name} & {spec.mask}'
+        return f'self.{name}'
+
+    def group(self, kind: str, fields: list[tuple[str, Spec]], id_prefix: bool):
+        names = [name for name, _ in fields]
+        name, spec = fields[0]
+        values = ', '.join(self.write_value(n, s) for n, s in fields)
+        if kind == FIXED and spec.wide is not None:
+            bit, wide_format = spec.wide
+            read = ([f'if v_flags & {bit}:'] +
+                    ['    ' + l for l in self.read_fixed(fields, wide_format)] +
+                    ['else:'] +
+                    ['    ' + l for l in self.read_fixed(fields, spec.format)])
+            write = [f'if self.flags & {bit}:',
+                     f'    stream.write({self.codec(wide_format)}.pack({values}))',
+                     f'else:',
+                     f'    stream.write({self.codec(spec.format)}.pack({values}))']
+        elif kind == FIXED:
+            format = ''.join(s.format * s.count for _, s in fields)
+            read = self.read_fixed(fields, format)
+            if id_prefix:
+                write = [f'stream.write({self.codec("B" + format)}.pack(Cls.ID, {values}))']
+            else:
+                write = [f'stream.write({self.codec(format)}.pack({values}))']
+        elif kind == TEXT:
+            read = [f'v_{name} = read_c_str(stream)']
+            write = [f'write_c_str(stream, self.{name})']
+        elif kind in (COORD, ANGLE):
+            codec = 'protocol.coord' if kind == COORD else 'protocol.angle'
+            targets = ''.join(f'v_{n}, ' for n in names)
+            read = [f'{targets}= {codec}.read_n(stream, {len(names)})']
+            write = [f'{codec}.write_n(stream, [{values}])']
+        elif kind in (COORDS, ANGLES):
+            codec = 'protocol.coord' if kind == COORDS else 'protocol.angle'
+            read = [f'v_{name} = {codec}.read_n(stream, 3)']
+            write = [f'{codec}.write_n(stream, self.{name})']
+        elif kind == COORDS_ANGLES:
+            paired = self.paired_name(name)
+            read = [f'v_{name}, v_{paired} = read_coords_angles(protocol, stream, 3)']
+            write = [f'write_coords_angles(protocol, stream, self.{name}, self.{paired})']
+        else:
+            raise ValueError(f"Unknown kind of field '{kind}'")
+
+        for n, s in fields:
+            if s.wrap is not None:
+                read.append(f'v_{n} = {self.const("W", s.wrap)}(v_{n})')
+        if spec.when is not None:
+            read = ([f'if v_flags & {spec.when}:'] + ['    ' + l for l in read] +
+                    ['else:', f'    v_{name} = {self.const("D", spec.default)}'])
+            write = [f'if self.flags & {spec.when}:'] + ['    ' + l for l in write]
+        self.parse.extend(read)
+        self.write.extend(write)
+
+    def paired_name(self, name: str) -> str:
+        names = [f.name for f in dataclasses.fields(self.cls)]
+        paired = names[names.index(name) + 1]
+        assert dataclasses.fields(self.cls)[names.index(paired)].metadata['schema'].kind == PAIRED
+        return paired
+
+    def source(self) -> str:
+        fields = [(f.name, f.metadata['schema']) for f in dataclasses.fields(self.cls)]
+        has_id = hasattr(self.cls, 'ID')
+        groups = _group(fields)
+        for i, (kind, group_fields) in enumerate(groups):
+            id_prefix = (has_id and i == 0 and kind == FIXED and
+                         _is_plain(group_fields[0][1]))
+            if has_id and i == 0 and not id_prefix:
+                self.write.append(f'stream.write({self.const("B", bytes([self.cls.ID]))})')
+            self.group(kind, group_fields, id_prefix)
+        if has_id and not groups:
+            self.write.append(f'stream.write({self.const("B", bytes([self.cls.ID]))})')
+        arguments = ', '.join(f'v_{name}' for name, _ in fields)
+        self.parse.append(f'return Cls({arguments})')
+
+        indent = '\n        '
+        return (f'def make({", ".join(self.consts)}):\n'
+                f'    def parse(stream, protocol):{indent}{indent.join(self.parse)}\n'
+                f'    def write(self, stream, protocol):{indent}{indent.join(self.write or ["pass"])}\n'
+                f'    return parse, write\n')
+
+
+def generate(name: str, source: str, globals: dict) -> dict:
+    """Compile generated source and return the names it defines."""
+    filename = f'<schema {name}>'
+    # allows tracebacks and inspect to show the generated code
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    namespace = {}
+    exec(compile(source, filename, 'exec'), globals, namespace)
+    return namespace
+
+
+def message(cls):
+    """Generate parse and write functions from the schema of the fields.
+
+    Coords and angles are handled by the codecs bound to the protocol, except
+    for read_coords_angles and write_coords_angles which are looked up in the
+    module of the message class.
+    """
+    generator = _Generator(cls)
+    namespace = generate(cls.__qualname__, generator.source(),
+                         sys.modules[cls.__module__].__dict__)
+    parse, write = namespace['make'](**generator.consts)
+    parse.__qualname__ = f'{cls.__qualname__}.parse'
+    write.__qualname__ = f'{cls.__qualname__}.write'
+    cls.parse = staticmethod(parse)
+    cls.write = write
+    return cls
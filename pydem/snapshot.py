@@ -0,0 +1,185 @@
+import io
+import os
+
+import numpy
+
+from . import export
+from . import format
+from . import messages
+
+
+# column that marks a directory as a snapshot. Its value is increased whenever
+# columns are changed in a way that older snapshots cannot be loaded anymore.
+VERSION_COLUMN = 'snapshot_version'
+VERSION = 2
+
+ENTITY_COLUMNS = ('block_index', 'num', 'flags', 'modelindex', 'frame',
+                  'origin', 'angles')
+CLIENT_STATS_FIELDS = ('items', 'health', 'armor', 'shells', 'nails', 'rockets',
+                       'cells', 'activeweapon', 'ammo', 'weapon', 'weaponframe')
+
+
+def is_snapshot(path) -> bool:
+    return os.path.isfile(os.path.join(path, VERSION_COLUMN + '.npy'))
+
+
+def _string_table(strings: list[bytes]) -> dict:
+    ends = numpy.cumsum([len(s) for s in strings], dtype=numpy.int64)
+    return {'strings': numpy.frombuffer(b''.join(strings), dtype=numpy.uint8),
+            'string_ends': ends}
+
+def _strings(data: numpy.ndarray, ends: numpy.ndarray) -> list[bytes]:
+    data = data.tobytes()
+    ends = ends.tolist()
+    return [data[start:end] for start, end in zip([0] + ends[:-1], ends)]
+
+
+def _derived_columns(blocks: list[format.Block]) -> dict:
+    columns = {}
+    table = format.EntityTable.build(blocks)
+    for name in ENTITY_COLUMNS:
+        columns['entity_' + name] = getattr(table, name)
+
+    message_index = {}
+    time_indices = []
+    time_values = []
+    client_stats_indices = []
+    client_stats = []
+    server_info_messages = []
+    for i, block in enumerate(blocks):
+        for m in block.iter_messages():
+            if isinstance(m, messages.TimeMessage):
+                time_indices.append(i)
+                time_values.append(m.time)
+            elif isinstance(m, messages.ClientDataMessage):
+                client_stats_indices.append(i)
+                client_stats.append([getattr(m, f) for f in CLIENT_STATS_FIELDS])
+            elif isinstance(m, messages.ServerInfoMessage):
+                server_info_messages.append(m)
+            indices = message_index.setdefault(type(m).__name__, [])
+            if not indices or indices[-1] != i:
+                indices.append(i)
+    for name, indices in message_index.items():
+        columns['message_index_' + name] = numpy.array(indices, dtype=numpy.int64)
+    # only stored if valid for the corresponding methods of Demo
+    if len(set(time_indices)) == len(time_indices):
+        columns['time_block_index'] = numpy.array(time_indices, dtype=numpy.int64)
+        columns['time_value'] = numpy.array(time_values, dtype=numpy.float64)
+    if len(set(client_stats_indices)) == len(client_stats_indices):
+        columns['client_stats_block_index'] = numpy.array(client_stats_indices,
+                                                          dtype=numpy.int64)
+        columns['client_stats'] = numpy.array(client_stats, dtype=numpy.int64).reshape(
+            -1, len(CLIENT_STATS_FIELDS))
+    if len(server_info_messages) == 1:
+        models = server_info_messages[0].models_precache
+        sounds = server_info_messages[0].sounds_precache
+        columns.update(_string_table(models + sounds))
+        columns['models_precache'] = numpy.arange(len(models))
+        columns['sounds_precache'] = numpy.arange(len(models), len(models) + len(sounds))
+    return columns
+
+
+def _protocols(versions: list[int], flags: list[int]) -> list[messages.Protocol]:
+    # protocol at the start of each block and at the end, the same object as
+    # long as it does not change like for a parsed demo
+    protocols = []
+    for state in zip(versions, flags):
+        if not protocols or state != (protocols[-1].version, protocols[-1].flags):
+            protocol = messages.Protocol(messages.ProtocolVersion(state[0]), state[1])
+        protocols.append(protocol)
+    return protocols
+
+
+def save(directory, demo: format.Demo):
+    """Write a snapshot of the demo as a directory of NumPy .npy files.
+
+    The messages are stored as the bytes that Demo.write would write, together
+    with columns of the block headers and of the data derived from the most
+    common messages. Loading the snapshot memory maps the columns, which is
+    much faster than parsing the demo, and the derived data is available
+    without decoding any messages.
+    """
+    data = io.BytesIO()
+    protocol = messages.Protocol(messages.ProtocolVersion.NETQUAKE)
+    starts, ends, versions, flags = [], [], [], []
+    for block in demo.blocks:
+        versions.append(protocol.version)
+        flags.append(protocol.flags)
+        starts.append(data.tell() + format.Block.HEADER.size)
+        block.write(data, protocol)
+        ends.append(data.tell())
+    versions.append(protocol.version)
+    flags.append(protocol.flags)
+    data = data.getvalue()
+    protocols = _protocols(versions, flags)
+
+    # messages of blocks that were changed may not be the same anymore after
+    # writing them, so derived data uses the written bytes for these
+    blocks = [format.Block(b.viewangles, None,
+                           (data, start, end, protocols[i], protocols[i + 1]))
+              if b.is_changed() else b
+              for i, (b, start, end) in enumerate(zip(demo.blocks, starts, ends))]
+
+    columns = {
+        'cdtrack': numpy.frombuffer(demo.cdtrack.cdtrack, dtype=numpy.uint8),
+        'data': numpy.frombuffer(data, dtype=numpy.uint8),
+        'block_start': numpy.array(starts, dtype=numpy.int64),
+        'block_end': numpy.array(ends, dtype=numpy.int64),
+        'protocol_version': numpy.array(versions, dtype=numpy.int64),
+        'protocol_flags': numpy.array(flags, dtype=numpy.int64),
+        'viewangles': demo.get_viewangles(),
+    }
+    columns.update(_derived_columns(blocks))
+    columns[VERSION_COLUMN] = numpy.array([VERSION], dtype=numpy.int64)
+    if is_snapshot(directory):
+        # columns of the previous snapshot that this one does not have would
+        # be loaded with it otherwise
+        for name in os.listdir(directory):
+            if name.endswith('.npy'):
+                os.remove(os.path.join(directory, name))
+    export.write_columns(directory, columns)
+
+
+def load(directory) -> format.Demo:
+    columns = export.load_columns(directory)
+    if columns[VERSION_COLUMN][0] != VERSION:
+        raise ValueError(f"Unsupported snapshot version {columns[VERSION_COLUMN][0]}")
+
+    # blocks decode from and copy the memory mapped messages directly
+    data = memoryview(columns['data'])
+    protocols = _protocols(columns['protocol_version'].tolist(),
+                           columns['protocol_flags'].tolist())
+    blocks = [format.Block(format.ViewAngles(*viewangles), None,
+                           (data, start, end, protocols[i], protocols[i + 1]))
+              for i, (viewangles, start, end) in enumerate(zip(
+                  columns['viewangles'].tolist(), columns['block_start'].tolist(),
+                  columns['block_end'].tolist()))]
+    demo = format.Demo(format.CdTrack(columns['cdtrack'].tobytes()), blocks)
+
+    table = format.EntityTable(*(columns['entity_' + name]
+                                 for name in ENTITY_COLUMNS))
+    for name in ENTITY_COLUMNS:
+        getattr(table, name).flags.writeable = False
+    demo._memoize('entity_table', lambda: table, messages.EntityUpdateMessage)
+    if 'time_block_index' in columns:
+        time_messages = (columns['time_block_index'], columns['time_value'])
+        demo._memoize('time_messages', lambda: time_messages,
+                      messages.TimeMessage)
+    # messages of any type may be added to any block
+    message_index = {getattr(messages, name[len('message_index_'):]): column.tolist()
+                     for name, column in columns.items()
+                     if name.startswith('message_index_')}
+    demo._memoize('message_index', lambda: message_index, object)
+    if 'client_stats' in columns:
+        client_stats = [None] * len(blocks)
+        for i, values in zip(columns['client_stats_block_index'].tolist(),
+                             columns['client_stats'].tolist()):
+            client_stats[i] = (messages.ItemFlags(values[0]), *values[1:])
+        demo._memoize('client_stats', lambda: client_stats,
+                      messages.ClientDataMessage)
+    if 'strings' in columns:
+        strings = _strings(columns['strings'], columns['string_ends'])
+        precaches = ([strings[i] for i in columns['models_precache']],
+                     [strings[i] for i in columns['sounds_precache']])
+        demo._memoize('precaches', lambda: precaches, messages.ServerInfoMessage)
+    return demo
@@ -5,6 +5,8 @@ import math
 import re
 import typing
 
+import numpy
+
 from . import collision
 from . import format
 from . import messages
@@ -472,7 +474,7 @@ class Collectable:
 @dataclasses.dataclass
 class CollectablePersistant:
     collectable: Collectable
-    origins: list[list[float]]
+    origins: numpy.ndarray
 
     def bounds(self, frame: int):
         return self.collectable.bounds(self.origins[frame])
@@ -488,62 +490,63 @@ class CollectableActiveFrame:
 
 def get_static_collectables(demo, models_precache):
     collectables_static = dict()
-    for block in demo.blocks:
-        for m in block.messages:
-            if isinstance(m, messages.SpawnBaselineMessage):
-                model_name = models_precache[m.modelindex]
-                if model_name in COLLECTABLE_MODELS_MAP.keys():
-                    assert m.entity_num not in collectables_static
-                    if model_name == b'progs/armor.mdl':
-                        if m.skin == 0:
-                            collectable_type = CollectableGreenArmor
-                        elif m.skin == 1:
-                            collectable_type = CollectableYellowArmor
-                        else:
-                            assert m.skin == 2
-                            collectable_type = CollectableRedArmor
-                    else:
-                        collectable_type = COLLECTABLE_MODELS_MAP[model_name]
-                    collectables_static[m.entity_num] = Collectable(
-                        m.entity_num, collectable_type, None, math.inf)
-            if isinstance(m, messages.EntityUpdateMessage):
-                if m.flags & messages.UpdateFlags.MODEL:
-                    # make sure that entities don't suddenly become a
-                    # collectable through an EntityUpdateMessage; the code does
-                    # not expect that, so it is not able to handle it.
-                    assert models_precache[m.modelindex] not in COLLECTABLE_MODELS_MAP.keys()
+    for _, m in demo.iter_messages(messages.SpawnBaselineMessage):
+        model_name = models_precache[m.modelindex]
+        if model_name in COLLECTABLE_MODELS_MAP.keys():
+            assert m.entity_num not in collectables_static
+            if model_name == b'progs/armor.mdl':
+                if m.skin == 0:
+                    collectable_type = CollectableGreenArmor
+                elif m.skin == 1:
+                    collectable_type = CollectableYellowArmor
+                else:
+                    assert m.skin == 2
+                    collectable_type = CollectableRedArmor
+            else:
+                collectable_type = COLLECTABLE_MODELS_MAP[model_name]
+            collectables_static[m.entity_num] = Collectable(
+                m.entity_num, collectable_type, None, math.inf)
+
+    entity_table = demo.get_entity_table()
+    changed_modelindices = numpy.unique(entity_table.modelindex[
+        (entity_table.flags & messages.UpdateFlags.MODEL) != 0])
+    # make sure that entities don't suddenly become a collectable through an
+    # EntityUpdateMessage; the code does not expect that, so it is not able to
+    # handle it.
+    assert not any(models_precache[i] in COLLECTABLE_MODELS_MAP.keys()
+                   for i in changed_modelindices.tolist())
     return collectables_static
 
 def get_static_collectables_persistant(demo, collectables_static):
+    entity_table = demo.get_entity_table()
     collectables_persistant = dict()
-    for i, block in enumerate(demo.blocks):
-        for m in block.messages:
-            if isinstance(m, messages.SpawnBaselineMessage):
-                if m.entity_num in collectables_static:
-                    assert not m.entity_num in collectables_persistant
-                    collectables_persistant[m.entity_num] = CollectablePersistant(
-                        collectables_static[m.entity_num],
-                        [list(m.origin) for _ in range(len(demo.blocks))])
-            elif isinstance(m, messages.EntityUpdateMessage):
-                if m.num in collectables_persistant:
-                    if m.flags & messages.UpdateFlags.ORIGIN1:
-                        collectables_persistant[m.num].origins[i][0] = m.origin[0]
-                    if m.flags & messages.UpdateFlags.ORIGIN2:
-                        collectables_persistant[m.num].origins[i][1] = m.origin[1]
-                    if m.flags & messages.UpdateFlags.ORIGIN3:
-                        collectables_persistant[m.num].origins[i][2] = m.origin[2]
-                    if m.flags & messages.UpdateFlags.MODEL:
-                        # somehow this entity turned into not being a collectable
-                        # anymore, so make sure it cannot be picked up by a player
-                        # anymore by putting it into the NaN void
-                        collectables_persistant[m.num].origins[i] = [math.nan] * 3
+    for _, m in demo.iter_messages(messages.SpawnBaselineMessage):
+        if m.entity_num in collectables_static:
+            assert not m.entity_num in collectables_persistant
+            origins = numpy.tile(numpy.array(m.origin), (len(demo.blocks), 1))
+            updates = entity_table.entity(m.entity_num)
+            # somehow this entity turned into not being a collectable
+            # anymore, so make sure it cannot be picked up by a player
+            # anymore by putting it into the NaN void
+            changed_model = ((updates.flags & messages.UpdateFlags.MODEL) != 0)[:, numpy.newaxis]
+            values = numpy.where(changed_model, math.nan, updates.origin)
+            present = updates.origin_present() | changed_model
+            for axis in range(3):
+                rows = numpy.flatnonzero(present[:, axis])
+                # the last update within a block is the one that counts
+                block_index = updates.block_index[rows]
+                last = numpy.ones(len(rows), dtype=bool)
+                last[:-1] = block_index[1:] != block_index[:-1]
+                origins[block_index[last], axis] = values[rows[last], axis]
+            collectables_persistant[m.entity_num] = CollectablePersistant(
+                collectables_static[m.entity_num], origins)
     return collectables_persistant
 
 def get_static_collectables_bounds_per_frame(demo, collectables_static):
     collectables_default_origins = dict()
     collectables_bounds = dict()
     for i, block in enumerate(demo.blocks):
-        for m in block.messages:
+        for m in block.iter_messages():
             if isinstance(m, messages.SpawnBaselineMessage):
                 if not m.entity_num in collectables_static:
                     continue
@@ -580,7 +583,7 @@ def get_static_collectables_by_frame(demo, collectables_static):
     collectables_by_frame = [[] for _ in range(len(demo.blocks))]
     for i, block in enumerate(demo.blocks):
         has_entity_update = False
-        for m in block.messages:
+        for m in block.iter_messages():
             if isinstance(m, messages.SpawnBaselineMessage):
                 # this is so that we can collect items instantly on unpause,
                 # because there is not a single EntityUpdateMessage for those
@@ -594,9 +597,8 @@ def get_static_collectables_by_frame(demo, collectables_static):
                     has_entity_update = True
                     collectables_by_frame[i].append(CollectableActiveFrame(
                         statics[m.num].collectable, statics[m.num].origins[i]))
-        if not any((isinstance(m, messages.TimeMessage) or
-                    isinstance(m, messages.SpawnBaselineMessage))
-                   for m in block.messages):
+        if not any(block.iter_messages((messages.TimeMessage,
+                                        messages.SpawnBaselineMessage))):
             assert not has_entity_update
             # this is so that intermediate frames that do not have a TimeMessage
             # still provide the info as if accessing the proper frame
@@ -606,40 +608,31 @@ def get_static_collectables_by_frame(demo, collectables_static):
 def get_backpacks_by_frame(demo, models_precache):
     backpacks_by_frame = [[] for _ in range(len(demo.blocks))]
     baselines_origin = dict()
-    for i, block in enumerate(demo.blocks):
-        for m in block.messages:
-            if isinstance(m, messages.SpawnBaselineMessage):
-                baselines_origin[m.entity_num] = m.origin
-            if isinstance(m, messages.EntityUpdateMessage):
-                if m.modelindex and models_precache[m.modelindex] == b'progs/backpack.mdl':
-                    origin = baselines_origin.get(m.num, [0, 0, 0])[:]
-                    if m.flags & messages.UpdateFlags.ORIGIN1:
-                        origin[0] = m.origin[0]
-                    if m.flags & messages.UpdateFlags.ORIGIN2:
-                        origin[1] = m.origin[1]
-                    if m.flags & messages.UpdateFlags.ORIGIN3:
-                        origin[2] = m.origin[2]
-                    backpacks_by_frame[i].append(CollectableActiveFrame(
-                        Collectable(m.num, CollectableBackpack, None, math.inf),
-                        origin))
+    for _, m in demo.iter_messages(messages.SpawnBaselineMessage):
+        baselines_origin[m.entity_num] = m.origin
+    backpack_modelindices = [i for i, model in enumerate(models_precache)
+                             if i and model == b'progs/backpack.mdl']
+    entity_table = demo.get_entity_table()
+    updates = entity_table.select(
+        numpy.isin(entity_table.modelindex, backpack_modelindices))
+    baselines = numpy.array([baselines_origin.get(num, [0.0, 0.0, 0.0])
+                             for num in updates.num.tolist()]).reshape(-1, 3)
+    origins = numpy.where(updates.origin_present(), updates.origin, baselines)
+    for i, num, origin in zip(updates.block_index.tolist(), updates.num.tolist(),
+                              origins):
+        backpacks_by_frame[i].append(CollectableActiveFrame(
+            Collectable(num, CollectableBackpack, None, math.inf), origin))
     return backpacks_by_frame
 
 def get_viewent_num(demo):
-    set_view_messages = [m for b in demo.blocks for m in b.messages
-                         if isinstance(m, messages.SetViewMessage)]
-    assert len(set_view_messages) >= 1
-    viewent_num = set_view_messages[0].viewentity_id
-    assert all([m.viewentity_id == viewent_num for m in set_view_messages])
-    return viewent_num
+    return demo.get_viewent_num()
 
 def get_collection_sounds(demo: format.Demo, sounds_precache: list[str], viewent_num: int) -> typing.Iterator[SoundCollectEvent]:
-    for block_index, block in enumerate(demo.blocks):
-        for m in block.messages:
-            if isinstance(m, messages.SoundMessage):
-                sound_name = sounds_precache[m.sound_num]
-                if m.ent == viewent_num and sound_name in COLLECT_SOUNDS:
-                    yield SoundCollectEvent(
-                        block_index, m.sound_num, m.pos, CollectSound(sound_name))
+    for block_index, m in demo.iter_messages(messages.SoundMessage):
+        sound_name = sounds_precache[m.sound_num]
+        if m.ent == viewent_num and sound_name in COLLECT_SOUNDS:
+            yield SoundCollectEvent(
+                block_index, m.sound_num, m.pos, CollectSound(sound_name))
 
 def get_collection_prints(demo: format.Demo) -> typing.Iterator[PrintCollectEvent]:
     ignore_items = [b"silver key", b"gold key", b"silver keycard",
@@ -648,21 +641,21 @@ def get_collection_prints(demo: format.Demo) -> typing.Iterator[PrintCollectEven
                     b"Pentagram of Protection"]
     ignore_texts = [b"You got the " + x + b"\n" for x in ignore_items]
     text = b""
-    for block_index, block in enumerate(demo.blocks):
-        for m in block.messages:
-            if isinstance(m, messages.PrintMessage):
-                if (m.text.startswith(b"You get") or
-                    m.text.startswith(b"You got") or
-                    m.text.startswith(b"You receive")):
-                    assert not text
-                    text += m.text
-                elif text:
-                    text += m.text
-            elif isinstance(m, messages.StuffTextMessage):
-                if m.text == b"bf\n":
-                    if text and not any(x == text for x in ignore_texts):
-                        yield PrintCollectEvent(block_index, text)
-                    text = b""
+    for block_index, m in demo.iter_messages((messages.PrintMessage,
+                                              messages.StuffTextMessage)):
+        if isinstance(m, messages.PrintMessage):
+            if (m.text.startswith(b"You get") or
+                m.text.startswith(b"You got") or
+                m.text.startswith(b"You receive")):
+                assert not text
+                text += m.text
+            elif text:
+                text += m.text
+        elif isinstance(m, messages.StuffTextMessage):
+            if m.text == b"bf\n":
+                if text and not any(x == text for x in ignore_texts):
+                    yield PrintCollectEvent(block_index, text)
+                text = b""
 
 def get_collection_events(demo: format.Demo, sounds_precache: list[str]) -> typing.Iterator[CollectEvent]:
     viewent_num = get_viewent_num(demo)
@@ -672,15 +665,10 @@ def get_collection_events(demo: format.Demo, sounds_precache: list[str]) -> typi
         yield CollectEvent(collect_sound, collect_print)
 
 def get_client_positions(demo, client_num):
-    client_positions = []
-    for block in demo.blocks:
-        client_messages = [m for m in block.messages
-                           if isinstance(m, messages.EntityUpdateMessage) and m.num == client_num]
-        if client_messages:
-            assert len(client_messages) == 1
-            client_positions.append(client_messages[0].origin)
-        else:
-            client_positions.append([math.inf]*3)
+    updates = demo.get_entity_table().entity(client_num)
+    assert len(numpy.unique(updates.block_index)) == len(updates)
+    client_positions = numpy.full((len(demo.blocks), 3), math.inf)
+    client_positions[updates.block_index] = updates.origin
     return client_positions
 
 def is_sound_from_client_position(client_origin, sound_origin) -> bool:
@@ -775,19 +763,18 @@ def get_backpack_collections(demo):
     return backpack_collections
 
 def get_is_paused(demo):
+    pause_changes = {i: m.paused for i, m in
+                     demo.iter_messages(messages.SetPauseMessage)}
     is_paused = False
-    for block in demo.blocks:
-        for message in block.messages:
-            if isinstance(message, messages.SetPauseMessage):
-                is_paused = message.paused
+    for i in range(len(demo.blocks)):
+        is_paused = pause_changes.get(i, is_paused)
         yield is_paused
 
 def get_first_active_block_index(demo):
     # Find the first block, from which time is stricly monotonically increasing
-    indices = [-1] + [i for i, b in enumerate(demo.blocks) for m in b.messages
-                      if isinstance(m, messages.TimeMessage)]
-    times = [0.0] + [m.time for b in demo.blocks for m in b.messages
-                     if isinstance(m, messages.TimeMessage)]
+    time_messages = list(demo.iter_messages(messages.TimeMessage))
+    indices = [-1] + [i for i, _ in time_messages]
+    times = [0.0] + [m.time for _, m in time_messages]
     is_paused = list(get_is_paused(demo))
     return next(indices[i+1] for i, _ in enumerate(times)
                 if (times[i+2] > times[i+1] and times[i+1] > times[i])
@@ -841,16 +828,12 @@ def get_possible_collections(demo, collectables_static, original_collections):
     return possible_pickups
 
 def get_damage(demo):
-    damage = []
-    for block in demo.blocks:
-        damage_messages = [m for m in block.messages
-                           if isinstance(m, messages.DamageMessage)]
-        assert len(damage_messages) == 1 or len(damage_messages) == 0
-        if len(damage_messages) == 0:
-            damage.append(messages.DamageMessage(0, 0, []))
-        else:
-            damage.append(damage_messages[0])
-    return damage
+    damage = [None] * len(demo.blocks)
+    for i, m in demo.iter_messages(messages.DamageMessage):
+        assert damage[i] is None
+        damage[i] = m
+    return [messages.DamageMessage(0, 0, []) if m is None else m
+            for m in damage]
 
 
 def verify_damage_message(damage: messages.DamageMessage, armor: int, reduction: float):
@@ -869,6 +852,7 @@ def verify_damage_message(damage: messages.DamageMessage, armor: int, reduction:
         # (armor should be unaffected, since 200 is max possible armor)
         if damage.armor > armor_upper_bound:
             damage_ceiled += 256
+            # written masked to a byte again, so the block does not change
             damage.blood += 256
             armor_lower_bound, armor_upper_bound = lost_armor_bounds(
                 damage_ceiled, armor, reduction)
@@ -1169,9 +1153,8 @@ def rebuild_stats(start_stats_per_player: list[format.ClientStats],
 
 def remove_collection_sound(sound_num: int, viewent_num: int,
                             block: format.Block):
-    sounds_to_remove = [m for m in block.messages
-                        if (isinstance(m, messages.SoundMessage) and
-                            m.sound_num == sound_num and m.ent == viewent_num)]
+    sounds_to_remove = [m for m in block.iter_messages(messages.SoundMessage)
+                        if m.sound_num == sound_num and m.ent == viewent_num]
     assert len(sounds_to_remove) == 1
     block.messages.remove(sounds_to_remove[0])
 
@@ -1208,7 +1191,7 @@ def add_collection_sound(collect_sound: CollectSound, client_pos: list[float],
     sound_pos = collision.PlayerBounds.center(client_pos)
     block.messages.append(messages.SoundMessage(flags=0, volume=255,
         attenuation=1.0, ent=viewent_num, channel=3,
-        sound_num=sound_num, pos=sound_pos))
+        sound_num=sound_num, pos=messages.vector(sound_pos)))
 
 def keep_entity_after(start_block_index: int, entity_num: int,
                       last_origin: list[float], demo: format.Demo):
@@ -1217,26 +1200,32 @@ def keep_entity_after(start_block_index: int, entity_num: int,
     flags = messages.UpdateFlags.SIGNAL
     if entity_num > 255:
         flags |= messages.UpdateFlags.MOREBITS|messages.UpdateFlags.LONGENTITY
-    if last_origin:
+    if last_origin is not None:
         flags |= (messages.UpdateFlags.ORIGIN1|messages.UpdateFlags.ORIGIN2|
                   messages.UpdateFlags.ORIGIN3)
+    origin = messages.vector(last_origin) if last_origin is not None else None
     message = messages.EntityUpdateMessage(
-        flags, entity_num, None, None, None, None, None, last_origin,
+        flags, entity_num, None, None, None, None, None, origin,
         None, None, None, None, None, None, None)
     for block in demo.blocks[start_block_index:]:
-        if any([isinstance(m, messages.TimeMessage) for m in block.messages]):
+        if any(block.iter_messages(messages.TimeMessage)):
             block.messages.append(message)
 
 def remove_entity_after(start_block_index: int, entity_num: int,
                         demo: format.Demo):
     for block in demo.blocks[start_block_index:]:
-        for m in block.messages:
-            if not isinstance(m, messages.EntityUpdateMessage):
-                continue
+        for m in block.iter_messages(messages.EntityUpdateMessage):
             if m.num != entity_num:
                 continue
             block.messages.remove(m)
 
+def get_block_index_at_time(demo: format.Demo, time: float) -> int:
+    # first block of the demo at exactly the given time, in any level
+    i = demo.block_at_exact_time(time)
+    if i is None:
+        raise ValueError(f"No block at time {time}")
+    return i
+
 def remove_obsolete_collection_events(old_collections, new_collections, demo,
                                       demo_per_player):
     models_precache, _ = demo.get_precaches()
@@ -1244,7 +1233,6 @@ def remove_obsolete_collection_events(old_collections, new_collections, demo,
     static_collectables = get_static_collectables_persistant(demo,
         get_static_collectables(demo, models_precache))
     times = demo.get_time()
-    times_per_player = [d.get_time().tolist() for d in demo_per_player]
 
     blocks_to_remove = []
     for i, block in enumerate(demo.blocks):
@@ -1260,15 +1248,16 @@ def remove_obsolete_collection_events(old_collections, new_collections, demo,
             remove_collection_print(c.collect_event.print_event, demo)
 
             last_origin = None
-            if (static_collectables[c.entity_num].origins[i-1] !=
-                static_collectables[c.entity_num].origins[0]):
+            if not numpy.array_equal(static_collectables[c.entity_num].origins[i-1],
+                                     static_collectables[c.entity_num].origins[0],
+                                     equal_nan=True):
                 last_origin = static_collectables[c.entity_num].origins[i-1]
             keep_entity_after(i, c.entity_num, last_origin, demo)
 
-            for other_demo, other_times in zip(demo_per_player, times_per_player):
+            for other_demo in demo_per_player:
                 if other_demo == demo:
                     continue
-                other_i = other_times.index(c.time_consumed)
+                other_i = get_block_index_at_time(other_demo, c.time_consumed)
                 remove_collection_sound(c.collect_event.sound_event.sound_num, viewent_num,
                                         other_demo.blocks[other_i])
                 keep_entity_after(other_i, c.entity_num, last_origin, other_demo)
@@ -1280,7 +1269,6 @@ def add_new_collection_events(old_collections, new_collections, demo,
     viewent_num = get_viewent_num(demo)
     client_positions = get_client_positions(demo, viewent_num)
     times = demo.get_time()
-    times_per_player = [d.get_time().tolist() for d in demo_per_player]
 
     for i, block in enumerate(demo.blocks):
         collections_to_add = [new for new in new_collections[i]
@@ -1295,10 +1283,10 @@ def add_new_collection_events(old_collections, new_collections, demo,
             block.messages.append(messages.StuffTextMessage(text=b'bf\n'))
             remove_entity_after(i, c.entity_num, demo)
 
-            for other_demo, other_times in zip(demo_per_player, times_per_player):
+            for other_demo in demo_per_player:
                 if other_demo == demo:
                     continue
-                other_i = other_times.index(c.time_consumed)
+                other_i = get_block_index_at_time(other_demo, c.time_consumed)
                 add_collection_sound(c.type.collect_sound, client_positions[i],
                                      viewent_num, sounds_precache,
                                      other_demo.blocks[other_i])
@@ -1344,7 +1332,6 @@ def add_runes(demo, runes_nums: list[int]):
         runes_flags |= RUNE_NUM_TO_FLAG[rune_num]
 
     for b in demo.blocks:
-        client_messages = [m for m in b.messages
-                           if isinstance(m, messages.ClientDataMessage)]
-        for m in client_messages:
+        for m in b.iter_messages(messages.ClientDataMessage):
+            b.mark_changed(messages.ClientDataMessage)
             m.items |= runes_flags
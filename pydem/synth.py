@@ -0,0 +1,285 @@
+import argparse
+import math
+import random
+
+from . import collision
+from . import format
+from . import messages
+from .messages import (ItemFlags, Protocol, ProtocolFlags, ProtocolVersion,
+                       ServerUpdateFlags, UpdateFlags)
+
+
+FPS = 72.0
+# half the size of the square that everything moves in, small enough to be
+# exact with every coord format
+WORLD_EXTENT = 4000
+
+MODELS = [b'', b'maps/e1m1.bsp', b'progs/player.mdl', b'progs/soldier.mdl',
+          b'progs/dog.mdl', b'progs/v_shot.mdl', b'maps/b_bh25.bsp',
+          b'maps/b_shell0.bsp', b'maps/b_nail0.bsp', b'progs/armor.mdl']
+SOUNDS = [b'', b'items/health1.wav', b'weapons/lock4.wav', b'items/armor1.wav',
+          b'weapons/guncock.wav', b'soldier/pain1.wav', b'dog/dattack1.wav',
+          b'misc/talk.wav']
+
+# (model, sound, print, stat, amount) of items that can be picked up
+PICKUPS = [
+    (b'maps/b_bh25.bsp', b'items/health1.wav', b'You receive 25 health\n', 'health', 25),
+    (b'maps/b_shell0.bsp', b'weapons/lock4.wav', b'You got the shells\n', 'shells', 20),
+    (b'maps/b_nail0.bsp', b'weapons/lock4.wav', b'You got the nails\n', 'nails', 25),
+    (b'progs/armor.mdl', b'items/armor1.wav', b'You got armor\n', 'armor', 100),
+]
+STAT_LIMITS = {'health': 100, 'shells': 100, 'nails': 200, 'armor': 100}
+
+# expected number of messages of each kind per frame, besides time, client
+# data, entity updates and pickups
+MESSAGE_MIX = {'sound': 0.05, 'temp_entity': 0.05, 'particle': 0.02,
+               'damage': 0.01, 'print': 0.002, 'stuff_text': 0.002}
+
+
+class _Generator:
+    def __init__(self, protocol: Protocol, num_entities: int, num_players: int,
+                 player: int, seed: int):
+        self.random = random.Random(seed)
+        self.protocol = protocol
+        self.num_players = num_players
+        self.player = player
+        # players come first, as the first entities after the world
+        self.models = ([MODELS.index(b'progs/player.mdl')] * num_players +
+                       [MODELS.index(self.random.choice([b'progs/soldier.mdl',
+                                                         b'progs/dog.mdl']))
+                        for _ in range(num_entities)])
+        self.origins = [self.position() for _ in self.models]
+        self.yaws = [self.angle() for _ in self.models]
+        self.stats = {'health': 100, 'shells': 25, 'nails': 0, 'armor': 0}
+
+    def position(self) -> list[float]:
+        return [float(self.random.randint(-WORLD_EXTENT, WORLD_EXTENT))
+                for _ in range(3)]
+
+    def angle(self) -> float:
+        # multiples of a step of byte angles are exact with every angle format
+        return self.random.randint(-128, 127) * (360.0 / 256.0)
+
+    def move(self, i: int):
+        for axis in range(3):
+            value = self.origins[i][axis] + self.random.randint(-4, 4)
+            self.origins[i][axis] = float(max(-WORLD_EXTENT, min(WORLD_EXTENT, value)))
+        if self.random.random() < 0.1:
+            self.yaws[i] = self.angle()
+
+    def count(self, rate: float) -> int:
+        return int(rate) + (self.random.random() < rate - int(rate))
+
+    def signon(self, levelname: bytes, item_baselines: list) -> list[format.Block]:
+        server_info = messages.ServerInfoMessage(
+            Protocol(self.protocol.version, self.protocol.flags),
+            max(self.num_players, 1), 0, levelname, MODELS, SOUNDS)
+        first = [messages.PrintMessage(b'\x02\nVERSION 1.09 SERVER\n'),
+                 server_info, messages.CdTrackMessage(2, 2),
+                 messages.SetViewMessage(self.player + 1), messages.SignOnNumMessage(1)]
+        baselines = [messages.SpawnBaselineMessage(
+                         num, model, 0, num if num <= self.num_players else 0, 0,
+                         messages.vector(origin), messages.vector((0.0, yaw, 0.0)))
+                     for num, (model, origin, yaw) in enumerate(
+                         zip(self.models, self.origins, self.yaws), start=1)]
+        players = []
+        for i in range(self.num_players):
+            players.append(messages.UpdateNameMessage(i, f'player{i + 1}'.encode()))
+            players.append(messages.UpdateColorsMessage(i, 0x11 * (i % 14)))
+        second = (baselines + item_baselines + players +
+                  [messages.LightstyleMessage(0, b'm'), messages.SignOnNumMessage(2)])
+        third = [messages.SetAngleMessage(0.0, 0.0, self.yaws[self.player]),
+                 messages.SignOnNumMessage(3)]
+        return [format.Block(format.ViewAngles(0.0, 0.0, 0.0), m)
+                for m in (first, second, third)]
+
+    def pickups(self, num_pickups: int):
+        # (origin, pickup) of every item, the world entity is number 0
+        items = [(self.position(), self.random.choice(PICKUPS))
+                 for _ in range(num_pickups)]
+        first = len(self.models) + 1
+        return [messages.SpawnBaselineMessage(
+                    first + i, MODELS.index(pickup[0]), 0, 0, 0,
+                    messages.vector(origin), messages.vector())
+                for i, (origin, pickup) in enumerate(items)], items
+
+    def entity_update(self, i: int, frame: int) -> messages.EntityUpdateMessage:
+        num = i + 1
+        flags = (UpdateFlags.SIGNAL | UpdateFlags.ORIGIN1 | UpdateFlags.ORIGIN2 |
+                 UpdateFlags.ORIGIN3 | UpdateFlags.ANGLE2 | UpdateFlags.FRAME)
+        if num > 255:
+            flags |= UpdateFlags.MOREBITS | UpdateFlags.LONGENTITY
+        return messages.EntityUpdateMessage(
+            flags, num, None, (frame // 6) % 8, None, None, None,
+            messages.vector(self.origins[i]), messages.vector((0.0, self.yaws[i], 0.0)),
+            None, None, None, None, None, None)
+
+    def item_update(self, item: int) -> messages.EntityUpdateMessage:
+        # items stay at their baseline until they are picked up
+        num = len(self.models) + 1 + item
+        flags = UpdateFlags.SIGNAL
+        if num > 255:
+            flags |= UpdateFlags.MOREBITS | UpdateFlags.LONGENTITY
+        return messages.EntityUpdateMessage(
+            flags, num, None, None, None, None, None, messages.vector(),
+            messages.vector(), None, None, None, None, None, None)
+
+    def client_data(self) -> messages.ClientDataMessage:
+        stats = self.stats
+        items = ItemFlags.SHOTGUN | ItemFlags.AXE
+        if stats['armor']:
+            items |= ItemFlags.ARMOR1
+        return messages.ClientDataMessage(
+            ServerUpdateFlags.ITEMS | ServerUpdateFlags.WEAPON | ServerUpdateFlags.ONGROUND,
+            messages.ClientDataMessage.DEFAULT_VIEWHEIGHT, 0.0, messages.vector(),
+            messages.vector(), items, 0, stats['armor'], MODELS.index(b'progs/v_shot.mdl'),
+            stats['health'], stats['shells'], stats['shells'], stats['nails'], 0, 0,
+            ItemFlags.SHOTGUN, 0)
+
+    def collect(self, collector: int, origin: list[float], pickup):
+        # sound of the frame and the reliable messages that are sent in a
+        # block of their own, only to the player that picks up the item
+        _, sound, text, stat, amount = pickup
+        # the player that picks up the item is right at it
+        self.origins[collector] = list(origin)
+        sounds = [messages.SoundMessage(
+            messages.SoundFlags(0), messages.SoundMessage.DEFAULT_SOUND_PACKET_VOLUME,
+            messages.SoundMessage.DEFAULT_SOUND_PACKET_ATTENUATION, collector + 1, 3,
+            SOUNDS.index(sound), messages.vector(collision.PlayerBounds.center(origin)))]
+        if collector != self.player:
+            return sounds, []
+        self.stats[stat] = min(self.stats[stat] + amount, STAT_LIMITS[stat])
+        return sounds, [messages.PrintMessage(text), messages.StuffTextMessage(b'bf\n')]
+
+    def extra(self, kind: str) -> list:
+        rnd = self.random
+        if kind == 'sound':
+            i = rnd.randrange(len(self.models))
+            return [messages.SoundMessage(
+                messages.SoundFlags.VOLUME, rnd.randint(128, 255),
+                messages.SoundMessage.DEFAULT_SOUND_PACKET_ATTENUATION, i + 1,
+                rnd.randint(0, 7), rnd.randint(4, len(SOUNDS) - 1),
+                messages.vector(self.origins[i]))]
+        if kind == 'temp_entity':
+            return [messages.TempEntityMessage(
+                messages.TempEntityType.GUNSHOT,
+                messages.TempEntityPosition(messages.vector(self.position())))]
+        if kind == 'particle':
+            return [messages.ParticleMessage(messages.vector(self.position()),
+                                             [0, 0, 1], 20, 73)]
+        if kind == 'damage':
+            blood = rnd.randint(1, 10)
+            self.stats['health'] = max(self.stats['health'] - blood, 1)
+            return [messages.DamageMessage(0, blood, messages.vector(self.position()))]
+        if kind == 'print':
+            return [messages.PrintMessage(b'player1 was bitten by a Rottweiler\n')]
+        if kind == 'stuff_text':
+            return [messages.StuffTextMessage(b'bf\n')]
+        raise ValueError(f"Unknown kind of message '{kind}'")
+
+
+def generate(protocol: Protocol = None, duration: float = 60.0,
+             num_entities: int = 32, num_players: int = 1,
+             pickup_density: float = 0.2, message_mix: dict = None,
+             player: int = 0, seed: int = 0) -> format.Demo:
+    """Generate a valid demo of random but plausible content.
+
+    The demo lasts for duration seconds at FPS frames per second. Every frame
+    has updates for all players and num_entities other entities. Items are
+    picked up pickup_density times per second. message_mix gives the expected
+    number of further messages per frame by kind, see MESSAGE_MIX. The same
+    arguments always give the same demo, and demos that only differ in player
+    are the same game as recorded by each of the players, like for coop.
+    """
+    if protocol is None:
+        protocol = Protocol(ProtocolVersion.NETQUAKE)
+    if num_players < 1:
+        raise ValueError("A demo needs at least one player")
+    if not 0 <= player < num_players:
+        raise ValueError(f"Player {player} is not one of the {num_players} players")
+    mix = MESSAGE_MIX if message_mix is None else message_mix
+    generator = _Generator(protocol, num_entities, num_players, player, seed)
+    num_frames = int(duration * FPS)
+    # at most one item per frame, as the player has to be right at it
+    num_pickups = min(math.ceil(pickup_density * duration), num_frames)
+    item_baselines, items = generator.pickups(num_pickups)
+    blocks = generator.signon(b'synthetic', item_baselines)
+    collect_frames = sorted(generator.random.sample(range(num_frames), num_pickups))
+
+    pitch = 0.0
+    item = 0
+    for frame in range(num_frames):
+        block_messages = [messages.TimeMessage(1.0 + frame / FPS)]
+        for i in range(len(generator.models)):
+            generator.move(i)
+        reliable_messages = []
+        if item < len(items) and collect_frames[item] == frame:
+            origin, pickup = items[item]
+            sounds, reliable_messages = generator.collect(item % num_players, origin, pickup)
+            block_messages += sounds
+            item += 1
+        for kind, rate in mix.items():
+            for _ in range(generator.count(rate)):
+                block_messages += generator.extra(kind)
+        block_messages.append(generator.client_data())
+        for i in range(len(generator.models)):
+            block_messages.append(generator.entity_update(i, frame))
+        for i in range(item, len(items)):
+            block_messages.append(generator.item_update(i))
+        if generator.random.random() < 0.05:
+            pitch = generator.random.randint(-8, 8) * (360.0 / 256.0)
+        viewangles = format.ViewAngles(pitch, generator.yaws[player], 0.0)
+        blocks.append(format.Block(viewangles, block_messages))
+        if reliable_messages:
+            blocks.append(format.Block(viewangles, reliable_messages))
+
+    blocks.append(format.Block(format.ViewAngles(0.0, 0.0, 0.0),
+                               [messages.DisconnectMessage()]))
+    return format.Demo(format.CdTrack(b'-1\n'), blocks)
+
+
+PROTOCOLS = {'netquake': ProtocolVersion.NETQUAKE,
+             'fitzquake': ProtocolVersion.FITZQUAKE,
+             'rmq': ProtocolVersion.RMQ}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic demo.")
+    parser.add_argument('output', type=str, help="Path of the demo to write.")
+    parser.add_argument('--protocol', choices=PROTOCOLS, default='netquake')
+    parser.add_argument('--protocol_flags', type=str, action='append', default=[],
+        choices=[name for name in vars(ProtocolFlags) if name.startswith('PRFL_')],
+        help="Flags of the RMQ protocol, e.g. PRFL_24BITCOORD.")
+    parser.add_argument('--duration', type=float, default=60.0,
+        help="Duration of the demo in seconds.")
+    parser.add_argument('--entities', type=int, default=32,
+        help="Number of entities moving in every frame, besides the players.")
+    parser.add_argument('--players', type=int, default=1)
+    parser.add_argument('--pickup_density', type=float, default=0.2,
+        help="Number of items picked up per second.")
+    parser.add_argument('--mix', type=str, nargs=2, action='append', default=[],
+        metavar=('KIND', 'RATE'),
+        help="Expected number of messages of a kind per frame, one of "
+             f"{', '.join(MESSAGE_MIX)}.")
+    parser.add_argument('--player', type=int, default=0,
+        help="Index of the player that records the demo.")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    flags = 0
+    for name in args.protocol_flags:
+        flags |= getattr(ProtocolFlags, name)
+    mix = dict(MESSAGE_MIX)
+    for kind, rate in args.mix:
+        if kind not in MESSAGE_MIX:
+            parser.error(f"Unknown kind of message '{kind}'")
+        mix[kind] = float(rate)
+    demo = generate(Protocol(PROTOCOLS[args.protocol], flags), args.duration,
+                    args.entities, args.players, args.pickup_density, mix,
+                    args.player, args.seed)
+    with open(args.output, 'wb') as f:
+        demo.write(f)
+
+
+if __name__ == '__main__':
+    main()
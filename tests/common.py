@@ -0,0 +1,49 @@
+import contextlib
+import io
+import sys
+
+from pydem import bindata
+from pydem import cli
+from pydem import format
+from pydem import messages
+from pydem.messages import Protocol, ProtocolVersion
+
+
+MODELS = [b'', b'maps/start.bsp', b'progs/player.mdl']
+SOUNDS = [b'', b'misc/talk.wav', b'weapons/guncock.wav', b'player/pain1.wav']
+
+
+def written(demo):
+    stream = io.BytesIO()
+    demo.write(stream)
+    return stream.getvalue()
+
+
+def parse(data):
+    return format.Demo.parse(bindata.MemoryBuffer(data))
+
+
+def main(monkeypatch, argv):
+    monkeypatch.setattr(sys, 'argv', ['pydem'] + argv)
+    with contextlib.redirect_stdout(io.StringIO()):
+        cli.main()
+
+
+def make_demo(num_blocks=40):
+    # hand-built blocks with a bit of everything the stream filters look at
+    server_info = messages.ServerInfoMessage(
+        Protocol(ProtocolVersion.NETQUAKE), 1, 0, b'start', MODELS, SOUNDS)
+    blocks = [format.Block(format.ViewAngles(0.0, 0.0, 0.0), [server_info])]
+    for i in range(num_blocks):
+        block_messages = [messages.TimeMessage(0.25 * i)]
+        if i % 3 == 1:
+            block_messages.append(messages.SoundMessage(
+                messages.SoundFlags(0), 255, 1.0, 1, 0, 1 + i % 3, [8.0, -16.0, 24.0]))
+        if i % 10 == 5:
+            block_messages.append(
+                messages.PrintMessage(b'player1 was bitten by a Rottweiler\n'))
+        if i % 10 == 7:
+            block_messages.append(messages.StuffTextMessage(b'v_cshift 0 0 0 128\n'))
+        blocks.append(format.Block(format.ViewAngles(0.0, 1.5 * i, 0.0),
+                                   block_messages))
+    return format.Demo(format.CdTrack(b'-1\n'), blocks)
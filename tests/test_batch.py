@@ -0,0 +1,71 @@
+import contextlib
+import io
+import json
+import os
+
+from pydem import batch
+from pydem import cli
+
+from tests import common
+
+
+def run_batch(manifest_path, journal_path):
+    parser = cli.make_parser()
+    with contextlib.redirect_stdout(io.StringIO()), \
+            contextlib.redirect_stderr(io.StringIO()):
+        return batch.run_batch(manifest_path, journal_path, 1,
+                               lambda argv: cli.parse_set_args(parser, argv),
+                               cli.run)
+
+
+def test_failed_sets_do_not_stop_batch(tmp_path):
+    with open(tmp_path / 'good.dem', 'wb') as f:
+        common.make_demo().write(f)
+    with open(tmp_path / 'broken.dem', 'wb') as f:
+        f.write(b'not a demo')
+    manifest = [
+        {'demos': ['missing.dem']},
+        {'demos': ['good.dem'], 'options': '--fadein not_a_number'},
+        {'demos': ['broken.dem']},
+        {'demos': ['good.dem']},
+    ]
+    manifest_path = str(tmp_path / 'manifest.json')
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+    journal_path = str(tmp_path / 'manifest.json.journal')
+
+    assert run_batch(manifest_path, journal_path) == 3
+    assert os.path.exists(tmp_path / 'good_out.dem')
+    with open(journal_path) as f:
+        entries = [json.loads(line) for line in f]
+    assert sum('error' in entry for entry in entries) == 3
+    assert sum('outputs' in entry for entry in entries) == 1
+
+    # only the failed sets are tried again
+    journal = batch.Journal(journal_path)
+    assert len(journal.outputs) == 1
+    assert run_batch(manifest_path, journal_path) == 3
+
+
+def test_resume_skips_done_sets(tmp_path):
+    for name in ('a.dem', 'b.dem'):
+        with open(tmp_path / name, 'wb') as f:
+            common.make_demo().write(f)
+    manifest_path = str(tmp_path / 'manifest.csv')
+    with open(manifest_path, 'w') as f:
+        f.write('demos,options\na.dem,\nb.dem,--fadein 1\n')
+    journal_path = str(tmp_path / 'journal')
+    assert run_batch(manifest_path, journal_path) == 0
+    outputs = [tmp_path / 'a_out.dem', tmp_path / 'b_out.dem']
+    modified = [os.path.getmtime(p) for p in outputs]
+
+    assert run_batch(manifest_path, journal_path) == 0
+    assert [os.path.getmtime(p) for p in outputs] == modified
+
+    # changed options or a removed output make a set pending again
+    with open(manifest_path, 'w') as f:
+        f.write('demos,options\na.dem,\nb.dem,--fadein 2\n')
+    os.remove(outputs[0])
+    assert run_batch(manifest_path, journal_path) == 0
+    assert os.path.exists(outputs[0])
+    assert os.path.getmtime(outputs[1]) != modified[1]
@@ -0,0 +1,172 @@
+import io
+
+import pytest
+
+from pydem import bindata
+from pydem import format
+
+from tests import common
+
+
+SCALARS = [
+    (bindata.read_u8, bindata.write_u8, 200, b'\xc8'),
+    (bindata.read_i8, bindata.write_i8, -2, b'\xfe'),
+    (bindata.read_u16, bindata.write_u16, 0x1234, b'\x34\x12'),
+    (bindata.read_i16, bindata.write_i16, -2, b'\xfe\xff'),
+    (bindata.read_u32, bindata.write_u32, 0x12345678, b'\x78\x56\x34\x12'),
+    (bindata.read_i32, bindata.write_i32, -2, b'\xfe\xff\xff\xff'),
+    (bindata.read_f32, bindata.write_f32, 1.5, b'\x00\x00\xc0\x3f'),
+]
+
+
+@pytest.mark.parametrize('stream_type', [io.BytesIO, bindata.MemoryBuffer])
+@pytest.mark.parametrize('read, write, value, data', SCALARS,
+                         ids=[s[0].__name__ for s in SCALARS])
+def test_scalars_are_little_endian(read, write, value, data, stream_type):
+    stream = io.BytesIO()
+    write(stream, value)
+    assert stream.getvalue() == data
+    stream = stream_type(data + b'\xff')
+    assert read(stream) == value
+    assert stream.tell() == len(data)
+
+
+def test_vectors():
+    stream = io.BytesIO()
+    bindata.write_f32_n(stream, [1.0, -2.5, 3.25])
+    bindata.write_i8_n(stream, [-1, 0, 127])
+    stream.seek(0)
+    assert bindata.read_f32_n(stream, 3) == [1.0, -2.5, 3.25]
+    assert bindata.read_i8_n(stream, 3) == [-1, 0, 127]
+    assert bindata.codec_n('f', 3) is bindata.codec_n('f', 3)
+
+
+def test_struct_layout_is_packed():
+    codec = bindata.codec('Bif')
+    assert codec.size == 9
+    stream = io.BytesIO()
+    bindata.write_struct(stream, codec, 1, -1, 0.5)
+    stream.seek(0)
+    assert bindata.read_struct(stream, codec) == (1, -1, 0.5)
+
+
+def test_short_read():
+    with pytest.raises(ValueError):
+        bindata.read_i32(io.BytesIO(b'\x01\x02'))
+    with pytest.raises(IndexError):
+        bindata.read_i32(bindata.MemoryBuffer(b'\x01\x02'))
+
+
+def test_memory_buffer_reads_views():
+    data = bytearray(b'abcdef')
+    stream = bindata.MemoryBuffer(data)
+    view = stream.read(2)
+    assert isinstance(view, memoryview)
+    assert view == b'ab'
+    assert stream.tell() == 2
+    stream.seek(1, 1)
+    assert stream.read() == b'def'
+    assert stream.read(1) == b''
+    stream.seek(4)
+    with pytest.raises(IndexError):
+        stream.read(3)
+    with pytest.raises(IndexError):
+        stream.read(-1)
+
+
+def test_from_file(tmp_path):
+    path = tmp_path / 'demo.dem'
+    data = common.written(common.make_demo())
+    path.write_bytes(data)
+    with open(path, 'rb') as f:
+        stream = bindata.MemoryBuffer.from_file(f)
+    # the mapping stays valid after the file is closed
+    assert common.written(format.Demo.parse(stream)) == data
+
+    # empty files cannot be mapped
+    path.write_bytes(b'')
+    with open(path, 'rb') as f:
+        assert bindata.MemoryBuffer.from_file(f).read() == b''
+
+
+@pytest.mark.parametrize('stream_type', [io.BytesIO, bindata.MemoryBuffer])
+def test_read_c_str(stream_type):
+    stream = stream_type(b'abc\0\0def')
+    assert bindata.read_c_str(stream) == b'abc'
+    assert bindata.read_c_str(stream) == b''
+    # unterminated string at the end of the data
+    with pytest.raises(ValueError):
+        bindata.read_c_str(stream)
+
+
+@pytest.mark.parametrize('stream_type', [io.BytesIO, bindata.MemoryBuffer])
+def test_read_until_max_len(stream_type):
+    stream = stream_type(b'12345\n')
+    with pytest.raises(ValueError):
+        bindata.read_until(stream, b'\n', 5)
+    stream.seek(0)
+    assert bindata.read_until(stream, b'\n', 6) == b'12345'
+    assert stream.tell() == 6
+
+
+class UnseekableStream(io.BytesIO):
+    def seekable(self):
+        return False
+
+
+@pytest.mark.parametrize('stream_type', [io.BytesIO, UnseekableStream])
+@pytest.mark.parametrize('delimiter', [b'\0', b'\r\n'])
+def test_read_until_in_chunks(monkeypatch, stream_type, delimiter):
+    monkeypatch.setattr(bindata, 'READ_UNTIL_CHUNK', 4)
+    # delimiters at and across the ends of chunks
+    strings = [b'abc', b'defghi', b'', b'jklmnopqrs', b'tuvwxyz']
+    stream = stream_type(delimiter.join(strings) + delimiter + b'rest')
+    position = 0
+    for string in strings:
+        assert bindata.read_until(stream, delimiter) == string
+        position += len(string) + len(delimiter)
+        assert stream.tell() == position
+    assert stream.read() == b'rest'
+
+
+@pytest.mark.parametrize('stream_type', [io.BytesIO, UnseekableStream])
+def test_read_until_in_chunks_max_len(monkeypatch, stream_type):
+    monkeypatch.setattr(bindata, 'READ_UNTIL_CHUNK', 4)
+    stream = stream_type(b'1234567\n')
+    with pytest.raises(ValueError):
+        bindata.read_until(stream, b'\n', 7)
+    # does not read beyond the maximum length
+    assert stream.tell() == 7
+    stream.seek(0)
+    assert bindata.read_until(stream, b'\n', 8) == b'1234567'
+    with pytest.raises(ValueError):
+        bindata.read_until(stream, b'\n')
+
+
+def test_read_until_end_of_buffer():
+    # the delimiter beyond the end of the buffer is not found
+    stream = bindata.MemoryBuffer(b'xxabc\0', 2, 5)
+    with pytest.raises(ValueError):
+        bindata.read_c_str(stream)
+    stream = bindata.MemoryBuffer(b'xxabc\0', 2, 6)
+    assert bindata.read_c_str(stream) == b'abc'
+
+
+def test_read_until_end_of_mapping(tmp_path):
+    path = tmp_path / 'strings'
+    path.write_bytes(b'abc\0def')
+    with open(path, 'rb') as f:
+        stream = bindata.MemoryBuffer.from_file(f)
+    assert bindata.read_c_str(stream) == b'abc'
+    with pytest.raises(ValueError):
+        bindata.read_c_str(stream)
+    with pytest.raises(ValueError):
+        bindata.read_until(stream, b'\0', 100)
+
+
+def test_cdtrack():
+    stream = bindata.MemoryBuffer(b'-1\n\x05')
+    assert format.CdTrack.parse(stream).cdtrack == b'-1\n'
+    assert stream.tell() == 3
+    with pytest.raises(ValueError):
+        format.CdTrack.parse(bindata.MemoryBuffer(b'0' * 20 + b'\n'))
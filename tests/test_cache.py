@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from pydem import bindata
+from pydem import cache
+from pydem import export
+from pydem import snapshot
+from pydem import synth
+
+from tests import common
+
+
+@pytest.fixture(scope='module')
+def data():
+    return common.written(synth.generate(duration=1.0))
+
+
+def entries(directory):
+    return sorted(os.listdir(directory))
+
+
+def test_loads_stored_demo(tmp_path, data):
+    demo_cache = cache.DemoCache(str(tmp_path))
+    assert common.written(demo_cache.parse(bindata.MemoryBuffer(data))) == data
+    assert len(entries(tmp_path)) == 1
+    assert common.written(demo_cache.parse(bindata.MemoryBuffer(data))) == data
+
+
+def test_entries_are_snapshots(tmp_path, data, monkeypatch):
+    demo_cache = cache.DemoCache(str(tmp_path))
+    demo_cache.parse(bindata.MemoryBuffer(data))
+    path = os.path.join(tmp_path, entries(tmp_path)[0])
+    assert snapshot.is_snapshot(path)
+    # entries of another snapshot version are not loaded
+    monkeypatch.setattr(snapshot, 'VERSION', snapshot.VERSION + 1)
+    demo_cache.parse(bindata.MemoryBuffer(data))
+    assert len(entries(tmp_path)) == 2
+
+
+@pytest.mark.parametrize('corrupt', [lambda d: b'garbage', lambda d: d[:len(d) // 2]])
+@pytest.mark.parametrize('column', ['block_start', 'data'])
+def test_corrupt_entry_is_miss(tmp_path, data, corrupt, column):
+    demo_cache = cache.DemoCache(str(tmp_path))
+    demo_cache.parse(bindata.MemoryBuffer(data))
+    path = os.path.join(tmp_path, entries(tmp_path)[0], column + '.npy')
+    with open(path, 'rb') as f:
+        stored = f.read()
+    with open(path, 'wb') as f:
+        f.write(corrupt(stored))
+    assert common.written(demo_cache.parse(bindata.MemoryBuffer(data))) == data
+    with open(path, 'rb') as f:
+        assert f.read() == stored
+
+
+def test_shrinks_when_opened_with_smaller_size(tmp_path, data):
+    cache.DemoCache(str(tmp_path)).parse(bindata.MemoryBuffer(data))
+    assert entries(tmp_path)
+    cache.DemoCache(str(tmp_path), max_size=1)
+    assert not entries(tmp_path)
+
+
+def test_failed_store_leaves_no_file(tmp_path, data, monkeypatch):
+    write_columns = export.write_columns
+    def fail(directory, columns):
+        write_columns(directory, dict(list(columns.items())[:2]))
+        raise OSError("disk full")
+    monkeypatch.setattr(export, 'write_columns', fail)
+    with pytest.raises(OSError):
+        cache.DemoCache(str(tmp_path)).parse(bindata.MemoryBuffer(data))
+    assert not entries(tmp_path)
@@ -0,0 +1,62 @@
+import pytest
+
+from pydem import cli
+from pydem import synth
+
+from tests import common
+
+
+def test_stream_matches_whole_demo(tmp_path, monkeypatch):
+    path = tmp_path / 'demo.dem'
+    data = common.written(common.make_demo())
+    path.write_bytes(data)
+    options = ['--remove_grenade_counter', '--remove_prints', 'bitten',
+               '--remove_sounds', 'pain',
+               '--replace_sound', 'misc/talk.wav', 'weapons/guncock.wav',
+               '--remove_fades']
+    common.main(monkeypatch, [str(path)] + options)
+    streamed = (tmp_path / 'demo_out.dem').read_bytes()
+
+    with monkeypatch.context() as m:
+        m.setattr(cli, 'can_stream', lambda *args: False)
+        common.main(m, [str(path)] + options)
+    assert (tmp_path / 'demo_out.dem').read_bytes() == streamed
+    assert b'bitten' not in streamed
+    assert b'v_cshift' not in streamed
+
+
+@pytest.mark.parametrize('options', [['--remove_prints', 'bitten'],
+                                     ['--fadein', '1', '--remove_fades']])
+def test_jobs_match_serial(tmp_path, monkeypatch, options):
+    paths = [tmp_path / 'a.dem', tmp_path / 'b.dem']
+    for num_blocks, path in zip((30, 50), paths):
+        path.write_bytes(common.written(common.make_demo(num_blocks)))
+    outputs = [tmp_path / 'a_out.dem', tmp_path / 'b_out.dem']
+
+    common.main(monkeypatch, [str(p) for p in paths] + options)
+    serial = [p.read_bytes() for p in outputs]
+    for p in outputs:
+        p.unlink()
+    common.main(monkeypatch, [str(p) for p in paths] + options + ['--jobs', '2'])
+    assert [p.read_bytes() for p in outputs] == serial
+
+
+def test_stream_without_options_copies(tmp_path, monkeypatch):
+    path = tmp_path / 'demo.dem'
+    data = common.written(synth.generate(duration=2.0))
+    path.write_bytes(data)
+    common.main(monkeypatch, [str(path)])
+    assert (tmp_path / 'demo_out.dem').read_bytes() == data
+
+
+def test_snapshot_input(tmp_path, monkeypatch):
+    path = tmp_path / 'demo.dem'
+    data = common.written(synth.generate(duration=2.0))
+    path.write_bytes(data)
+    common.main(monkeypatch, [str(path), '--snapshot'])
+    snapshot_path = tmp_path / 'demo_snapshot'
+
+    # without options and with options that are otherwise streamed
+    for options in ([], ['--remove_prints', 'nothing matches this']):
+        common.main(monkeypatch, [str(snapshot_path)] + options)
+        assert (tmp_path / 'demo_snapshot_out.dem').read_bytes() == data
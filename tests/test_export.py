@@ -0,0 +1,23 @@
+import numpy
+
+from pydem import export
+from pydem import messages
+
+from tests import common
+
+
+def test_write_and_load_columns(tmp_path):
+    demo = common.parse(common.written(common.make_demo()))
+    columns = export.get_columns(demo)
+    assert len(columns['block_time']) == len(demo.blocks)
+    assert (len(columns['print_text']) ==
+            len(list(demo.iter_messages(messages.PrintMessage))))
+    for name, column in columns.items():
+        if name.endswith('block_index'):
+            assert numpy.all(numpy.diff(column) >= 0), name
+
+    export.write_columns(str(tmp_path), columns)
+    loaded = export.load_columns(str(tmp_path))
+    assert loaded.keys() == columns.keys()
+    for name, column in columns.items():
+        numpy.testing.assert_array_equal(loaded[name], column)
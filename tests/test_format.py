@@ -0,0 +1,142 @@
+import io
+
+import numpy
+import pytest
+
+from pydem import format
+from pydem import messages
+from pydem import synth
+from pydem.messages import Protocol, ProtocolFlags, ProtocolVersion
+
+from tests import common
+
+
+PROTOCOLS = [
+    Protocol(ProtocolVersion.NETQUAKE),
+    Protocol(ProtocolVersion.FITZQUAKE),
+    Protocol(ProtocolVersion.RMQ),
+    Protocol(ProtocolVersion.RMQ, ProtocolFlags.PRFL_SHORTANGLE |
+             ProtocolFlags.PRFL_24BITCOORD),
+    Protocol(ProtocolVersion.RMQ, ProtocolFlags.PRFL_FLOATANGLE |
+             ProtocolFlags.PRFL_FLOATCOORD),
+    Protocol(ProtocolVersion.RMQ, ProtocolFlags.PRFL_INT32COORD |
+             ProtocolFlags.PRFL_EDICTSCALE | ProtocolFlags.PRFL_ALPHASANITY),
+]
+
+
+def test_round_trip():
+    data = common.written(common.make_demo())
+    demo = common.parse(data)
+    assert len(demo.blocks) == 41
+    assert common.written(demo) == data
+    assert demo.blocks[-1].viewangles == format.ViewAngles(0.0, 58.5, 0.0)
+
+
+@pytest.fixture(scope='module', params=PROTOCOLS,
+                ids=lambda p: f'{p.version.value}-{p.flags}')
+def data(request):
+    return common.written(synth.generate(request.param, duration=2.0, num_players=2))
+
+
+def test_round_trip_copy(data):
+    demo = common.parse(data)
+    assert not any(block.is_changed() for block in demo.blocks)
+    assert common.written(demo) == data
+
+
+def test_round_trip_encode(data):
+    demo = common.parse(data)
+    for block in demo.blocks:
+        block.mark_changed()
+    assert common.written(demo) == data
+
+
+def test_iter_blocks(data):
+    stream = io.BytesIO(data)
+    cdtrack = format.CdTrack.parse(stream)
+    blocks = list(format.iter_blocks(stream))
+    assert common.written(format.Demo(cdtrack, blocks)) == data
+    assert blocks == common.parse(data).blocks
+
+
+def test_server_info_signature_in_other_messages():
+    # the bytes of these messages look like a ServerInfoMessage switching to
+    # the protocol of FitzQuake, the zero player id ends its level name
+    demo = synth.generate(duration=1.0)
+    lookalike = [messages.UpdateStatMessage(11, int(ProtocolVersion.FITZQUAKE)),
+                 messages.NopMessage(), messages.NopMessage(),
+                 messages.UpdateNameMessage(0, b'maps/e1m1.bsp')]
+    demo.blocks.insert(len(demo.blocks) // 2,
+                       format.Block(format.ViewAngles(0.0, 0.0, 0.0), lookalike))
+    data = common.written(demo)
+    assert messages.ServerInfoMessage.SIGNATURE.search(data[len(data) // 4:])
+
+    parsed = common.parse(data)
+    assert all(block._source[4].version == ProtocolVersion.NETQUAKE
+               for block in parsed.blocks)
+    assert common.written(parsed) == data
+    # encoding follows the protocol of ServerInfoMessages only
+    for block in parsed.blocks:
+        block.mark_changed()
+    assert common.written(parsed) == data
+
+
+def test_changed_messages_are_not_stale():
+    data = common.written(synth.generate(duration=1.0))
+    demo = common.parse(data)
+    i = demo.find_blocks(messages.TimeMessage)[-1]
+    time = demo.get_time()[i]
+
+    # reading the list of messages changes nothing
+    message, = [m for m in demo.blocks[i].messages
+                if isinstance(m, messages.TimeMessage)]
+    assert not demo.blocks[i].is_changed()
+    assert common.written(demo) == data
+
+    # fields changed in place
+    message.time = time + 10.0
+    demo.blocks[i].mark_changed(messages.TimeMessage)
+    assert demo.get_time()[i] == time + 10.0
+
+    # messages removed from the list
+    j = demo.find_blocks(messages.TimeMessage)[-2]
+    demo.blocks[i].messages.remove(message)
+    assert i not in demo.find_blocks(messages.TimeMessage)
+    assert demo.get_time()[i] != time + 10.0
+    assert not demo.blocks[j].is_changed()
+    demo.blocks[j].messages.append(messages.NopMessage())
+    assert demo.blocks[j].is_changed()
+
+
+def get_yaw_loop(demo):
+    # unwrapping as it was done block by block
+    yaw = numpy.array([block.viewangles.yaw for block in demo.blocks])
+    for i in range(1, len(yaw)):
+        if abs((yaw[i] + 360.0) - yaw[i-1]) < abs(yaw[i] - yaw[i-1]):
+            yaw[i:] = yaw[i:] + 360.0
+        elif abs((yaw[i] - 360.0) - yaw[i-1]) < abs(yaw[i] - yaw[i-1]):
+            yaw[i:] = yaw[i:] - 360.0
+    return yaw
+
+
+def test_viewangles_match_loops():
+    # turning around several times in both directions, wrapped like in demos
+    turn = numpy.concatenate((numpy.linspace(0.0, 1500.0, 300),
+                              numpy.linspace(1500.0, -900.0, 500)))
+    turn += numpy.random.default_rng(0).uniform(-5.0, 5.0, len(turn))
+    wrapped = (turn + 180.0) % 360.0 - 180.0
+    blocks = [format.Block(format.ViewAngles(pitch, yaw, 0.0), [])
+              for pitch, yaw in zip((turn / 20.0).tolist(), wrapped.tolist())]
+    demo = format.Demo(format.CdTrack(b'-1\n'), blocks)
+
+    yaw = demo.get_yaw()
+    # the shifts are summed up in a different order
+    numpy.testing.assert_allclose(yaw, get_yaw_loop(demo), rtol=0.0, atol=1e-9)
+    numpy.testing.assert_allclose(yaw - yaw[0], turn - turn[0], atol=1e-9)
+
+    demo.set_yaw(yaw + 0.5)
+    demo.set_pitch(numpy.zeros(len(blocks), dtype=numpy.float32))
+    assert [b.viewangles.yaw for b in blocks] == (yaw + 0.5).tolist()
+    assert all(type(b.viewangles.pitch) is float and b.viewangles.pitch == 0.0
+               for b in blocks)
+    numpy.testing.assert_array_equal(demo.get_pitch(), 0.0)
@@ -0,0 +1,42 @@
+import io
+
+from pydem import bindata
+from pydem import messages
+from pydem.messages import Protocol, ProtocolVersion, UpdateFlags
+
+
+def entity_update(flags, angles):
+    flags |= UpdateFlags.SIGNAL
+    if flags & 0xff00:
+        flags |= UpdateFlags.MOREBITS
+    return messages.EntityUpdateMessage(
+        flags, 1, None, None, None, None, None,
+        messages.vector(), angles, None, None, None, None, None, None)
+
+
+def round_trip(message, protocol=None):
+    protocol = protocol or Protocol(ProtocolVersion.NETQUAKE)
+    stream = io.BytesIO()
+    message.write(stream, protocol)
+    return messages.parse_message(bindata.MemoryBuffer(stream.getvalue()),
+                                  protocol)
+
+
+def test_absent_angles_are_none():
+    parsed = round_trip(entity_update(UpdateFlags.ANGLE2, [None, 90.0, None]))
+    assert list(parsed.angles) == [None, 90.0, None]
+
+
+def test_angles_sent_as_zero_differ_from_absent():
+    absent = round_trip(entity_update(UpdateFlags.ANGLE2, [None, 0.0, None]))
+    sent = round_trip(entity_update(
+        UpdateFlags.ANGLE1 | UpdateFlags.ANGLE2 | UpdateFlags.ANGLE3,
+        messages.vector((0.0, 0.0, 0.0))))
+    assert list(sent.angles) == [0.0, 0.0, 0.0]
+    assert absent.angles != sent.angles
+    assert absent != sent
+
+
+def test_messages_of_same_update_are_equal():
+    message = entity_update(UpdateFlags.ANGLE3, [None, None, 45.0])
+    assert round_trip(message) == round_trip(message)
@@ -0,0 +1,104 @@
+import collections
+import io
+import json
+
+from pydem import format
+from pydem import messages
+from pydem import profiling
+from pydem import synth
+
+from tests import common
+
+
+RECORD_TYPES = {'stage': str, 'demo': str, 'wall_seconds': float,
+                'cpu_seconds': float, 'max_rss_kib': int, 'items': dict}
+
+
+def report(tmp_path, monkeypatch, options):
+    path = tmp_path / 'demo.dem'
+    path.write_bytes(common.written(common.make_demo()))
+    report_path = tmp_path / 'report.json'
+    common.main(monkeypatch, [str(path), '--fadein', '1',
+                              '--report', str(report_path)] + options)
+    with open(report_path) as f:
+        return str(path), json.load(f)
+
+
+def test_report(tmp_path, monkeypatch):
+    path, run = report(tmp_path, monkeypatch, [])
+    assert isinstance(run['wall_seconds'], float)
+    assert isinstance(run['cpu_seconds'], float)
+    assert isinstance(run['max_rss_kib'], int)
+    # only where resource is available
+    if 'children_cpu_seconds' in run:
+        assert isinstance(run['children_cpu_seconds'], float)
+        assert isinstance(run['children_max_rss_kib'], int)
+    # counting messages is left to --profile
+    assert 'messages' not in run
+
+    assert [r['stage'] for r in run['stages']] == ['parse', 'fadein', 'write']
+    for record in run['stages']:
+        assert {k: type(v) for k, v in record.items()} == RECORD_TYPES
+        assert record['demo'] == path
+        assert record['items']['blocks'] == 41
+        assert all(isinstance(v, int) for v in record['items'].values())
+    assert run['stages'][0]['items']['bytes'] == (tmp_path / 'demo.dem').stat().st_size
+
+
+def test_report_with_profile(tmp_path, monkeypatch):
+    _, run = report(tmp_path, monkeypatch, ['--profile'])
+    copied = run['messages'].pop('copied_blocks')
+    assert copied.keys() == {'count', 'bytes', 'ns'}
+    assert 0 < copied['count'] < 41
+    assert run['messages'].keys() == {'parsed', 'written'}
+    for counters in run['messages'].values():
+        assert counters
+        for counter in counters.values():
+            assert counter.keys() == {'count', 'bytes', 'ns'}
+            assert all(isinstance(v, int) for v in counter.values())
+    # messages are parsed by whichever stage first needs them
+    parsed = sum(r['items']['parsed_messages'] for r in run['stages'])
+    assert parsed == sum(c['count'] for c in run['messages']['parsed'].values())
+
+
+def test_counts_copied_and_encoded_blocks():
+    data = common.written(synth.generate(duration=1.0))
+    demo = common.parse(data)
+    for block in demo.blocks[:10]:
+        block.mark_changed()
+
+    with profiling.enabled() as profile:
+        demo.write(io.BytesIO())
+    assert profile.copied.count == len(demo.blocks) - 10
+    num_written = sum(c.count for c in profile.written.values())
+    assert num_written == sum(len(list(b.iter_messages())) for b in demo.blocks[:10])
+    # message bytes of all blocks, without the header of each block
+    num_bytes = profile.copied.bytes + sum(c.bytes for c in profile.written.values())
+    assert num_bytes == len(data) - len(demo.cdtrack.cdtrack) - 16 * len(demo.blocks)
+    # the wrappers are only installed while recording
+    assert profiling.current() is None
+    assert format.Block.write.__name__ == 'write'
+    assert messages.TimeMessage.write.__name__ == 'write'
+
+
+def test_parse_counts_match_messages():
+    demo = synth.generate(duration=2.0)
+    data = common.written(demo)
+    with profiling.enabled() as profile:
+        with profiling.stage('parse'):
+            demo = common.parse(data)
+        with profiling.stage('decode'):
+            counts = collections.Counter(
+                type(m).__name__ for b in demo.blocks for m in b.iter_messages())
+        # blocks are decoded only once, even the ones that are checked for a
+        # ServerInfoMessage while parsing
+        for block in demo.blocks:
+            list(block.iter_messages())
+    assert {name: c.count for name, c in profile.parsed.items()} == counts
+    parse, decode = profile.records
+    server_info_blocks = [b for b in demo.blocks
+                          if any(b.iter_messages(messages.ServerInfoMessage))]
+    assert server_info_blocks
+    assert parse.items['parsed_messages'] == sum(
+        len(list(b.iter_messages())) for b in server_info_blocks)
+    assert parse.items['parsed_messages'] + decode.items['parsed_messages'] == sum(counts.values())
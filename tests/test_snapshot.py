@@ -0,0 +1,90 @@
+import dataclasses
+
+import numpy
+
+from pydem import messages
+from pydem import snapshot
+from pydem import synth
+from pydem.messages import UpdateFlags
+
+from tests import common
+
+
+def make_demo():
+    # entity updates for the entity table
+    flags = (UpdateFlags.SIGNAL | UpdateFlags.MOREBITS |
+             UpdateFlags.ORIGIN1 | UpdateFlags.ORIGIN2 | UpdateFlags.ORIGIN3 |
+             UpdateFlags.ANGLE1 | UpdateFlags.ANGLE2 | UpdateFlags.ANGLE3)
+    demo = common.make_demo()
+    for i, block in enumerate(demo.blocks[1:]):
+        block.messages.append(messages.EntityUpdateMessage(
+            flags, 1 + i % 2, None, None, None, None, None,
+            messages.vector((8.0 * i, -4.0, 16.0)), messages.vector((0.0, 45.0, 0.0)),
+            None, None, None, None, None, None))
+    return demo
+
+
+def saved(demo, directory):
+    snapshot.save(str(directory), demo)
+    return str(directory)
+
+
+def test_round_trip(tmp_path):
+    data = common.written(make_demo())
+    demo = common.parse(data)
+
+    directory = saved(demo, tmp_path / 'snapshot')
+    assert snapshot.is_snapshot(directory)
+    loaded = snapshot.load(directory)
+
+    assert common.written(loaded) == data
+    assert loaded.blocks == demo.blocks
+    numpy.testing.assert_array_equal(loaded.get_time(), demo.get_time())
+    assert loaded.get_precaches() == demo.get_precaches()
+    table, loaded_table = demo.get_entity_table(), loaded.get_entity_table()
+    assert len(table.num) == len(demo.blocks) - 1
+    for field in dataclasses.fields(table):
+        numpy.testing.assert_array_equal(getattr(loaded_table, field.name),
+                                         getattr(table, field.name))
+
+
+def test_loaded_data_follows_changes(tmp_path):
+    loaded = snapshot.load(saved(common.parse(common.written(make_demo())), tmp_path))
+    i = loaded.find_blocks(messages.TimeMessage)[-1]
+    for m in loaded.blocks[i].messages:
+        if isinstance(m, messages.TimeMessage):
+            m.time = 1000.0
+    loaded.blocks[i].mark_changed()
+    assert loaded.get_time()[i] == 1000.0
+
+
+def test_derived_data_without_decoding(tmp_path):
+    data = common.written(synth.generate(duration=2.0))
+    demo = common.parse(data)
+    loaded = snapshot.load(saved(demo, tmp_path))
+    for message_type in (messages.ClientDataMessage, messages.SoundMessage,
+                         messages.PrintMessage, messages.SetAngleMessage):
+        assert loaded.find_blocks(message_type) == demo.find_blocks(message_type)
+    assert loaded.get_client_stats() == demo.get_client_stats()
+    assert all(block._messages is None for block in loaded.blocks)
+
+    # the blocks refer to the memory mapped messages
+    source = loaded.blocks[0]._source[0]
+    assert isinstance(source, memoryview)
+    assert isinstance(source.obj, numpy.memmap)
+    assert common.written(loaded) == data
+
+
+def test_save_replaces_snapshot(tmp_path):
+    saved(common.parse(common.written(synth.generate(duration=1.0))), tmp_path)
+    data = common.written(common.make_demo())
+    loaded = snapshot.load(saved(common.parse(data), tmp_path))
+    assert not loaded.find_blocks(messages.ClientDataMessage)
+    assert common.written(loaded) == data
+
+
+def test_demo_is_no_snapshot(tmp_path):
+    path = tmp_path / 'demo.dem'
+    path.write_bytes(common.written(common.make_demo()))
+    assert not snapshot.is_snapshot(str(path))
+    assert not snapshot.is_snapshot(str(tmp_path))
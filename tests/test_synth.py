@@ -0,0 +1,36 @@
+import numpy
+import pytest
+
+from pydem import synth
+from pydem.messages import Protocol, ProtocolVersion
+
+from tests import common
+
+
+def test_same_arguments_give_same_demo():
+    assert (common.written(synth.generate(duration=1.0, seed=3)) ==
+            common.written(synth.generate(duration=1.0, seed=3)))
+    assert (common.written(synth.generate(duration=1.0, seed=3)) !=
+            common.written(synth.generate(duration=1.0, seed=4)))
+
+
+def test_duration_and_protocol():
+    protocol = Protocol(ProtocolVersion.FITZQUAKE)
+    demo = common.parse(common.written(synth.generate(protocol, duration=3.0)))
+    assert demo.blocks[-1]._source[4].version == ProtocolVersion.FITZQUAKE
+    assert demo.get_time()[-1] == pytest.approx(1.0 + 3.0, abs=0.1)
+
+
+def test_players_record_same_game():
+    demos = [synth.generate(duration=2.0, num_players=2, player=player)
+             for player in range(2)]
+    # only the player that picks up an item gets the print of it in a block
+    # of its own, so only the times match
+    numpy.testing.assert_array_equal(numpy.unique(demos[0].get_time()),
+                                     numpy.unique(demos[1].get_time()))
+    assert demos[0].get_viewent_num() != demos[1].get_viewent_num()
+
+
+def test_invalid_player():
+    with pytest.raises(ValueError):
+        synth.generate(duration=1.0, num_players=2, player=2)
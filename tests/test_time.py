@@ -0,0 +1,71 @@
+import numpy
+import pytest
+
+from pydem import format
+from pydem import messages
+from pydem import stats
+
+
+def demo_with_times(times):
+    # one block per time, None for blocks without time message
+    blocks = [format.Block(format.ViewAngles(0.0, 0.0, 0.0),
+                           [] if t is None else [messages.TimeMessage(t)])
+              for t in times]
+    return format.Demo(format.CdTrack(b'-1\n'), blocks)
+
+
+def test_get_time_keeps_previous_time():
+    demo = demo_with_times([None, 1.0, None, 2.0])
+    assert demo.get_time().tolist() == [0.0, 1.0, 1.0, 2.0]
+
+
+def test_block_at_time_with_repeated_times():
+    # a pause repeats the same time
+    demo = demo_with_times([1.0, 2.0, 2.0, 2.0, 3.0])
+    assert demo.block_at_time(2.0) == 1
+    assert demo.block_at_time(2.5) == 4
+    assert demo.block_at_time(0.0) == 0
+    assert demo.block_at_time(4.0) == 5
+
+
+def test_blocks_between():
+    demo = demo_with_times([1.0, 2.0, 2.0, 3.0, 4.0])
+    assert demo.blocks_between(2.0, 3.0) == range(1, 4)
+    assert demo.blocks_between(2.5, 2.6) == range(3, 3)
+    assert demo.blocks_between(0.0, 10.0) == range(0, 5)
+
+
+def test_lookups_stay_in_level():
+    # time goes back where the second level starts
+    demo = demo_with_times([1.0, 2.0, 3.0, 1.0, 2.0, 3.0])
+    assert demo.block_at_time(2.0) == 1
+    assert demo.block_at_time(2.0, level_of=4) == 4
+    assert demo.block_at_time(5.0) == 3
+    assert demo.blocks_between(1.0, 2.0, level_of=3) == range(3, 5)
+
+
+def test_time_index_follows_changes():
+    demo = demo_with_times([1.0, 2.0, 3.0])
+    assert demo.block_at_time(2.5) == 2
+    demo.blocks.insert(1, format.Block(format.ViewAngles(0.0, 0.0, 0.0),
+                                       [messages.TimeMessage(2.5)]))
+    assert demo.block_at_time(2.5) == 1
+
+
+def test_block_index_at_time_after_time_went_back():
+    demo = demo_with_times([2.0, 1.0, 1.5, 3.0, 3.5])
+    assert stats.get_block_index_at_time(demo, 3.0) == 3
+    assert stats.get_block_index_at_time(demo, 1.0) == 1
+    with pytest.raises(ValueError):
+        stats.get_block_index_at_time(demo, 2.5)
+
+
+def test_block_at_exact_time():
+    # pauses repeat times and time goes back twice
+    times = [None, 1.0, 2.0, 2.0, 3.0, 0.5, 1.0, 1.5, 2.0, 1.0, 4.0]
+    demo = demo_with_times(times)
+    for time in (0.0, 0.5, 1.0, 1.5, 2.0, 3.0, 4.0, 2.5, 5.0):
+        found = numpy.flatnonzero(demo.get_time() == time)
+        expected = int(found[0]) if len(found) else None
+        assert demo.block_at_exact_time(time) == expected, time
+    assert demo_with_times([]).block_at_exact_time(1.0) is None